@@ -0,0 +1,174 @@
+"""
+Registro normalizado de asistencias por usuario (colección attendance_records)
+
+event_attendances guarda los nombres dentro de los arreglos attendees/non_attendees, así que
+saber a qué eventos respondió un jugador obliga a recorrer todos los documentos. Cada respuesta
+se guarda además como un documento (event_id, user_name, status, event_start):
+- Índice único (event_id, user_name): upsert de la respuesta y estado de varios eventos a la vez
+- Índice (user_name, event_start): "mis asistencias" en un rango de fechas es un rango del índice
+
+event_start es el inicio del evento en UTC (start_at del reflejo en calendar_events); se completa
+al responder y se actualiza al sincronizar o editar el evento.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateMany
+
+from mongodb_config import mongodb_config
+
+logger = logging.getLogger(__name__)
+
+ATTENDING = "asiste"
+NOT_ATTENDING = "no_asiste"
+
+
+class AttendanceRecordsService:
+    def __init__(self):
+        self.collection_name = "attendance_records"
+
+    async def _event_start(self, database, event_id: str) -> Optional[datetime]:
+        event = await database["calendar_events"].find_one({"google_event_id": event_id}, {"start_at": 1})
+        return event.get("start_at") if event else None
+
+    async def record(self, database, event_id: str, user_name: str, will_attend: bool):
+        """Guardar (o cambiar) la respuesta de un usuario a un evento"""
+        now = datetime.utcnow()
+        await database[self.collection_name].update_one(
+            {"event_id": event_id, "user_name": user_name},
+            {
+                "$set": {
+                    "status": ATTENDING if will_attend else NOT_ATTENDING,
+                    "event_start": await self._event_start(database, event_id),
+                    "updated_at": now
+                },
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        )
+
+    async def remove(self, database, event_id: str, user_name: str):
+        """Eliminar la respuesta de un usuario (cancelar asistencia)"""
+        await database[self.collection_name].delete_one({"event_id": event_id, "user_name": user_name})
+
+    async def remove_event(self, database, event_id: str):
+        """Eliminar todas las respuestas de un evento"""
+        await database[self.collection_name].delete_many({"event_id": event_id})
+
+    async def refresh_event_starts(self, database, starts: Dict[str, Optional[datetime]]):
+        """Actualizar event_start de las respuestas de eventos reprogramados (un solo bulk_write)"""
+        operations = [
+            UpdateMany({"event_id": event_id, "event_start": {"$ne": start_at}}, {"$set": {"event_start": start_at}})
+            for event_id, start_at in starts.items()
+        ]
+        if operations:
+            await database[self.collection_name].bulk_write(operations, ordered=False)
+
+    async def get_statuses(self, event_ids: List[str], user_names: List[str]) -> Dict[str, str]:
+        """
+        Estado de asistencia de un usuario en varios eventos, en una sola consulta
+
+        Returns:
+            event_id -> "asiste" o "no_asiste" (los eventos sin respuesta no aparecen)
+        """
+        names = [name for name in user_names if name]
+        if not event_ids or not names:
+            return {}
+        database = await mongodb_config.ensure_connected()
+        cursor = database[self.collection_name].find(
+            {"event_id": {"$in": event_ids}, "user_name": {"$in": names}},
+            {"_id": 0, "event_id": 1, "status": 1}
+        )
+        statuses = {}
+        async for record in cursor:
+            # Si respondió con nombre y nickname, "asiste" prevalece
+            if statuses.get(record["event_id"]) != ATTENDING:
+                statuses[record["event_id"]] = record["status"]
+        return statuses
+
+    async def get_user_attendances(
+        self,
+        user_names: List[str],
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        status: Optional[str] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Respuestas de un usuario ordenadas por fecha del evento
+
+        Args:
+            user_names: Nombres con que el usuario pudo responder (nickname y nombre)
+            date_from: Inicio del rango (inclusive) sobre la fecha del evento
+            date_to: Fin del rango (exclusivo)
+            status: "asiste" o "no_asiste" (opcional)
+            limit: Máximo de resultados
+        """
+        names = [name for name in user_names if name]
+        if not names:
+            return []
+        query: Dict[str, Any] = {"user_name": {"$in": names}}
+        if date_from or date_to:
+            query["event_start"] = {}
+            if date_from:
+                query["event_start"]["$gte"] = date_from
+            if date_to:
+                query["event_start"]["$lt"] = date_to
+        if status:
+            query["status"] = status
+
+        database = await mongodb_config.ensure_connected()
+        cursor = database[self.collection_name].find(
+            query, {"_id": 0, "event_id": 1, "user_name": 1, "status": 1, "event_start": 1, "updated_at": 1}
+        ).sort("event_start", 1).limit(limit)
+        records = await cursor.to_list(length=limit)
+
+        # Título de cada evento desde el reflejo de calendar_events (una sola consulta)
+        event_ids = [record["event_id"] for record in records]
+        summaries = {}
+        if event_ids:
+            async for event in database["calendar_events"].find(
+                {"google_event_id": {"$in": event_ids}}, {"_id": 0, "google_event_id": 1, "summary": 1}
+            ):
+                summaries[event["google_event_id"]] = event.get("summary")
+        for record in records:
+            record["summary"] = summaries.get(record["event_id"])
+        return records
+
+    async def rebuild(self, database) -> int:
+        """
+        Reconstruir attendance_records desde event_attendances (migración inicial)
+
+        Returns:
+            Número de respuestas en attendance_records al terminar
+        """
+        pipeline = [
+            {"$project": {
+                "_id": 0,
+                "event_id": 1,
+                "records": {"$concatArrays": [
+                    {"$map": {"input": {"$ifNull": ["$attendees", []]}, "as": "name",
+                              "in": {"user_name": "$$name", "status": ATTENDING}}},
+                    {"$map": {"input": {"$ifNull": ["$non_attendees", []]}, "as": "name",
+                              "in": {"user_name": "$$name", "status": NOT_ATTENDING}}}
+                ]},
+                "updated_at": 1
+            }},
+            {"$unwind": "$records"},
+            {"$lookup": {"from": "calendar_events", "localField": "event_id", "foreignField": "google_event_id", "as": "event"}},
+            {"$project": {
+                "event_id": 1,
+                "user_name": "$records.user_name",
+                "status": "$records.status",
+                "event_start": {"$first": "$event.start_at"},
+                "updated_at": 1,
+                "created_at": "$updated_at"
+            }},
+            {"$merge": {"into": self.collection_name, "on": ["event_id", "user_name"], "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ]
+        await database["event_attendances"].aggregate(pipeline).to_list(length=None)
+        return await database[self.collection_name].count_documents({})
+
+# Instancia global del servicio
+attendance_records_service = AttendanceRecordsService()
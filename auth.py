@@ -9,13 +9,14 @@ from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models import TokenData, UserModel
-import httpx
+from google_http_client import google_http_client
 
 # Configuración
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # 24 horas por defecto
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))  # 30 días por defecto
+AUTH_INACTIVE_RETENTION_DAYS = int(os.getenv("AUTH_INACTIVE_RETENTION_DAYS", "7"))  # Días que se conservan sesiones/tokens revocados
 
 # Contexto de contraseñas (para futuras funcionalidades)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -115,12 +116,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 async def get_google_user_info(access_token: str) -> dict:
     """Obtener información del usuario desde Google usando el access token"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://www.googleapis.com/oauth2/v2/userinfo?access_token={access_token}"
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await google_http_client.get(
+            "https://www.googleapis.com/oauth2/v2/userinfo",
+            params={"access_token": access_token}
+        )
+        response.raise_for_status()
+        return response.json()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
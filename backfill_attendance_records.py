@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Script para construir attendance_records desde event_attendances
+
+Las respuestas nuevas ya se guardan en attendance_records; este script completa las registradas
+antes de GET /me/asistencias. Es idempotente: hace $merge por (event_id, user_name).
+Conviene ejecutar antes POST /admin/eventos/sync para que event_start quede completo.
+"""
+import asyncio
+from mongodb_config import mongodb_config
+from mongodb_indexes import ensure_indexes
+from attendance_records import attendance_records_service
+
+async def backfill_attendance_records():
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+    
+    try:
+        # $merge necesita el índice único sobre (event_id, user_name)
+        print("🧱 Verificando índices...")
+        await ensure_indexes(database)
+        
+        total = await attendance_records_service.rebuild(database)
+        print(f"✅ Respuestas en attendance_records: {total}")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_attendance_records())
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Script para guardar period_num en pagos y deudas existentes
+
+Los pagos y deudas nuevos ya guardan el período como entero; este script completa los creados
+antes de los filtros from_period/to_period. Es idempotente: solo escribe los documentos cuyo
+period_num falta o no coincide con period. Los períodos con formato inválido se informan y
+quedan sin period_num.
+"""
+import asyncio
+import re
+from mongodb_config import mongodb_config
+from mongodb_indexes import ensure_indexes
+
+# Período YYYYMM válido (mismo criterio que period_utils.validate_period)
+VALID_PERIOD = re.compile(r"^(20\d\d|2100)(0[1-9]|1[0-2])$")
+
+async def backfill_period_num():
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+    
+    try:
+        print("🧱 Verificando índices...")
+        await ensure_indexes(database)
+        
+        for collection_name in ("payments", "debts"):
+            collection = database[collection_name]
+            # Un solo update_many con pipeline: el entero se calcula en el servidor
+            result = await collection.update_many(
+                {"period": VALID_PERIOD, "$expr": {"$ne": ["$period_num", {"$toInt": "$period"}]}},
+                [{"$set": {"period_num": {"$toInt": "$period"}}}]
+            )
+            invalid = await collection.count_documents({"period": {"$not": VALID_PERIOD}})
+            print(f"✅ {collection_name}: {result.modified_count} documentos actualizados")
+            if invalid:
+                print(f"⚠️  {collection_name}: {invalid} documentos con período inválido (sin period_num)")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_period_num())
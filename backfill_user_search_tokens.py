@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Script para calcular search_tokens en usuarios existentes
+
+Los usuarios nuevos o modificados ya guardan sus tokens de búsqueda; este script completa
+los creados antes de GET /admin/users/search. Es idempotente: solo escribe si los tokens cambiaron.
+"""
+import asyncio
+from pymongo import UpdateOne
+from mongodb_config import mongodb_config
+from mongodb_indexes import ensure_indexes
+from user_search import build_search_tokens
+
+BATCH_SIZE = 500
+
+async def backfill_user_search_tokens():
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+    collection = database["users"]
+    
+    try:
+        print("🧱 Verificando índices...")
+        await ensure_indexes(database)
+        
+        operations = []
+        updated = 0
+        cursor = collection.find({}, {"name": 1, "nickname": 1, "email": 1, "search_tokens": 1}).batch_size(BATCH_SIZE)
+        async for user_data in cursor:
+            tokens = build_search_tokens(user_data)
+            if user_data.get("search_tokens") != tokens:
+                operations.append(UpdateOne({"_id": user_data["_id"]}, {"$set": {"search_tokens": tokens}}))
+            if len(operations) >= BATCH_SIZE:
+                result = await collection.bulk_write(operations, ordered=False)
+                updated += result.modified_count
+                operations = []
+        
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+        
+        print(f"✅ Usuarios actualizados: {updated}")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_user_search_tokens())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark de "mis asistencias" con 10.000 eventos
+
+Compara la búsqueda anterior (recorrer event_attendances por nombre dentro de los arreglos)
+con attendance_records y su índice (user_name, event_start), filtrando por un rango de fechas.
+Requiere MONGODB_URL; usa MONGODB_BENCHMARK_DATABASE (por defecto synco_benchmark).
+"""
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from mongodb_config import mongodb_config
+from mongodb_indexes import ensure_indexes
+from attendance_records import attendance_records_service
+
+EVENTS = int(os.getenv("BENCHMARK_EVENTS", "10000"))
+PLAYERS = int(os.getenv("BENCHMARK_PLAYERS", "300"))
+ITERATIONS = int(os.getenv("BENCHMARK_ITERATIONS", "50"))
+PREFIX = "benchmark-event-"
+
+async def seed(database):
+    """Crear EVENTS eventos con ~15 respuestas cada uno, en event_attendances y calendar_events"""
+    start = datetime(2025, 1, 1)
+    players = [f"Jugador Benchmark {i}" for i in range(PLAYERS)]
+    events, attendances = [], []
+    for i in range(EVENTS):
+        event_id = f"{PREFIX}{i}"
+        names = random.sample(players, 15)
+        events.append({"google_event_id": event_id, "summary": f"Partido {i}", "calendar_id": "benchmark",
+                       "tipo_evento": "futbol", "start_at": start + timedelta(hours=6 * i)})
+        attendances.append({"event_id": event_id, "attendees": names[:10], "non_attendees": names[10:],
+                            "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()})
+    await database["calendar_events"].insert_many(events)
+    await database["event_attendances"].insert_many(attendances)
+    await attendance_records_service.rebuild(database)
+
+async def legacy_query(database, name: str, date_from: datetime, date_to: datetime):
+    """Búsqueda anterior: recorrer event_attendances y cruzar con las fechas de los eventos"""
+    responses = await database["event_attendances"].find(
+        {"$or": [{"attendees": name}, {"non_attendees": name}]}, {"event_id": 1}
+    ).to_list(length=None)
+    event_ids = [response["event_id"] for response in responses]
+    return await database["calendar_events"].find(
+        {"google_event_id": {"$in": event_ids}, "start_at": {"$gte": date_from, "$lt": date_to}}
+    ).to_list(length=None)
+
+async def measure(label: str, func):
+    samples = []
+    for i in range(ITERATIONS):
+        start = time.perf_counter()
+        await func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"📊 {label}: media={statistics.mean(samples):.1f}ms p50={statistics.median(samples):.1f}ms p95={p95:.1f}ms")
+
+async def cleanup(database):
+    """Eliminar los documentos creados por el benchmark"""
+    query = {"$regex": f"^{PREFIX}"}
+    await database["calendar_events"].delete_many({"google_event_id": query})
+    await database["event_attendances"].delete_many({"event_id": query})
+    await database["attendance_records"].delete_many({"event_id": query})
+
+async def main():
+    mongodb_config.database_name = os.getenv("MONGODB_BENCHMARK_DATABASE", "synco_benchmark")
+    database = await mongodb_config.ensure_connected()
+    date_from = datetime(2025, 3, 1)
+    date_to = datetime(2025, 6, 1)
+
+    def player(i: int) -> str:
+        return f"Jugador Benchmark {i % PLAYERS}"
+
+    try:
+        await ensure_indexes(database)
+        await cleanup(database)
+        print(f"🌱 Creando {EVENTS} eventos en {mongodb_config.database_name}...")
+        await seed(database)
+        print(f"🚀 Benchmark de mis asistencias ({ITERATIONS} iteraciones, rango {date_from:%Y-%m-%d} a {date_to:%Y-%m-%d})")
+        await measure("event_attendances (arreglos)", lambda i: legacy_query(database, player(i), date_from, date_to))
+        await measure("attendance_records (índice)", lambda i: attendance_records_service.get_user_attendances(
+            [player(i)], date_from=date_from, date_to=date_to, limit=500
+        ))
+    finally:
+        await cleanup(database)
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
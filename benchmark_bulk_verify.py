@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la verificación masiva de pagos con 1000 IDs
+
+Compara la secuencia anterior (find_one + update_one por pago) con la actual
+(una consulta de proyección + un update_many). Requiere MONGODB_URL; usa
+MONGODB_BENCHMARK_DATABASE (por defecto synco_benchmark).
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from bson import ObjectId
+from mongodb_config import mongodb_config
+from payment_service import PaymentService
+
+PAYMENTS = int(os.getenv("BENCHMARK_PAYMENTS", "1000"))
+BENCHMARK_NOTES = "benchmark-bulk-verify"
+
+async def seed(database) -> list:
+    """Crear PAYMENTS pagos pendientes"""
+    user_id = ObjectId()
+    now = datetime.utcnow()
+    result = await database["payments"].insert_many([{
+        "user_id": user_id,
+        "user_name": "Jugador Benchmark",
+        "amount": 15000.0,
+        "period": "209901",
+        "payment_date": now,
+        "status": "pending",
+        "notes": BENCHMARK_NOTES,
+        "created_at": now,
+        "updated_at": now
+    } for _ in range(PAYMENTS)])
+    return [str(payment_id) for payment_id in result.inserted_ids]
+
+async def legacy_bulk_verify(service: PaymentService, payment_ids: list, admin_id: str):
+    """Secuencia anterior: dos round trips por pago"""
+    verified = 0
+    for payment_id in payment_ids:
+        payment = await service.collection.find_one({"_id": ObjectId(payment_id)})
+        if not payment:
+            continue
+        result = await service.collection.update_one(
+            {"_id": ObjectId(payment_id)},
+            {"$set": {"status": "verified", "verified_by": ObjectId(admin_id), "verified_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count > 0:
+            await service._track_payment_change(payment, {**payment, "status": "verified"})
+            verified += 1
+    return verified
+
+async def cleanup(database):
+    """Eliminar los pagos y contadores creados por el benchmark"""
+    await database["payments"].delete_many({"notes": BENCHMARK_NOTES})
+    await database["counters"].delete_many({"_id": {"$regex": "209901"}})
+
+async def main():
+    mongodb_config.database_name = os.getenv("MONGODB_BENCHMARK_DATABASE", "synco_benchmark")
+    database = await mongodb_config.ensure_connected()
+    service = PaymentService(database)
+    admin_id = str(ObjectId())
+
+    try:
+        print(f"🚀 Benchmark de verificación masiva ({PAYMENTS} pagos) en {mongodb_config.database_name}")
+        for label, run in (
+            ("Secuencia anterior", lambda ids: legacy_bulk_verify(service, ids, admin_id)),
+            ("update_many", lambda ids: service.bulk_verify_payments(ids, admin_id, "verified")),
+        ):
+            await cleanup(database)
+            payment_ids = await seed(database)
+            start = time.perf_counter()
+            await run(payment_ids)
+            print(f"📊 {label}: {(time.perf_counter() - start) * 1000:.1f}ms")
+    finally:
+        await cleanup(database)
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia del login contra MongoDB
+
+Compara la secuencia anterior (find + insert/update por separado) con la actual
+(upsert del usuario + bulk_write de sesión/refresh token) sobre una base de datos
+de prueba. Requiere MONGODB_URL; usa MONGODB_BENCHMARK_DATABASE (por defecto synco_benchmark).
+"""
+import asyncio
+import os
+import secrets
+import statistics
+import time
+from datetime import datetime, timedelta
+from mongodb_config import mongodb_config
+from models import GoogleUserInfo
+from user_service import user_service
+from session_service import session_service
+from refresh_token_service import refresh_token_service
+
+ITERATIONS = int(os.getenv("BENCHMARK_ITERATIONS", "50"))
+
+async def legacy_login(database, google_user_info: GoogleUserInfo):
+    """Secuencia previa: find + insert del usuario, update_many + insert_one de sesión y de refresh token"""
+    users = database["users"]
+    user = await users.find_one({"google_id": google_user_info.id})
+    if not user:
+        user = {
+            "google_id": google_user_info.id,
+            "email": google_user_info.email,
+            "name": google_user_info.name,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+        result = await users.insert_one(user)
+        user["_id"] = result.inserted_id
+
+    sessions = database["sessions"]
+    await sessions.update_many(
+        {"user_id": str(user["_id"]), "is_active": True},
+        {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+    )
+    await sessions.insert_one({
+        "session_token": secrets.token_urlsafe(32),
+        "user_id": str(user["_id"]),
+        "user_email": user["email"],
+        "is_active": True,
+        "expires_at": datetime.utcnow() + timedelta(days=30),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    })
+
+    refresh_tokens = database["refresh_tokens"]
+    await refresh_tokens.update_many(
+        {"user_id": str(user["_id"]), "is_active": True},
+        {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+    )
+    await refresh_tokens.insert_one({
+        "user_id": str(user["_id"]),
+        "token": secrets.token_urlsafe(32),
+        "is_active": True,
+        "expires_at": datetime.utcnow() + timedelta(days=30),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    })
+
+async def current_login(google_user_info: GoogleUserInfo):
+    """Secuencia actual: upsert atómico del usuario + bulk_write de sesión y refresh token"""
+    user = await user_service.get_or_create_user(google_user_info)
+    await session_service.create_session(user)
+    await refresh_token_service.create_refresh_token(str(user.id), secrets.token_urlsafe(32))
+
+async def measure(label: str, func):
+    samples = []
+    for i in range(ITERATIONS):
+        start = time.perf_counter()
+        await func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"📊 {label}: media={statistics.mean(samples):.1f}ms p50={statistics.median(samples):.1f}ms p95={p95:.1f}ms")
+
+async def cleanup(database):
+    """Eliminar los documentos creados por el benchmark"""
+    user_ids = [str(user["_id"]) async for user in database["users"].find({"google_id": {"$regex": "^benchmark-"}}, {"_id": 1})]
+    await database["sessions"].delete_many({"user_email": {"$regex": "^benchmark"}})
+    await database["refresh_tokens"].delete_many({"user_id": {"$in": user_ids}})
+    await database["users"].delete_many({"google_id": {"$regex": "^benchmark-"}})
+
+async def main():
+    mongodb_config.database_name = os.getenv("MONGODB_BENCHMARK_DATABASE", "synco_benchmark")
+    database = await mongodb_config.ensure_connected()
+
+    def user_info(i: int) -> GoogleUserInfo:
+        return GoogleUserInfo(id=f"benchmark-{i % 10}", email=f"benchmark{i % 10}@example.com", name="Benchmark")
+
+    try:
+        print(f"🚀 Benchmark de login ({ITERATIONS} iteraciones) en {mongodb_config.database_name}")
+        await measure("Secuencia anterior", lambda i: legacy_login(database, user_info(i)))
+        await cleanup(database)
+        await measure("Secuencia actual", lambda i: current_login(user_info(i)))
+    finally:
+        await cleanup(database)
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
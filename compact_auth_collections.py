@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Script para compactar las colecciones de sesiones y refresh tokens
+
+Crea los índices TTL/parciales y elimina el historial de documentos expirados
+o revocados acumulado antes de que existieran los índices.
+"""
+import asyncio
+from mongodb_config import mongodb_config
+from mongodb_indexes import ensure_indexes
+from session_service import session_service
+from refresh_token_service import refresh_token_service
+
+async def compact_auth_collections():
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+    
+    try:
+        print("🧱 Creando índices TTL y parciales...")
+        await ensure_indexes(database)
+        
+        deleted_sessions = await session_service.cleanup_expired_sessions()
+        print(f"✅ Sesiones eliminadas: {deleted_sessions}")
+        
+        deleted_tokens = await refresh_token_service.cleanup_expired_tokens()
+        print(f"✅ Refresh tokens eliminados: {deleted_tokens}")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(compact_auth_collections())
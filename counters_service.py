@@ -0,0 +1,200 @@
+"""
+Servicio de contadores para los totales de los listados paginados
+
+Mantiene en la colección counters el número de documentos para cada filtro usado por los
+listados (pagos por usuario, período y estado). Los contadores se ajustan en cada inserción,
+eliminación o cambio de estado/período; un job periódico los reconcilia con los datos reales.
+Los totales sin filtro salen de estimated_document_count.
+
+Un contador se siembra la primera vez que se consulta su filtro: el documento se crea antes del
+count_documents (marcado seeding, con changes en 0) y los ajustes que llegan mientras tanto se
+acumulan en changes; al terminar, count = total + changes y se quita la marca.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from mongodb_config import mongodb_config
+
+logger = logging.getLogger(__name__)
+
+# Combinaciones de campos con contador, por colección
+TRACKED_FILTERS: Dict[str, List[Tuple[str, ...]]] = {
+    "payments": [
+        ("user_id",),
+        ("user_id", "period"),
+        ("period",),
+        ("status",),
+        ("period", "status"),
+    ],
+}
+
+
+def counter_key(collection_name: str, values: Dict[str, Any]) -> str:
+    """Clave del contador para un filtro de igualdad (ej: payments:period=202510,status=pending)"""
+    return f"{collection_name}:" + ",".join(f"{field}={values[field]}" for field in sorted(values))
+
+
+class CountersService:
+    def __init__(self):
+        self.collection_name = "counters"
+        self.reconcile_interval_seconds = int(os.getenv("COUNTERS_RECONCILE_MINUTES", "60")) * 60
+        self._reconciler: Optional[asyncio.Task] = None
+
+    def _tracked_query_key(self, collection_name: str, query: Dict[str, Any]) -> Optional[str]:
+        """Clave del contador si la consulta es un filtro de igualdad con contador"""
+        fields = tuple(sorted(query))
+        tracked = [tuple(sorted(combo)) for combo in TRACKED_FILTERS.get(collection_name, [])]
+        if fields not in tracked or any(isinstance(value, dict) for value in query.values()):
+            return None
+        return counter_key(collection_name, query)
+
+    def _document_keys(self, collection_name: str, document: Optional[Dict[str, Any]]) -> List[str]:
+        """Claves de todos los contadores en los que cuenta un documento"""
+        if not document:
+            return []
+        keys = []
+        for combo in TRACKED_FILTERS.get(collection_name, []):
+            if all(document.get(field) is not None for field in combo):
+                keys.append(counter_key(collection_name, {field: document[field] for field in combo}))
+        return keys
+
+    async def count(self, collection, query: Dict[str, Any]) -> Optional[int]:
+        """
+        Obtener el total de una consulta desde los contadores
+
+        Args:
+            collection: Colección consultada
+            query: Filtro de la consulta
+
+        Returns:
+            Total, o None si la consulta no tiene contador (se debe usar count_documents)
+        """
+        if not query:
+            return await collection.estimated_document_count()
+
+        key = self._tracked_query_key(collection.name, query)
+        if key is None:
+            return None
+
+        counters = collection.database[self.collection_name]
+        counter = await counters.find_one({"_id": key}, {"count": 1, "seeding": 1})
+        if counter is not None and not counter.get("seeding"):
+            return counter["count"]
+
+        # Primer uso del filtro: crear el contador antes de contar, así track_changes ya lo ajusta
+        created = await counters.update_one(
+            {"_id": key}, {"$setOnInsert": {"seeding": True, "changes": 0}}, upsert=True
+        )
+        total = await collection.count_documents(query)
+        if created.upserted_id is not None:
+            # Solo quien creó el contador lo completa, sumando los cambios llegados durante el conteo
+            await counters.update_one(
+                {"_id": key, "seeding": True},
+                [{"$set": {"count": {"$add": [total, "$changes"]}}}, {"$unset": ["seeding", "changes"]}]
+            )
+        return total
+
+    async def track_change(self, database, collection_name: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """
+        Ajustar los contadores tras insertar (before=None), eliminar (after=None) o modificar un documento
+
+        Solo se ajustan contadores existentes (sembrados o en siembra); los que no existen se
+        siembran al consultarse.
+        """
+        await self.track_changes(database, collection_name, [(before, after)])
+
+    async def track_changes(self, database, collection_name: str, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """
+        Ajustar los contadores tras muchos cambios a la vez (operaciones masivas)
+
+        Los deltas de todos los documentos se suman y se envían en un solo bulk_write.
+
+        Args:
+            changes: Lista de (before, after), con el mismo significado que en track_change
+        """
+        deltas: Dict[str, int] = {}
+        for before, after in changes:
+            for key in self._document_keys(collection_name, before):
+                deltas[key] = deltas.get(key, 0) - 1
+            for key in self._document_keys(collection_name, after):
+                deltas[key] = deltas.get(key, 0) + 1
+
+        # changes solo se usa mientras el contador está en siembra (ver count)
+        operations = [
+            UpdateOne({"_id": key}, {"$inc": {"count": delta, "changes": delta}})
+            for key, delta in deltas.items() if delta
+        ]
+        if not operations:
+            return
+        try:
+            await database[self.collection_name].bulk_write(operations, ordered=False)
+        except Exception as e:
+            # La reconciliación periódica corrige los contadores si falla el ajuste
+            logger.error(f"Error actualizando contadores de {collection_name}: {e}")
+
+    async def reconcile(self, database) -> int:
+        """
+        Recalcular todos los contadores desde los datos reales
+
+        Returns:
+            Número de contadores escritos
+        """
+        written = 0
+        for collection_name, combos in TRACKED_FILTERS.items():
+            counters = database[self.collection_name]
+            operations = []
+            seen = set()
+            for combo in combos:
+                pipeline = [
+                    {"$match": {field: {"$ne": None} for field in combo}},
+                    {"$group": {"_id": {field: f"${field}" for field in combo}, "count": {"$sum": 1}}}
+                ]
+                async for group in database[collection_name].aggregate(pipeline):
+                    key = counter_key(collection_name, group["_id"])
+                    seen.add(key)
+                    operations.append(UpdateOne(
+                        {"_id": key}, {"$set": {"count": group["count"]}, "$unset": {"seeding": ""}}, upsert=True
+                    ))
+
+            # Filtros que ya no tienen documentos quedan en cero
+            async for counter in counters.find({"_id": {"$regex": f"^{collection_name}:"}}, {"_id": 1}):
+                if counter["_id"] not in seen:
+                    operations.append(UpdateOne({"_id": counter["_id"]}, {"$set": {"count": 0}, "$unset": {"seeding": ""}}))
+
+            if operations:
+                await counters.bulk_write(operations, ordered=False)
+                written += len(operations)
+        return written
+
+    async def _run_reconciler(self):
+        """Reconciliar periódicamente los contadores"""
+        while True:
+            await asyncio.sleep(self.reconcile_interval_seconds)
+            try:
+                database = await mongodb_config.ensure_connected()
+                written = await self.reconcile(database)
+                logger.info(f"Contadores reconciliados: {written}")
+            except Exception as e:
+                logger.error(f"Error reconciliando contadores: {e}")
+
+    def start_reconciler(self):
+        """Iniciar la reconciliación periódica en segundo plano"""
+        if self._reconciler is None or self._reconciler.done():
+            self._reconciler = asyncio.ensure_future(self._run_reconciler())
+
+    async def stop_reconciler(self):
+        """Detener la reconciliación periódica"""
+        if self._reconciler is not None:
+            self._reconciler.cancel()
+            try:
+                await self._reconciler
+            except asyncio.CancelledError:
+                pass
+            self._reconciler = None
+
+# Instancia global del servicio
+counters_service = CountersService()
@@ -0,0 +1,56 @@
+"""
+Escrituras que devuelven el documento resultante sin volver a leerlo
+
+Las mutaciones hacían la escritura y luego un find_one para armar la respuesta (dos round
+trips). Con estas funciones:
+- Inserción: el documento insertado ya es el resultado, solo falta su _id
+- Actualización: find_one_and_update con ReturnDocument.AFTER devuelve el documento
+  actualizado (o None si no existe) en la misma operación
+"""
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+
+
+async def insert_and_return(collection, document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Insertar un documento y devolverlo con su _id
+
+    Args:
+        collection: Colección destino
+        document: Documento a insertar (se le agrega _id)
+    """
+    result = await collection.insert_one(document)
+    document["_id"] = result.inserted_id
+    return document
+
+
+async def update_and_return(
+    collection,
+    query: Dict[str, Any],
+    update: Dict[str, Any],
+    upsert: bool = False,
+    return_document: bool = ReturnDocument.AFTER
+) -> Optional[Dict[str, Any]]:
+    """
+    Actualizar un documento y devolver su versión actualizada
+
+    Args:
+        collection: Colección
+        query: Filtro del documento
+        update: Operadores de actualización (ej: {"$set": {...}})
+        upsert: Crear el documento si no existe
+        return_document: ReturnDocument.BEFORE para obtener los valores previos (ej: detectar
+            si un campo cambió); con upsert devuelve None cuando el documento se insertó
+
+    Returns:
+        Documento después (o antes) de la actualización, o None si no existe
+    """
+    return await collection.find_one_and_update(
+        query, update, upsert=upsert, return_document=return_document
+    )
+
+
+async def set_and_return(collection, query: Dict[str, Any], fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """$set de campos y devolver el documento actualizado (None si no existe)"""
+    return await update_and_return(collection, query, {"$set": fields})
@@ -1,12 +1,15 @@
 """
 Servicios para operaciones de base de datos MongoDB
 """
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
 from bson import ObjectId
 from dotenv import load_dotenv
 from models import ItemModel, ItemCreate, ItemUpdate, CalendarEventModel, CalendarModel, EventAttendanceModel, AttendanceRequest, AttendanceResponse
 from mongodb_config import mongodb_config
+from sparse_fields import ATTENDANCE_FIELDS, build_projection, serialize_documents
+from attendance_records import attendance_records_service
+from data_access import insert_and_return, set_and_return
 import logging
 import os
 import asyncio
@@ -69,8 +72,7 @@ class ItemService:
         item_dict["created_at"] = datetime.utcnow()
         item_dict["updated_at"] = datetime.utcnow()
         
-        result = await self.collection.insert_one(item_dict)
-        created_item = await self.collection.find_one({"_id": result.inserted_id})
+        created_item = await insert_and_return(self.collection, item_dict)
         return ItemModel(**created_item)
     
     async def get_item(self, item_id: str) -> Optional[ItemModel]:
@@ -97,15 +99,8 @@ class ItemService:
         update_data = {k: v for k, v in item.dict().items() if v is not None}
         update_data["updated_at"] = datetime.utcnow()
         
-        result = await self.collection.update_one(
-            {"_id": ObjectId(item_id)},
-            {"$set": update_data}
-        )
-        
-        if result.modified_count:
-            updated_item = await self.collection.find_one({"_id": ObjectId(item_id)})
-            return ItemModel(**updated_item)
-        return None
+        updated_item = await set_and_return(self.collection, {"_id": ObjectId(item_id)}, update_data)
+        return ItemModel(**updated_item) if updated_item else None
     
     async def delete_item(self, item_id: str) -> bool:
         """Eliminar un item"""
@@ -133,8 +128,7 @@ class CalendarEventService:
         event_dict["created_at"] = datetime.utcnow()
         event_dict["updated_at"] = datetime.utcnow()
         
-        result = await self.collection.insert_one(event_dict)
-        created_event = await self.collection.find_one({"_id": result.inserted_id})
+        created_event = await insert_and_return(self.collection, event_dict)
         return CalendarEventModel(**created_event)
     
     async def get_events_by_calendar(self, calendar_id: str, skip: int = 0, limit: int = 100) -> List[CalendarEventModel]:
@@ -161,15 +155,8 @@ class CalendarEventService:
         update_data = event_data.copy()
         update_data["updated_at"] = datetime.utcnow()
         
-        result = await self.collection.update_one(
-            {"_id": ObjectId(event_id)},
-            {"$set": update_data}
-        )
-        
-        if result.modified_count:
-            updated_event = await self.collection.find_one({"_id": ObjectId(event_id)})
-            return CalendarEventModel(**updated_event)
-        return None
+        updated_event = await set_and_return(self.collection, {"_id": ObjectId(event_id)}, update_data)
+        return CalendarEventModel(**updated_event) if updated_event else None
     
     async def delete_event(self, event_id: str) -> bool:
         """Eliminar un evento"""
@@ -197,8 +184,7 @@ class CalendarService:
         calendar_dict["created_at"] = datetime.utcnow()
         calendar_dict["updated_at"] = datetime.utcnow()
         
-        result = await self.collection.insert_one(calendar_dict)
-        created_calendar = await self.collection.find_one({"_id": result.inserted_id})
+        created_calendar = await insert_and_return(self.collection, calendar_dict)
         return CalendarModel(**created_calendar)
     
     async def get_calendars(self, skip: int = 0, limit: int = 100) -> List[CalendarModel]:
@@ -291,6 +277,12 @@ class EventAttendanceService:
                 attendees = attendance_data["attendees"]
                 non_attendees = attendance_data["non_attendees"]
             
+            # Registro normalizado por usuario (GET /me/asistencias)
+            try:
+                await attendance_records_service.record(database, event_id, user_name, will_attend)
+            except Exception as e:
+                logger.error(f"Error al guardar attendance_records de {event_id}: {e}")
+            
             action = "asistir" if will_attend else "NO asistir"
             return AttendanceResponse(
                 event_id=event_id,
@@ -320,12 +312,25 @@ class EventAttendanceService:
         finally:
             client.close()
     
-    async def get_all_attendances(self, skip: int = 0, limit: int = 100) -> List[EventAttendanceModel]:
-        """Obtener todas las asistencias con paginación"""
+    async def get_all_attendances(self, skip: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> List[Union[EventAttendanceModel, dict]]:
+        """
+        Obtener todas las asistencias con paginación
+        
+        Si se indican fields se proyectan en MongoDB y se retornan dicts serializables
+        en vez de EventAttendanceModel.
+        """
         client, database = await get_mongodb_connection()
         collection = database["event_attendances"]
         
         try:
+            if fields:
+                cursor = collection.find({}, build_projection(fields, ATTENDANCE_FIELDS)).skip(skip).limit(limit)
+                documents = await cursor.to_list(length=limit)
+                for attendance in documents:
+                    attendance.setdefault("attendees", [])
+                    attendance.setdefault("non_attendees", [])
+                return serialize_documents(documents, fields, ATTENDANCE_FIELDS)
+            
             cursor = collection.find().skip(skip).limit(limit)
             attendances = []
             async for attendance in cursor:
@@ -353,6 +358,10 @@ class EventAttendanceService:
                     "$set": {"updated_at": datetime.utcnow()}
                 }
             )
+            try:
+                await attendance_records_service.remove(database, event_id, user_name)
+            except Exception as e:
+                logger.error(f"Error al eliminar attendance_records de {event_id}: {e}")
             return result.modified_count > 0
         finally:
             client.close()
@@ -364,6 +373,10 @@ class EventAttendanceService:
         
         try:
             result = await collection.delete_one({"event_id": event_id})
+            try:
+                await attendance_records_service.remove_event(database, event_id)
+            except Exception as e:
+                logger.error(f"Error al eliminar attendance_records de {event_id}: {e}")
             return result.deleted_count > 0
         finally:
             client.close()
@@ -7,7 +7,11 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from bson import ObjectId
 from models import DebtModel, DebtCreateRequest, DebtUpdateRequest, DebtResponse, DebtListResponse, DebtorInfo, PlayerDebtResponse
-import re
+from pagination import fetch_page
+from ledger_service import ledger_service
+from period_utils import validate_period, period_to_int, period_range_query
+from exports import EXPORT_BATCH_SIZE
+from data_access import update_and_return, set_and_return
 
 class DebtService:
     def __init__(self, database: AsyncIOMotorDatabase):
@@ -29,32 +33,23 @@ class DebtService:
             raise ValueError("Formato de período inválido. Debe ser YYYYMM (ej: 202510)")
         
         # Preparar datos de la deuda
+        now = datetime.utcnow()
         debt_dict = {
             "period": debt_data.period,
+            "period_num": period_to_int(debt_data.period),
             "debtors": [debtor.dict() for debtor in debt_data.debtors],
-            "updated_at": datetime.utcnow()
+            "updated_at": now
         }
         
-        # Verificar si ya existe una deuda para este período
-        existing_debt = await self.collection.find_one({"period": debt_data.period})
-        
-        if existing_debt:
-            # Actualizar la deuda existente
-            await self.collection.update_one(
-                {"period": debt_data.period},
-                {"$set": debt_dict}
-            )
-            # Obtener la deuda actualizada
-            updated_debt = await self.collection.find_one({"period": debt_data.period})
-            return self._debt_to_response(updated_debt)
-        else:
-            # Crear nueva deuda
-            debt_dict["created_at"] = datetime.utcnow()
-            # Insertar en la base de datos
-            result = await self.collection.insert_one(debt_dict)
-            # Obtener la deuda creada
-            created_debt = await self.collection.find_one({"_id": result.inserted_id})
-            return self._debt_to_response(created_debt)
+        # Upsert por período: crea la deuda o reemplaza sus deudores, y devuelve el resultado
+        debt = await update_and_return(
+            self.collection,
+            {"period": debt_data.period},
+            {"$set": debt_dict, "$setOnInsert": {"created_at": now}},
+            upsert=True
+        )
+        await ledger_service.track_debt_change(self.database, debt_data.period)
+        return self._debt_to_response(debt)
     
     async def get_debt_by_period(self, period: str) -> Optional[DebtResponse]:
         """
@@ -90,54 +85,91 @@ class DebtService:
         if not self._validate_period_format(period):
             raise ValueError("Formato de período inválido. Debe ser YYYYMM (ej: 202510)")
         
-        debt = await self.collection.find_one({"period": period})
-        if not debt:
+        # Solo el deudor del usuario ($elemMatch en la proyección, índice sobre debtors.user_id)
+        debt = await self.collection.find_one(
+            {"period": period, "debtors.user_id": user_id},
+            {"_id": 0, "period": 1, "debtors": {"$elemMatch": {"user_id": user_id}}}
+        )
+        if not debt or not debt.get("debtors"):
             return None
         
-        # Buscar el usuario en la lista de deudores
-        debtor_info = None
-        for debtor in debt.get("debtors", []):
-            if debtor["user_id"] == user_id:
-                debtor_info = debtor
-                break
+        return self._player_debt_response(debt)
+    
+    async def get_player_debts(self, user_id: str, limit: int = 120) -> List[PlayerDebtResponse]:
+        """
+        Obtiene las deudas de un jugador en todos los períodos (una sola consulta)
         
-        if not debtor_info:
-            return None
+        Args:
+            user_id: ID del usuario
+            limit: Número máximo de períodos
         
-        return PlayerDebtResponse(
-            period=period,
-            amount=debtor_info["amount"],
-            user_name=debtor_info["user_name"],
-            user_nickname=debtor_info.get("user_nickname")
-        )
+        Returns:
+            Lista de PlayerDebtResponse, del período más reciente al más antiguo
+        """
+        cursor = self.collection.find(
+            {"debtors.user_id": user_id},
+            {"_id": 0, "period": 1, "debtors": {"$elemMatch": {"user_id": user_id}}}
+        ).sort("period", -1).limit(limit)
+        debts = await cursor.to_list(length=limit)
+        return [self._player_debt_response(debt) for debt in debts if debt.get("debtors")]
     
-    async def get_all_debts(self, skip: int = 0, limit: int = 100) -> DebtListResponse:
+    async def get_all_debts(self, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, include_total: Optional[bool] = None, from_period: Optional[str] = None, to_period: Optional[str] = None) -> DebtListResponse:
         """
         Obtiene todas las deudas (solo para administradores)
         
         Args:
             skip: Número de registros a saltar
             limit: Número máximo de registros a devolver
+            cursor: Cursor de la página anterior (reemplaza a skip)
+            include_total: Calcular el total exacto (por defecto solo sin cursor)
+            from_period: Primer período del rango, inclusive (opcional)
+            to_period: Último período del rango, inclusive (opcional)
         
         Returns:
             DebtListResponse con la lista de deudas
         """
-        # Contar total de deudas
-        total = await self.collection.count_documents({})
-        
-        # Obtener deudas ordenadas por período (más recientes primero)
-        cursor = self.collection.find({}).sort("period", -1).skip(skip).limit(limit)
-        debts = await cursor.to_list(length=limit)
+        # Deudas ordenadas por período (más recientes primero)
+        debts, total, next_cursor = await fetch_page(
+            self.collection, period_range_query(from_period, to_period), "period", limit,
+            skip=skip, cursor=cursor, include_total=include_total
+        )
         
         debt_responses = [self._debt_to_response(debt) for debt in debts]
         
         return DebtListResponse(
             debts=debt_responses,
             total=total,
-            skip=skip,
-            limit=limit
+            skip=0 if cursor else skip,
+            limit=limit,
+            next_cursor=next_cursor
         )
     
+    def export_debts(self, from_period: Optional[str] = None, to_period: Optional[str] = None):
+        """
+        Cursor para exportar deudas, una fila por deudor (mismos filtros que get_all_debts)
+        
+        Args:
+            from_period: Primer período del rango, inclusive (opcional)
+            to_period: Último período del rango, inclusive (opcional)
+        
+        Returns:
+            Cursor de agregación con period, user_id, user_name, user_nickname y amount
+        """
+        pipeline = [
+            {"$match": period_range_query(from_period, to_period)},
+            {"$sort": {"period": -1, "_id": -1}},
+            {"$unwind": "$debtors"},
+            {"$project": {
+                "_id": 0,
+                "period": 1,
+                "user_id": "$debtors.user_id",
+                "user_name": "$debtors.user_name",
+                "user_nickname": "$debtors.user_nickname",
+                "amount": "$debtors.amount"
+            }}
+        ]
+        return self.collection.aggregate(pipeline, batchSize=EXPORT_BATCH_SIZE)
+    
     async def update_debt(self, period: str, update_data: DebtUpdateRequest) -> Optional[DebtResponse]:
         """
         Actualiza una deuda existente
@@ -159,15 +191,11 @@ class DebtService:
             "updated_at": datetime.utcnow()
         }
         
-        # Actualizar la deuda
-        result = await self.collection.update_one(
-            {"period": period},
-            {"$set": update_dict}
-        )
+        # Actualizar la deuda y obtener el resultado en la misma operación
+        updated_debt = await set_and_return(self.collection, {"period": period}, update_dict)
         
-        if result.modified_count > 0:
-            # Obtener la deuda actualizada
-            updated_debt = await self.collection.find_one({"period": period})
+        if updated_debt:
+            await ledger_service.track_debt_change(self.database, period)
             return self._debt_to_response(updated_debt)
         
         return None
@@ -188,6 +216,8 @@ class DebtService:
         
         # Eliminar la deuda
         result = await self.collection.delete_one({"period": period})
+        if result.deleted_count > 0:
+            await ledger_service.track_debt_change(self.database, period)
         return result.deleted_count > 0
     
     def _validate_period_format(self, period: str) -> bool:
@@ -200,21 +230,25 @@ class DebtService:
         Returns:
             True si el formato es válido, False en caso contrario
         """
-        pattern = r'^\d{6}$'
-        if not re.match(pattern, period):
-            return False
-        
-        # Validar que sea un año y mes válidos
-        year = int(period[:4])
-        month = int(period[4:6])
-        
-        if year < 2000 or year > 2100:
-            return False
+        return validate_period(period)
+    
+    def _player_debt_response(self, debt: Dict[str, Any]) -> PlayerDebtResponse:
+        """
+        Convierte una deuda proyectada con el deudor del jugador a PlayerDebtResponse
         
-        if month < 1 or month > 12:
-            return False
+        Args:
+            debt: Documento con period y debtors (solo el elemento del jugador)
         
-        return True
+        Returns:
+            PlayerDebtResponse
+        """
+        debtor_info = debt["debtors"][0]
+        return PlayerDebtResponse(
+            period=debt["period"],
+            amount=debtor_info["amount"],
+            user_name=debtor_info["user_name"],
+            user_nickname=debtor_info.get("user_nickname")
+        )
     
     def _debt_to_response(self, debt: Dict[str, Any]) -> DebtResponse:
         """
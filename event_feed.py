@@ -0,0 +1,271 @@
+"""
+Feed de eventos personalizado por tipo de evento (GET /me/eventos)
+
+Los eventos de Google Calendar se reflejan en la colección calendar_events con dos campos
+adicionales: tipo_evento (clasificación normalizada) y start_at (inicio en UTC). Con un índice
+sobre (tipo_evento, start_at) el feed de un jugador es un rango del índice por cada tipo.
+
+El resultado se cachea por conjunto de tipos y no por usuario: todos los jugadores con los
+mismos tipo_eventos comparten la misma entrada. Cada entrada guarda la ventana máxima del feed
+(FEED_MAX_DAYS_AHEAD días, FEED_MAX_EVENTS eventos) y days_ahead/limit se aplican sobre ella,
+así que el número de entradas no crece con los parámetros de la consulta; además se acota con
+EVENT_FEED_CACHE_MAX_ENTRIES. El estado de asistencia de cada jugador se agrega aparte, con una
+sola consulta a attendance_records por request.
+
+Clasificación de un evento (en orden):
+1. tipo_evento explícito al crear/editar el evento
+2. Etiqueta "#tipo: xxx" en la descripción
+3. Palabras clave en el título (EVENT_TYPE_KEYWORDS, JSON: {"futbol": ["partido", "pichanga"]})
+4. "general": los eventos generales se muestran a todos
+"""
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from pymongo import UpdateOne
+
+from attendance_records import attendance_records_service
+from mongodb_config import mongodb_config
+from user_search import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_TYPE = "general"
+
+# Ventana máxima del feed (límites de days_ahead y limit en GET /me/eventos)
+FEED_MAX_DAYS_AHEAD = 365
+FEED_MAX_EVENTS = 500
+EVENT_TYPE_TAG = re.compile(r"#tipo\s*[:=]\s*([^\s,;#]+)", re.IGNORECASE)
+
+
+def normalize_event_type(event_type: Optional[str]) -> str:
+    """Tipo de evento normalizado (sin tildes, minúsculas, sin espacios extremos)"""
+    return normalize_search_text((event_type or "").strip())
+
+
+def _load_keywords() -> Dict[str, List[str]]:
+    raw = os.getenv("EVENT_TYPE_KEYWORDS")
+    if not raw:
+        return {}
+    try:
+        return {
+            normalize_event_type(event_type): [normalize_search_text(word) for word in words]
+            for event_type, words in json.loads(raw).items()
+        }
+    except (ValueError, AttributeError) as e:
+        logger.error(f"EVENT_TYPE_KEYWORDS inválido: {e}")
+        return {}
+
+
+def classify_event_type(summary: Optional[str], description: Optional[str] = None,
+                        keywords: Optional[Dict[str, List[str]]] = None) -> str:
+    """
+    Clasificar un evento por su descripción o título
+
+    Args:
+        summary: Título del evento
+        description: Descripción del evento
+        keywords: Mapa tipo -> palabras clave del título (por defecto EVENT_TYPE_KEYWORDS)
+    """
+    tag = EVENT_TYPE_TAG.search(description or "")
+    if tag:
+        return normalize_event_type(tag.group(1))
+    title = normalize_search_text(summary)
+    for event_type, words in (keywords if keywords is not None else _load_keywords()).items():
+        if any(word and word in title for word in words):
+            return event_type
+    return DEFAULT_EVENT_TYPE
+
+
+def parse_event_start(start: Dict[str, Any]) -> Optional[datetime]:
+    """
+    Inicio de un evento de Google Calendar en UTC (sin tzinfo, como el resto de las fechas)
+
+    Acepta {"dateTime": "...", "timeZone": "..."} o {"date": "YYYY-MM-DD"} (todo el día).
+    """
+    if not start:
+        return None
+    try:
+        if start.get("dateTime"):
+            value = datetime.fromisoformat(start["dateTime"].replace("Z", "+00:00"))
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=ZoneInfo(start["timeZone"]) if start.get("timeZone") else timezone.utc)
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        if start.get("date"):
+            return datetime.strptime(start["date"], "%Y-%m-%d")
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Inicio de evento inválido {start}: {e}")
+    return None
+
+
+def mirror_document(event: Dict[str, Any], calendar_id: str, tipo_evento: Optional[str] = None) -> Dict[str, Any]:
+    """Documento de calendar_events para un evento de Google Calendar (formato de get_events)"""
+    start = event.get("start") or {}
+    end = event.get("end") or {}
+    return {
+        "google_event_id": event["id"],
+        "summary": event.get("summary", "Sin título"),
+        "description": event.get("description", ""),
+        "start_date": start.get("date"),
+        "end_date": end.get("date"),
+        "start_datetime": start.get("dateTime"),
+        "end_datetime": end.get("dateTime"),
+        "location": event.get("location", ""),
+        "status": event.get("status", ""),
+        "html_link": event.get("htmlLink", ""),
+        "is_all_day": "date" in start and "dateTime" not in start,
+        "calendar_id": calendar_id,
+        "tipo_evento": normalize_event_type(tipo_evento) if tipo_evento else classify_event_type(event.get("summary"), event.get("description")),
+        "start_at": parse_event_start(start),
+        "google_created": event.get("created", ""),
+        "google_updated": event.get("updated", ""),
+    }
+
+
+def feed_event(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Evento del feed en el mismo formato que GET /eventos"""
+    return {
+        "id": document["google_event_id"],
+        "summary": document.get("summary", ""),
+        "description": document.get("description", ""),
+        "start": {"date": document["start_date"]} if document.get("start_date") else {"dateTime": document.get("start_datetime")},
+        "end": {"date": document["end_date"]} if document.get("end_date") else {"dateTime": document.get("end_datetime")},
+        "location": document.get("location", ""),
+        "status": document.get("status", ""),
+        "htmlLink": document.get("html_link", ""),
+        "created": document.get("google_created", ""),
+        "updated": document.get("google_updated", ""),
+        "tipo_evento": document.get("tipo_evento", DEFAULT_EVENT_TYPE),
+    }
+
+
+class EventFeedService:
+    def __init__(self):
+        self.collection_name = "calendar_events"
+        self.cache_seconds = float(os.getenv("EVENT_FEED_CACHE_SECONDS", "60"))
+        self.cache_max_entries = int(os.getenv("EVENT_FEED_CACHE_MAX_ENTRIES", "256"))
+        # tipos -> (expira_en monotonic, [(start_at, evento)] de la ventana máxima), en orden de uso
+        self._cache: "OrderedDict[Tuple[str, ...], Tuple[float, List[Tuple[datetime, Dict[str, Any]]]]]" = OrderedDict()
+
+    def invalidate(self):
+        """Vaciar la caché del feed (tras sincronizar o editar eventos)"""
+        self._cache.clear()
+
+    async def _get_collection(self):
+        database = await mongodb_config.ensure_connected()
+        return database[self.collection_name]
+
+    def _mirror_update(self, event: Dict[str, Any], calendar_id: str, tipo_evento: Optional[str] = None) -> UpdateOne:
+        """
+        Upsert del reflejo de un evento (pipeline de actualización)
+
+        Un tipo_evento asignado a mano queda marcado (tipo_evento_manual) y la clasificación
+        automática de las sincronizaciones posteriores no lo pisa.
+        """
+        document = mirror_document(event, calendar_id, tipo_evento)
+        classified = document.pop("tipo_evento")
+        now = datetime.utcnow()
+        if tipo_evento:
+            type_fields = {"tipo_evento": {"$literal": classified}, "tipo_evento_manual": True}
+        else:
+            type_fields = {"tipo_evento": {"$cond": [
+                {"$eq": ["$tipo_evento_manual", True]}, "$tipo_evento", {"$literal": classified}
+            ]}}
+        return UpdateOne(
+            {"google_event_id": document["google_event_id"]},
+            [{"$set": {
+                **{field: {"$literal": value} for field, value in document.items()},
+                **type_fields,
+                "created_at": {"$ifNull": ["$created_at", {"$literal": now}]},
+                "updated_at": {"$literal": now}
+            }}],
+            upsert=True
+        )
+
+    async def mirror_event(self, event: Dict[str, Any], calendar_id: str, tipo_evento: Optional[str] = None):
+        """Crear o actualizar el reflejo de un evento en calendar_events"""
+        collection = await self._get_collection()
+        await collection.bulk_write([self._mirror_update(event, calendar_id, tipo_evento)])
+        await attendance_records_service.refresh_event_starts(
+            collection.database, {event["id"]: parse_event_start(event.get("start") or {})}
+        )
+        self.invalidate()
+
+    async def remove_event(self, google_event_id: str):
+        """Eliminar el reflejo de un evento borrado en Google Calendar"""
+        collection = await self._get_collection()
+        await collection.delete_one({"google_event_id": google_event_id})
+        self.invalidate()
+
+    async def sync_events(self, events: List[Dict[str, Any]], calendar_id: str,
+                          time_min: datetime, time_max: datetime) -> Dict[str, int]:
+        """
+        Reflejar en calendar_events los eventos de un rango de Google Calendar
+
+        Los eventos reflejados dentro del rango que ya no vienen de Google se eliminan.
+
+        Returns:
+            {"upserted": n, "removed": n}
+        """
+        collection = await self._get_collection()
+        operations = [self._mirror_update(event, calendar_id) for event in events]
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            # Eventos reprogramados: mover también la fecha de las respuestas
+            await attendance_records_service.refresh_event_starts(
+                collection.database, {event["id"]: parse_event_start(event.get("start") or {}) for event in events}
+            )
+
+        removed = await collection.delete_many({
+            "calendar_id": calendar_id,
+            "start_at": {"$gte": time_min, "$lt": time_max},
+            "google_event_id": {"$nin": [event["id"] for event in events]}
+        })
+        self.invalidate()
+        return {"upserted": len(operations), "removed": removed.deleted_count}
+
+    async def get_events_for_types(self, tipo_eventos: List[str], days_ahead: int = 90, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Próximos eventos de los tipos indicados (más los generales), cacheados por conjunto de tipos
+        """
+        types = sorted({normalize_event_type(t) for t in tipo_eventos if t} | {DEFAULT_EVENT_TYPE})
+        key = tuple(types)
+        now = datetime.utcnow()
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            window = cached[1]
+        else:
+            collection = await self._get_collection()
+            cursor = collection.find(
+                {"tipo_evento": {"$in": types}, "start_at": {"$gte": now, "$lt": now + timedelta(days=FEED_MAX_DAYS_AHEAD)}},
+                {"_id": 0, "created_at": 0, "updated_at": 0}
+            ).sort("start_at", 1).limit(FEED_MAX_EVENTS)
+            window = [(document["start_at"], feed_event(document)) async for document in cursor]
+            self._store(key, window)
+
+        time_max = now + timedelta(days=days_ahead)
+        return [event for start_at, event in window if now <= start_at < time_max][:limit]
+
+    def _store(self, key: Tuple[str, ...], window: List[Tuple[datetime, Dict[str, Any]]]):
+        """Guardar una entrada descartando las vencidas y, si sobran, las usadas hace más tiempo"""
+        now = time.monotonic()
+        for expired in [cached_key for cached_key, (expires_at, _) in self._cache.items() if expires_at <= now]:
+            del self._cache[expired]
+        self._cache[key] = (now + self.cache_seconds, window)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    async def get_attendance_status(self, event_ids: List[str], user_names: List[str]) -> Dict[str, str]:
+        """Estado de asistencia de un usuario en varios eventos (ver attendance_records.py)"""
+        return await attendance_records_service.get_statuses(event_ids, user_names)
+
+# Instancia global del servicio
+event_feed_service = EventFeedService()
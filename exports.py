@@ -0,0 +1,97 @@
+"""
+Exportación en streaming (CSV o NDJSON) para pagos y deudas
+
+Los documentos se leen de un cursor de MongoDB con proyección y batch_size acotado y se
+escriben por bloques de EXPORT_BATCH_SIZE filas: la memoria usada no depende del número de
+filas exportadas.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+
+from bson import ObjectId
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# Formato -> media type de la respuesta
+EXPORT_FORMATS: Dict[str, str] = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Caracteres con los que Excel interpreta una celda como fórmula (inyección CSV)
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# Columnas de la exportación de deudas (una fila por deudor y período)
+DEBT_EXPORT_FIELDS: List[str] = ["period", "user_id", "user_name", "user_nickname", "amount"]
+
+
+def validate_export_format(export_format: str) -> str:
+    """
+    Validar el formato pedido (csv o ndjson)
+
+    Raises:
+        ValueError: Si el formato no existe
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación no válido: {export_format}. Disponibles: {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def export_filename(prefix: str, export_format: str) -> str:
+    """Nombre del archivo descargado (ej: pagos-20251018.csv)"""
+    return f"{prefix}-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+
+
+def _export_value(value: Any) -> Any:
+    """Convertir tipos BSON a valores de texto/JSON"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value: Any) -> Any:
+    """Celda CSV: los textos que Excel tomaría como fórmula se anteponen con '"""
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def stream_rows(documents: AsyncIterator[Dict[str, Any]], columns: Dict[str, str], export_format: str) -> AsyncIterator[str]:
+    """
+    Escribir documentos como CSV o NDJSON, un bloque de texto por cada EXPORT_BATCH_SIZE filas
+
+    Args:
+        documents: Cursor (iterable asíncrono) de documentos
+        columns: Columna de la exportación -> campo en el documento
+        export_format: "csv" o "ndjson"
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer:
+        # BOM para que Excel reconozca UTF-8 (tildes en nombres)
+        buffer.write("\ufeff")
+        writer.writerow(list(columns))
+
+    rows = 0
+    async for document in documents:
+        values = [_export_value(document.get(field)) for field in columns.values()]
+        if writer:
+            writer.writerow([_csv_cell(value) for value in values])
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + "\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
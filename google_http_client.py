@@ -0,0 +1,132 @@
+"""
+Cliente HTTP compartido para las llamadas salientes a Google (OAuth y userinfo)
+Mantiene conexiones keep-alive con HTTP/2 para evitar DNS + TLS en cada login
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que se consideran errores transitorios de Google
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Métodos que se pueden reintentar sin riesgo (el código de autorización de OAuth es de un solo uso)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class GoogleHTTPClient:
+    def __init__(self):
+        self.max_retries = int(os.getenv("GOOGLE_HTTP_MAX_RETRIES", "2"))
+        self.backoff_seconds = float(os.getenv("GOOGLE_HTTP_BACKOFF_SECONDS", "0.2"))
+        self.timeout = httpx.Timeout(
+            connect=float(os.getenv("GOOGLE_HTTP_CONNECT_TIMEOUT", "3")),
+            read=float(os.getenv("GOOGLE_HTTP_READ_TIMEOUT", "10")),
+            write=5.0,
+            pool=5.0
+        )
+        self.limits = httpx.Limits(
+            max_connections=20,
+            max_keepalive_connections=10,
+            keepalive_expiry=60.0
+        )
+        # HTTP/2 solo si el paquete h2 está instalado (httpx[http2])
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncBaseTransport] = None
+
+    def configure(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Inyectar un transporte alternativo (ej: httpx.MockTransport en pruebas)
+
+        Args:
+            transport: Transporte a usar en lugar del transporte de red por defecto
+        """
+        self._transport = transport
+        # Forzar la creación de un nuevo cliente con el transporte inyectado
+        self._client = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Crear el cliente con pool de conexiones y reintentos de conexión"""
+        transport = self._transport
+        if transport is None:
+            # retries reintenta solo fallos al establecer la conexión
+            transport = httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=self.limits,
+                retries=self.max_retries
+            )
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2
+        )
+
+    async def start(self):
+        """Abrir el cliente compartido (llamado desde el lifespan de la app)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            logger.info(f"Cliente HTTP de Google inicializado (http2={self.http2})")
+
+    async def close(self):
+        """Cerrar el cliente compartido y liberar las conexiones"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Cliente HTTP de Google cerrado")
+        self._client = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Obtener el cliente compartido, creándolo si el lifespan no se ejecutó (serverless)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Ejecutar una petición reintentando errores transitorios
+
+        Las peticiones no idempotentes (POST al endpoint de tokens) solo se reintentan
+        a nivel de conexión por el transporte, nunca después de enviadas.
+
+        Args:
+            method: Método HTTP
+            url: URL destino
+            **kwargs: Argumentos adicionales para httpx
+
+        Returns:
+            Respuesta HTTP
+        """
+        client = self.get_client()
+        retryable = method.upper() in IDEMPOTENT_METHODS
+        attempts = self.max_retries + 1 if retryable else 1
+
+        for attempt in range(attempts):
+            is_last = attempt == attempts - 1
+            try:
+                response = await client.request(method, url, **kwargs)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                if is_last:
+                    raise
+                logger.warning(f"Error transitorio llamando a Google ({e}); reintento {attempt + 1}")
+            else:
+                if response.status_code not in TRANSIENT_STATUS_CODES or is_last:
+                    return response
+                logger.warning(f"Google respondió {response.status_code}; reintento {attempt + 1}")
+
+            await asyncio.sleep(self.backoff_seconds * (2 ** attempt))
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """Petición GET con reintentos"""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """Petición POST (sin reintentos una vez enviada)"""
+        return await self.request("POST", url, **kwargs)
+
+# Instancia global del cliente
+google_http_client = GoogleHTTPClient()
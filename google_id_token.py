@@ -0,0 +1,200 @@
+"""
+Verificación local de ID tokens de Google con las claves públicas (JWKS) en caché
+Evita consultar el endpoint userinfo de Google en cada login
+"""
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from jose import JWTError, jwt
+
+from google_http_client import google_http_client
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# Duración por defecto del caché si Google no envía Cache-Control
+DEFAULT_MAX_AGE_SECONDS = 3600
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+def parse_max_age(cache_control: Optional[str], age: Optional[str] = None) -> int:
+    """
+    Obtener los segundos de vigencia desde los headers Cache-Control y Age
+
+    Args:
+        cache_control: Valor del header Cache-Control
+        age: Valor del header Age (segundos que la respuesta lleva en cachés intermedios)
+
+    Returns:
+        Segundos durante los cuales las claves se consideran vigentes
+    """
+    if not cache_control:
+        return DEFAULT_MAX_AGE_SECONDS
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE_PATTERN.search(cache_control)
+    if not match:
+        return DEFAULT_MAX_AGE_SECONDS
+    max_age = int(match.group(1))
+    if age and age.isdigit():
+        max_age -= int(age)
+    return max(max_age, 0)
+
+
+class GoogleJWKSCache:
+    def __init__(self, certs_url: str = GOOGLE_CERTS_URL, refresh_margin_seconds: int = 300,
+                 min_forced_refresh_seconds: int = 60):
+        self.certs_url = certs_url
+        # Se refresca en segundo plano cuando quedan menos de estos segundos de vigencia
+        self.refresh_margin_seconds = refresh_margin_seconds
+        # Un kid desconocido fuerza una descarga como máximo una vez por este intervalo
+        self.min_forced_refresh_seconds = min_forced_refresh_seconds
+        self.keys: Dict[str, dict] = {}
+        self.expires_at = 0.0
+        self.fetched_at = float("-inf")
+        self._inflight: Optional[asyncio.Task] = None
+        self._background: Optional[asyncio.Task] = None
+
+    async def _fetch(self):
+        """Descargar las claves públicas de Google y calcular su vigencia"""
+        response = await google_http_client.get(self.certs_url)
+        response.raise_for_status()
+        jwks = response.json()
+
+        self.keys = {key["kid"]: key for key in jwks.get("keys", []) if "kid" in key}
+        max_age = parse_max_age(response.headers.get("cache-control"), response.headers.get("age"))
+        self.fetched_at = time.monotonic()
+        self.expires_at = self.fetched_at + max_age
+        logger.info(f"JWKS de Google actualizado: {len(self.keys)} claves, vigencia {max_age}s")
+
+    async def refresh(self):
+        """Refrescar las claves compartiendo una única descarga entre llamadas concurrentes"""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._fetch())
+        try:
+            await asyncio.shield(self._inflight)
+        finally:
+            if self._inflight is not None and self._inflight.done():
+                self._inflight = None
+
+    def schedule_refresh(self):
+        """Refrescar las claves en segundo plano sin bloquear la petición actual"""
+        if self._inflight is not None and not self._inflight.done():
+            return
+        if self._background is not None and not self._background.done():
+            return
+
+        async def _background():
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"No se pudo refrescar el JWKS de Google: {e}")
+
+        self._background = asyncio.ensure_future(_background())
+
+    async def get_key(self, kid: Optional[str]) -> Optional[dict]:
+        """
+        Obtener la clave pública correspondiente a un kid
+
+        Args:
+            kid: Identificador de la clave indicado en el header del token
+
+        Returns:
+            JWK de la clave o None si Google no la publica
+        """
+        now = time.monotonic()
+        if not self.keys or now >= self.expires_at:
+            await self.refresh()
+        elif now >= self.expires_at - self.refresh_margin_seconds:
+            self.schedule_refresh()
+
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.fetched_at >= self.min_forced_refresh_seconds:
+            # Google pudo haber rotado las claves antes de que expirara el caché; con un límite
+            # de frecuencia para que tokens con kid inventados no provoquen una descarga cada uno
+            await self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+# Instancia global del caché de claves
+google_jwks_cache = GoogleJWKSCache()
+
+
+async def verify_google_id_token(
+    id_token: str,
+    audience: str,
+    nonce: Optional[str],
+    access_token: Optional[str] = None
+) -> dict:
+    """
+    Verificar localmente un ID token de Google (firma, aud, iss, exp y nonce)
+
+    Args:
+        id_token: ID token devuelto por Google
+        audience: Client ID de la aplicación
+        nonce: Nonce enviado en la URL de autorización (obligatorio: sin él se rechaza el token)
+        access_token: Access token emitido junto al ID token, para validar at_hash
+
+    Returns:
+        Claims del token verificado
+
+    Raises:
+        HTTPException: Si el token no es válido
+    """
+    try:
+        header = jwt.get_unverified_header(id_token)
+        key = await google_jwks_cache.get_key(header.get("kid"))
+        if key is None:
+            raise JWTError("Clave de firma desconocida")
+
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=["RS256"],
+            audience=audience,
+            issuer=GOOGLE_ISSUERS,
+            access_token=access_token,
+            options={"verify_at_hash": access_token is not None}
+        )
+    except JWTError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"ID token de Google inválido: {str(e)}"
+        )
+
+    # Sin nonce en ambos lados no hay protección contra replay (el state no va firmado)
+    if not nonce or not claims.get("nonce") or claims["nonce"] != nonce:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="ID token de Google inválido: nonce no coincide"
+        )
+
+    return claims
+
+
+def google_user_info_from_claims(claims: dict) -> Optional[dict]:
+    """
+    Convertir los claims del ID token al formato de GoogleUserInfo
+
+    Args:
+        claims: Claims verificados del ID token
+
+    Returns:
+        Dict compatible con GoogleUserInfo, o None si faltan datos del perfil
+    """
+    if not claims.get("sub") or not claims.get("email") or not claims.get("name"):
+        return None
+    return {
+        "id": claims["sub"],
+        "email": claims["email"],
+        "name": claims["name"],
+        "picture": claims.get("picture"),
+        "verified_email": bool(claims.get("email_verified", False))
+    }
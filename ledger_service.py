@@ -0,0 +1,192 @@
+"""
+Libro de cuentas por período y usuario (colección ledger)
+
+Cruza lo adeudado (debts.debtors) con lo pagado (pagos verificados) y lo pendiente de
+verificación, por período y usuario, en una sola agregación:
+- debts: $unwind de debtors -> monto adeudado
+- $unionWith payments: monto verificado o pendiente de cada pago
+- $group por (período, usuario) y $merge en ledger
+
+Las filas se recalculan por período (y opcionalmente por usuario) cuando cambian pagos o
+deudas; balance = adeudado - pagado (positivo: el jugador aún debe).
+
+Dos recálculos del mismo alcance pueden intercalarse (ej: una verificación masiva mientras el
+jugador sube un comprobante). Cada fila guarda refreshed_at, la hora en que empezó el recálculo
+que la escribió, y nunca se reemplaza con el resultado de un recálculo que empezó antes. Las
+filas que un recálculo ya no produce (sin deuda ni pagos) no se borran sino que se marcan
+deleted, también con su refreshed_at, y un índice TTL las elimina al día siguiente: así un
+recálculo más antiguo que termina después no puede recrearlas.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+
+def ledger_pipeline(periods: Optional[List[str]] = None, user_ids: Optional[List[str]] = None,
+                    refreshed_at: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Agregación (sobre debts) que calcula y materializa las filas del ledger
+
+    Args:
+        periods: Períodos a recalcular (todos si es None)
+        user_ids: Usuarios a recalcular (todos si es None)
+        refreshed_at: Inicio del recálculo; una fila con un refreshed_at posterior no se reemplaza
+    """
+    debt_match: Dict[str, Any] = {}
+    payment_match: Dict[str, Any] = {"status": {"$in": ["verified", "pending"]}}
+    if periods is not None:
+        debt_match["period"] = {"$in": periods}
+        payment_match["period"] = {"$in": periods}
+    debtor_match: Dict[str, Any] = {}
+    if user_ids is not None:
+        debtor_match["debtors.user_id"] = {"$in": user_ids}
+        payment_match["user_id"] = {"$in": [ObjectId(user_id) for user_id in user_ids]}
+
+    return [
+        {"$match": debt_match},
+        {"$unwind": "$debtors"},
+        {"$match": debtor_match},
+        {"$project": {
+            "_id": 0,
+            "period": 1,
+            "user_id": "$debtors.user_id",
+            "user_name": "$debtors.user_name",
+            "user_nickname": "$debtors.user_nickname",
+            "owed": "$debtors.amount",
+            "paid": {"$literal": 0},
+            "pending": {"$literal": 0}
+        }},
+        {"$unionWith": {"coll": "payments", "pipeline": [
+            {"$match": payment_match},
+            {"$project": {
+                "_id": 0,
+                "period": 1,
+                "user_id": {"$toString": "$user_id"},
+                "user_name": 1,
+                "user_nickname": 1,
+                "owed": {"$literal": 0},
+                "paid": {"$cond": [{"$eq": ["$status", "verified"]}, "$amount", 0]},
+                "pending": {"$cond": [{"$eq": ["$status", "pending"]}, "$amount", 0]}
+            }}
+        ]}},
+        {"$group": {
+            "_id": {"period": "$period", "user_id": "$user_id"},
+            "user_name": {"$max": "$user_name"},
+            "user_nickname": {"$max": "$user_nickname"},
+            "owed": {"$sum": "$owed"},
+            "paid": {"$sum": "$paid"},
+            "pending": {"$sum": "$pending"},
+            "payments": {"$sum": {"$cond": [{"$gt": [{"$add": ["$paid", "$pending"]}, 0]}, 1, 0]}}
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.period", ":", "$_id.user_id"]},
+            "period": "$_id.period",
+            "user_id": "$_id.user_id",
+            "user_name": 1,
+            "user_nickname": 1,
+            "owed": 1,
+            "paid": 1,
+            "pending": 1,
+            "balance": {"$subtract": ["$owed", "$paid"]},
+            "payments": 1,
+            "refreshed_at": {"$literal": refreshed_at or datetime.utcnow()}
+        }},
+        # Usuarios sin deuda ni pagos en el período: su fila se marca eliminada en refresh()
+        {"$match": {"$or": [{"owed": {"$gt": 0}}, {"payments": {"$gt": 0}}]}},
+        {"$merge": {
+            "into": "ledger",
+            "on": "_id",
+            # Conservar la fila escrita (o marcada eliminada) por un recálculo que empezó después
+            "whenMatched": [{"$replaceWith": {"$cond": [
+                {"$gte": ["$$new.refreshed_at", "$refreshed_at"]}, "$$new", "$$ROOT"
+            ]}}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+class LedgerService:
+    def __init__(self):
+        self.collection_name = "ledger"
+
+    async def refresh(self, database, period: Optional[str] = None, user_ids: Optional[List[str]] = None) -> int:
+        """
+        Recalcular las filas del ledger de un período (o de todos) y eliminar las que ya no aplican
+
+        Args:
+            period: Período YYYYMM (todos si es None)
+            user_ids: Limitar a estos usuarios (todos si es None)
+
+        Returns:
+            Número de filas eliminadas por quedar sin deuda ni pagos
+        """
+        refreshed_at = datetime.utcnow()
+        periods = [period] if period else None
+        await database["debts"].aggregate(ledger_pipeline(periods, user_ids, refreshed_at)).to_list(length=None)
+
+        # Filas del alcance que este recálculo no produjo (ni uno posterior reescribió)
+        stale: Dict[str, Any] = {"refreshed_at": {"$lt": refreshed_at}, "deleted": {"$ne": True}}
+        if period:
+            stale["period"] = period
+        if user_ids is not None:
+            stale["user_id"] = {"$in": user_ids}
+        result = await database[self.collection_name].update_many(
+            stale,
+            {"$set": {"deleted": True, "deleted_at": datetime.utcnow(), "refreshed_at": refreshed_at}}
+        )
+        return result.modified_count
+
+    async def track_payment_changes(self, database, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """
+        Recalcular las filas afectadas por cambios de pagos (una agregación por período)
+
+        Los errores se registran y no interrumpen la operación sobre los pagos.
+        """
+        affected: Dict[str, set] = {}
+        for before, after in changes:
+            for payment in (before, after):
+                if payment and payment.get("period") and payment.get("user_id"):
+                    affected.setdefault(payment["period"], set()).add(str(payment["user_id"]))
+        for period, user_ids in affected.items():
+            try:
+                await self.refresh(database, period, sorted(user_ids))
+            except Exception as e:
+                logger.error(f"Error actualizando ledger del período {period}: {e}")
+
+    async def track_debt_change(self, database, period: str):
+        """Recalcular el período completo tras crear, actualizar o eliminar su deuda"""
+        try:
+            await self.refresh(database, period)
+        except Exception as e:
+            logger.error(f"Error actualizando ledger del período {period}: {e}")
+
+    async def get_period(self, database, period: str) -> Dict[str, Any]:
+        """
+        Ledger de un período con totales; si el período nunca se calculó se calcula ahora
+
+        Returns:
+            {"period", "entries": [...], "totals": {"owed", "paid", "pending", "balance"}}
+        """
+        collection = database[self.collection_name]
+        query = {"period": period, "deleted": {"$ne": True}}
+        entries = await collection.find(query, {"_id": 0}).sort("user_name", 1).to_list(length=None)
+        if not entries:
+            await self.refresh(database, period)
+            entries = await collection.find(query, {"_id": 0}).sort("user_name", 1).to_list(length=None)
+
+        totals = {field: sum(entry[field] for entry in entries) for field in ("owed", "paid", "pending", "balance")}
+        return {"period": period, "entries": entries, "totals": totals}
+
+    async def get_user_ledger(self, database, user_id: str, limit: int = 24) -> List[Dict[str, Any]]:
+        """Filas del ledger de un usuario, de la más reciente a la más antigua"""
+        cursor = database[self.collection_name].find(
+            {"user_id": user_id, "deleted": {"$ne": True}}, {"_id": 0}
+        ).sort("period", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+# Instancia global del servicio
+ledger_service = LedgerService()
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, HTTPException, Query, Depends, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from typing import Dict, List, Optional
@@ -9,12 +9,11 @@ import uvicorn
 import os
 import json
 import base64
-import httpx
 from urllib.parse import urlencode
 from dotenv import load_dotenv
 from google_calendar_service import GoogleCalendarService
 from mongodb_config import mongodb_config
-from models import ItemModel, ItemCreate, ItemUpdate, AttendanceRequest, AttendanceResponse, EventAttendanceModel, UserModel, TokenResponse, GoogleUserInfo, TokenRefreshRequest, TokenRefreshResponse, TokenRevokeRequest, UserUpdateRequest, UserListResponse, UserRoleUpdateRequest, UserNicknameUpdateRequest, EventCreateRequest, EventUpdateRequest, EventDeleteResponse, PaymentCreateRequest, PaymentUpdateRequest, PaymentResponse, PaymentListResponse, PaymentVerificationRequest, S3UploadResponse, S3DownloadResponse, ConfirmUploadRequest, BulkDeletePaymentsRequest, BulkVerifyPaymentsRequest, DebtCreateRequest, DebtUpdateRequest, DebtResponse, DebtListResponse, PlayerDebtResponse
+from models import ItemModel, ItemCreate, ItemUpdate, AttendanceRequest, AttendanceResponse, EventAttendanceModel, UserModel, TokenResponse, GoogleUserInfo, TokenRefreshRequest, TokenRefreshResponse, TokenRevokeRequest, UserUpdateRequest, UserListResponse, UserRoleUpdateRequest, UserNicknameUpdateRequest, UserBulkUpdateRequest, UserBulkUpdateResponse, EventCreateRequest, EventUpdateRequest, EventDeleteResponse, PaymentCreateRequest, PaymentUpdateRequest, PaymentResponse, PaymentListResponse, PaymentVerificationRequest, S3UploadResponse, S3DownloadResponse, ConfirmUploadRequest, BulkDeletePaymentsRequest, BulkVerifyPaymentsRequest, DebtCreateRequest, DebtUpdateRequest, DebtResponse, DebtListResponse, PlayerDebtResponse, PlayerDebtListResponse, LedgerPeriodResponse, PlayerLedgerResponse
 from database_services import item_service, calendar_event_service, calendar_service, event_attendance_service
 from payment_service import PaymentService
 from debt_service import DebtService, get_debt_service
@@ -22,11 +21,24 @@ from s3_service import s3_service
 from motor.motor_asyncio import AsyncIOMotorClient
 from event_formatter import format_event_description_with_attendance, extract_original_description, is_all_day_event
 from auth import create_access_token, create_refresh_token, verify_token, verify_token_string, verify_refresh_token, get_google_user_info, TokenData, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user
-from user_service import user_service
+from user_service import user_service, BULK_USER_UPDATE_MAX_ITEMS
 from refresh_token_service import refresh_token_service
 from session_service import session_service
 from pkce_utils import generate_pkce_pair, generate_state, generate_nonce
 from permissions import require_admin_role, permission_checker
+from google_http_client import google_http_client
+from mongodb_indexes import ensure_indexes
+from rate_limiter import RateLimitMiddleware
+from counters_service import counters_service
+from payment_rollups import payment_rollups_service
+from ledger_service import ledger_service
+from user_directory import user_directory
+from propagation_service import propagation_service
+from event_feed import event_feed_service, mirror_document
+from attendance_records import attendance_records_service
+from sparse_fields import ATTENDANCE_FIELDS, PAYMENT_FIELDS, USER_FIELDS, parse_fields
+from exports import EXPORT_FORMATS, DEBT_EXPORT_FIELDS, validate_export_format, export_filename, stream_rows
+from google_id_token import google_jwks_cache, verify_google_id_token, google_user_info_from_claims
 
 # Cargar variables de entorno
 load_dotenv()
@@ -143,15 +155,54 @@ def ensure_google_files_from_env():
 
 ensure_google_files_from_env()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicializar y liberar recursos compartidos de la aplicación"""
+    # Cliente HTTP keep-alive para OAuth/userinfo de Google
+    await google_http_client.start()
+    # Precargar las claves públicas de Google para verificar ID tokens
+    google_jwks_cache.schedule_refresh()
+    # Escritura coalescida de la actividad de sesiones (expiración deslizante)
+    session_service.start_touch_flusher()
+    # Reconciliación periódica de los contadores de totales
+    counters_service.start_reconciler()
+    # Reconciliación periódica de los rollups de estadísticas de pagos
+    payment_rollups_service.start_reconciler()
+    # Directorio de usuarios en memoria, invalidado por change stream (o TTL si no hay replica set)
+    if mongodb_config.mongodb_url:
+        user_directory.start_watcher()
+    # Propagación en segundo plano de nombres de usuario a pagos y deudas
+    propagation_service.start_worker()
+    # Conexión compartida a MongoDB e índices (TTL de sesiones/tokens, etc.)
+    if mongodb_config.mongodb_url:
+        try:
+            database = await mongodb_config.ensure_connected()
+            await ensure_indexes(database)
+        except Exception as e:
+            print(f"Error inicializando MongoDB en el arranque: {e}")
+    yield
+    await session_service.stop_touch_flusher()
+    await counters_service.stop_reconciler()
+    await payment_rollups_service.stop_reconciler()
+    await user_directory.stop_watcher()
+    await propagation_service.stop_worker()
+    await google_http_client.close()
+    await mongodb_config.disconnect()
+
 # Crear instancia de FastAPI
 app = FastAPI(
     title="Synco API",
     description="API REST con FastAPI para Synco con MongoDB",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+# Limitar tasa de endpoints de autenticación y asistencia (se agrega antes que CORS
+# para que las respuestas 429 también lleven los headers CORS)
+app.add_middleware(RateLimitMiddleware)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -1089,17 +1140,24 @@ async def obtener_asistencia_evento(event_id: str):
 @app.get("/asistencias", response_model=List[EventAttendanceModel])
 async def obtener_todas_asistencias(
     skip: int = Query(default=0, ge=0), 
-    limit: int = Query(default=100, ge=1, le=1000)
+    limit: int = Query(default=100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma (ej: event_id,attendees)")
 ):
     """
     Obtener todas las asistencias registradas con paginación
     
     - **skip**: Número de registros a saltar
     - **limit**: Número máximo de registros a retornar
+    - **fields**: Campos a devolver (respuesta liviana sin validar el modelo completo)
     """
     try:
-        attendances = await event_attendance_service.get_all_attendances(skip=skip, limit=limit)
+        selected_fields = parse_fields(fields, ATTENDANCE_FIELDS)
+        attendances = await event_attendance_service.get_all_attendances(skip=skip, limit=limit, fields=selected_fields)
+        if selected_fields:
+            return JSONResponse(content=attendances)
         return attendances
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener asistencias: {str(e)}")
 
@@ -1209,6 +1267,149 @@ async def get_eventos_con_asistencia(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener eventos con asistencia: {str(e)}")
 
+@app.get("/me/eventos")
+async def get_mis_eventos(
+    days_ahead: int = Query(default=90, ge=1, le=365, description="Días hacia adelante para buscar eventos"),
+    limit: int = Query(default=100, ge=1, le=500, description="Número máximo de eventos"),
+    request: Request = None
+):
+    """
+    Próximos eventos de los tipos en que participa el usuario (tipo_eventos), más los generales
+    
+    Cada evento incluye mi_asistencia: "asiste", "no_asiste" o null si no ha respondido.
+    Los eventos se leen del reflejo en MongoDB (ver POST /admin/eventos/sync).
+    
+    - **days_ahead**: Días hacia adelante (1-365, por defecto 90)
+    - **limit**: Número máximo de eventos (1-500, por defecto 100)
+    """
+    try:
+        user = await get_current_user_from_request(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No hay sesión activa"
+            )
+        
+        # Eventos compartidos por todos los usuarios con los mismos tipos (cacheados)
+        events = await event_feed_service.get_events_for_types(user.tipo_eventos, days_ahead=days_ahead, limit=limit)
+        
+        # Asistencia propia: una sola consulta para todos los eventos
+        attendance = await event_feed_service.get_attendance_status(
+            [event["id"] for event in events],
+            [user.nickname, user.name]
+        )
+        
+        return {
+            "tipo_eventos": user.tipo_eventos,
+            "eventos": [{**event, "mi_asistencia": attendance.get(event["id"])} for event in events],
+            "total": len(events)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener eventos: {str(e)}")
+
+@app.get("/me/asistencias")
+async def get_mis_asistencias(
+    from_date: Optional[str] = Query(default=None, description="Fecha de inicio de los eventos (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(default=None, description="Fecha de fin de los eventos, inclusive (YYYY-MM-DD)"),
+    status_filter: Optional[str] = Query(default=None, alias="status", description="asiste o no_asiste"),
+    limit: int = Query(default=100, ge=1, le=500, description="Número máximo de resultados"),
+    request: Request = None
+):
+    """
+    Eventos a los que el usuario respondió (asiste / no asiste), ordenados por fecha del evento
+    
+    Se buscan las respuestas con el nickname y con el nombre del usuario.
+    
+    - **from_date** / **to_date**: Rango de fechas del evento (opcional)
+    - **status**: Filtrar por respuesta (opcional)
+    - **limit**: Número máximo de resultados (1-500, por defecto 100)
+    """
+    try:
+        user = await get_current_user_from_request(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No hay sesión activa"
+            )
+        
+        if status_filter is not None and status_filter not in ("asiste", "no_asiste"):
+            raise HTTPException(status_code=400, detail="status debe ser 'asiste' o 'no_asiste'")
+        
+        try:
+            date_from = datetime.strptime(from_date, "%Y-%m-%d") if from_date else None
+            date_to = datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1) if to_date else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+        
+        asistencias = await attendance_records_service.get_user_attendances(
+            [user.nickname, user.name],
+            date_from=date_from,
+            date_to=date_to,
+            status=status_filter,
+            limit=limit
+        )
+        return {
+            "asistencias": asistencias,
+            "total": len(asistencias)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener asistencias: {str(e)}")
+
+@app.post("/admin/eventos/sync")
+async def sync_eventos_admin(
+    calendar_id: str = Query(default="primary", description="ID del calendario"),
+    days_back: int = Query(default=30, ge=0, le=365, description="Días hacia atrás a sincronizar"),
+    days_ahead: int = Query(default=180, ge=1, le=365, description="Días hacia adelante a sincronizar"),
+    request: Request = None
+):
+    """
+    Reflejar en MongoDB los eventos de Google Calendar con su tipo de evento (solo administradores)
+    
+    Los eventos del rango que ya no existen en Google Calendar se eliminan del reflejo.
+    """
+    if not google_calendar_service:
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de Google Calendar no disponible. Verifica la configuración."
+        )
+    
+    try:
+        user = await get_current_user_from_request(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No hay sesión activa"
+            )
+        
+        await permission_checker.require_admin(str(user.id))
+        
+        time_min = datetime.utcnow() - timedelta(days=days_back)
+        time_max = datetime.utcnow() + timedelta(days=days_ahead)
+        eventos = google_calendar_service.get_events(
+            calendar_id=calendar_id,
+            max_results=2500,
+            time_min=time_min,
+            time_max=time_max
+        )
+        result = await event_feed_service.sync_events(eventos, calendar_id, time_min, time_max)
+        
+        return {
+            "message": "Eventos sincronizados",
+            "calendar_id": calendar_id,
+            **result
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al sincronizar eventos: {str(e)}")
+
 # Función para obtener usuario actual desde sesión o Authorization header
 async def get_current_user_from_request(request: Request) -> Optional[UserModel]:
     """Obtener usuario desde Authorization header o cookie de sesión"""
@@ -1257,6 +1458,9 @@ async def get_current_user_from_session(request: Request) -> Optional[UserModel]
 
 class GoogleAuthRequest(BaseModel):
     access_token: str
+    # Se acepta por compatibilidad pero no se usa: sin un nonce emitido por el servidor el ID token
+    # podría ser reutilizado, así que el access token se valida siempre con userinfo
+    id_token: Optional[str] = None
 
 @app.post("/auth/google", response_model=TokenResponse)
 async def google_auth(auth_request: GoogleAuthRequest):
@@ -1264,7 +1468,7 @@ async def google_auth(auth_request: GoogleAuthRequest):
     Autenticar usuario con Google OAuth
     """
     try:
-        # 1. Obtener información del usuario desde Google
+        # 1. Obtener información del usuario desde userinfo de Google
         google_user_info = await get_google_user_info(auth_request.access_token)
         
         # 2. Crear o obtener usuario en la base de datos
@@ -1292,6 +1496,8 @@ async def google_auth(auth_request: GoogleAuthRequest):
             user=user
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1444,18 +1650,19 @@ async def check_session(request: TokenRefreshRequest):
         )
 
 @app.get("/auth/session")
-async def get_session(request: Request):
+async def get_session(request: Request, response: Response):
     """
-    Verificar sesión activa desde cookie
+    Verificar sesión activa desde cookie (y extender su expiración)
     """
     print(f"=== DEBUG: Todas las cookies recibidas: {dict(request.cookies)} ===")
     
-    # Verificar conexión a MongoDB
-    try:
-        await mongodb_config.get_database().command("ping")
-    except Exception as e:
-        print(f"Reconectando a MongoDB en /auth/session: {e}")
-        await mongodb_config.connect()
+    # Verificar conexión a MongoDB (en modo sin estado la cookie se valida sin consultar la base de datos)
+    if not session_service.stateless:
+        try:
+            await mongodb_config.get_database().command("ping")
+        except Exception as e:
+            print(f"Reconectando a MongoDB en /auth/session: {e}")
+            await mongodb_config.connect()
     
     user = await get_current_user_from_session(request)
     if not user:
@@ -1464,6 +1671,12 @@ async def get_session(request: Request):
             detail="No hay sesión activa"
         )
     
+    # Expiración deslizante: volver a establecer la cookie con la nueva vigencia
+    session_service.set_session_cookie(
+        response,
+        session_service.renew_session_token(request.cookies.get("session_token"))
+    )
+    
     # Crear access token para el usuario
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -1625,6 +1838,7 @@ async def google_login(
         # Guardar PKCE parameters temporalmente
         pkce_data = {
             "code_verifier": code_verifier,
+            "nonce": nonce,
             "prompt": prompt
         }
         encoded_pkce = base64.urlsafe_b64encode(json.dumps(pkce_data).encode()).decode()
@@ -1689,6 +1903,9 @@ async def google_callback(
         try:
             pkce_data = json.loads(base64.urlsafe_b64decode(state.encode()).decode())
             code_verifier = pkce_data["code_verifier"]
+            expected_nonce = pkce_data["nonce"]
+            if not expected_nonce:
+                raise ValueError("nonce vacío")
         except Exception:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -1698,8 +1915,20 @@ async def google_callback(
         # Intercambiar código por tokens
         token_data = await exchange_code_for_tokens(code, code_verifier)
         
-        # Obtener información del usuario
-        user_info = await get_google_user_info(token_data["access_token"])
+        # Obtener información del usuario verificando el ID token localmente
+        user_info = None
+        if token_data.get("id_token"):
+            claims = await verify_google_id_token(
+                token_data["id_token"],
+                GOOGLE_CLIENT_ID,
+                nonce=expected_nonce,
+                access_token=token_data.get("access_token")
+            )
+            user_info = google_user_info_from_claims(claims)
+        
+        # Fallback a userinfo si el ID token no trae los datos del perfil
+        if user_info is None:
+            user_info = await get_google_user_info(token_data["access_token"])
         
         # Verificar conexión a MongoDB antes de crear usuario
         try:
@@ -1739,26 +1968,25 @@ async def exchange_code_for_tokens(code: str, code_verifier: str) -> dict:
     Intercambiar código de autorización por tokens usando PKCE
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://oauth2.googleapis.com/token",
-                data={
-                    "client_id": GOOGLE_CLIENT_ID,
-                    "client_secret": GOOGLE_CLIENT_SECRET,
-                    "code": code,
-                    "grant_type": "authorization_code",
-                    "redirect_uri": GOOGLE_REDIRECT_URI,
-                    "code_verifier": code_verifier
-                }
+        response = await google_http_client.post(
+            "https://oauth2.googleapis.com/token",
+            data={
+                "client_id": GOOGLE_CLIENT_ID,
+                "client_secret": GOOGLE_CLIENT_SECRET,
+                "code": code,
+                "grant_type": "authorization_code",
+                "redirect_uri": GOOGLE_REDIRECT_URI,
+                "code_verifier": code_verifier
+            }
+        )
+        
+        if not response.is_success:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error exchanging code for tokens: {response.text}"
             )
-            
-            if not response.is_success:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Error exchanging code for tokens: {response.text}"
-                )
-            
-            return response.json()
+        
+        return response.json()
             
     except Exception as e:
         raise HTTPException(
@@ -1802,13 +2030,19 @@ async def logout(request: Request, response: Response):
 async def get_all_users_admin(
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Incluir total exacto (por defecto solo sin cursor)"),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma (ej: _id,name,email)"),
     request: Request = None
 ):
     """
     Obtener lista de todos los usuarios (solo administradores)
     
-    - **skip**: Número de usuarios a saltar
+    - **skip**: Número de usuarios a saltar (modo compatible; se ignora si hay cursor)
     - **limit**: Número máximo de usuarios a retornar
+    - **cursor**: Cursor opaco devuelto en next_cursor
+    - **include_total**: Calcular el total exacto
+    - **fields**: Campos a devolver (respuesta liviana sin validar el modelo completo)
     """
     try:
         # Obtener usuario desde Authorization header o sesión
@@ -1823,23 +2057,145 @@ async def get_all_users_admin(
         # Verificar permisos de administrador
         await permission_checker.require_admin(str(user.id))
         
-        users, total = await user_service.get_all_users(skip=skip, limit=limit)
+        selected_fields = parse_fields(fields, USER_FIELDS)
+        users, total, next_cursor = await user_service.get_users_page(
+            skip=skip, limit=limit, cursor=cursor, include_total=include_total, fields=selected_fields
+        )
+        
+        if selected_fields:
+            return JSONResponse(content={
+                "users": users,
+                "total": total,
+                "skip": 0 if cursor else skip,
+                "limit": limit,
+                "next_cursor": next_cursor
+            })
         
         return UserListResponse(
             users=users,
             total=total,
-            skip=skip,
-            limit=limit
+            skip=0 if cursor else skip,
+            limit=limit,
+            next_cursor=next_cursor
         )
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al obtener usuarios: {str(e)}"
         )
 
+@app.get("/admin/users/search")
+async def search_users_admin(
+    q: str = Query(..., min_length=1, description="Texto a buscar en nombre, nickname o email"),
+    limit: int = Query(default=10, ge=1, le=50),
+    request: Request = None
+):
+    """
+    Buscar usuarios por prefijo de nombre, nickname o email (solo administradores)
+    
+    Ignora tildes y mayúsculas; los resultados se ordenan por relevancia.
+    
+    - **q**: Texto de búsqueda (ej: "jos" encuentra "José")
+    - **limit**: Número máximo de resultados
+    """
+    try:
+        # Obtener usuario desde Authorization header o sesión
+        user = await get_current_user_from_request(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No hay sesión activa"
+            )
+        
+        # Verificar permisos de administrador
+        await permission_checker.require_admin(str(user.id))
+        
+        users = await user_service.search_users(q, limit=limit)
+        return {
+            "query": q,
+            "users": users,
+            "total": len(users)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al buscar usuarios: {str(e)}"
+        )
+
+@app.post("/admin/users/bulk", response_model=UserBulkUpdateResponse)
+async def bulk_update_users_admin(
+    bulk_request: UserBulkUpdateRequest,
+    request: Request = None
+):
+    """
+    Actualizar muchos usuarios en una sola operación (solo administradores)
+    
+    - **updates**: Lista de cambios por usuario (user_id + nickname, roles, tipo_eventos, is_active)
+    - **ordered**: true detiene el lote en el primer error de escritura; false aplica todo lo posible
+    """
+    try:
+        # Obtener usuario desde Authorization header o sesión
+        user = await get_current_user_from_request(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No hay sesión activa"
+            )
+        
+        # Verificar permisos de administrador
+        await permission_checker.require_admin(str(user.id))
+        
+        if not bulk_request.updates:
+            raise HTTPException(status_code=400, detail="No se enviaron cambios")
+        if len(bulk_request.updates) > BULK_USER_UPDATE_MAX_ITEMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Máximo {BULK_USER_UPDATE_MAX_ITEMS} usuarios por solicitud"
+            )
+        
+        # Validar todos los roles de una vez
+        requested_roles = {role for item in bulk_request.updates for role in (item.roles or [])}
+        if not permission_checker.validate_roles(list(requested_roles)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uno o más roles no son válidos"
+            )
+        
+        updates = []
+        for item in bulk_request.updates:
+            update_data = item.model_dump(exclude={"user_id"}, exclude_none=True)
+            if not update_data:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"El usuario {item.user_id} no tiene campos para actualizar"
+                )
+            updates.append((item.user_id, update_data))
+        
+        results = await user_service.bulk_update_users(updates, ordered=bulk_request.ordered)
+        updated = sum(1 for result in results if result["status"] == "updated")
+        return {
+            "total_requested": len(results),
+            "updated": updated,
+            "failed": len(results) - updated,
+            "results": results
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error en actualización masiva de usuarios: {str(e)}"
+        )
+
 @app.get("/admin/users/{user_id}", response_model=UserModel)
 async def get_user_admin(
     user_id: str,
@@ -2039,6 +2395,42 @@ async def update_user_nickname_admin(
             detail=f"Error al actualizar nickname: {str(e)}"
         )
 
+@app.get("/admin/sessions/activity")
+async def get_sessions_activity(
+    limit: int = Query(default=100, ge=1, le=1000),
+    request: Request = None
+):
+    """
+    Obtener sesiones activas ordenadas por último acceso (solo administradores)
+    
+    - **limit**: Número máximo de sesiones a retornar
+    """
+    try:
+        # Obtener usuario desde Authorization header o sesión
+        user = await get_current_user_from_request(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No hay sesión activa"
+            )
+        
+        # Verificar permisos de administrador
+        await permission_checker.require_admin(str(user.id))
+        
+        sessions = await session_service.get_recent_activity(limit=limit)
+        return {
+            "sessions": sessions,
+            "total": len(sessions)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al obtener actividad de sesiones: {str(e)}"
+        )
+
 @app.get("/admin/roles")
 async def get_available_roles(request: Request = None):
     """
@@ -2179,9 +2571,15 @@ async def create_evento(
             'is_all_day': False,  # Por defecto no es evento de todo el día
             'calendar_id': event_request.calendar_id
         }
+        # Tipo de evento e inicio en UTC para el feed personalizado (/me/eventos)
+        mirror_data = mirror_document(created_event, event_request.calendar_id, event_request.tipo_evento)
+        mongo_event_data['tipo_evento'] = mirror_data['tipo_evento']
+        mongo_event_data['tipo_evento_manual'] = bool(event_request.tipo_evento)
+        mongo_event_data['start_at'] = mirror_data['start_at']
         
         # Guardar en MongoDB
         mongo_event = await calendar_event_service.create_event(mongo_event_data)
+        event_feed_service.invalidate()
         
         return EventResponse(
             id=created_event['id'],
@@ -2260,6 +2658,12 @@ async def update_evento(
         # Actualizar evento en Google Calendar
         updated_event = google_calendar_service.update_event(calendar_id, event_id, update_data)
         
+        # Actualizar el reflejo en MongoDB (tipo de evento e inicio para /me/eventos)
+        try:
+            await event_feed_service.mirror_event(updated_event, calendar_id, event_request.tipo_evento)
+        except Exception as mirror_error:
+            print(f"⚠️ Error al actualizar el evento en MongoDB: {mirror_error}")
+        
         return EventResponse(
             id=updated_event['id'],
             summary=updated_event['summary'],
@@ -2316,6 +2720,11 @@ async def delete_evento(
         # Eliminar evento de Google Calendar
         google_calendar_service.delete_event(calendar_id, event_id)
         
+        try:
+            await event_feed_service.remove_event(event_id)
+        except Exception as mirror_error:
+            print(f"⚠️ Error al eliminar el evento de MongoDB: {mirror_error}")
+        
         return EventDeleteResponse(
             message=f"Evento '{current_event.get('summary', 'Sin título')}' eliminado exitosamente",
             event_id=event_id,
@@ -2564,10 +2973,15 @@ async def get_user_payments(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     period: Optional[str] = Query(None, description="Filtrar por período (YYYYMM)"),
+    from_period: Optional[str] = Query(None, description="Primer período del rango, inclusive (YYYYMM)"),
+    to_period: Optional[str] = Query(None, description="Último período del rango, inclusive (YYYYMM)"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Incluir total exacto (por defecto solo sin cursor)"),
     current_user: UserModel = Depends(get_current_user)
 ):
     """
     Obtener todos los pagos del usuario autenticado, opcionalmente filtrados por período
+    o por un rango de períodos (from_period/to_period)
     """
     client = None
     try:
@@ -2576,11 +2990,11 @@ async def get_user_payments(
         
         # Si se proporciona un período, filtrar por período
         if period:
-            payments = await service.get_user_payments_by_period(current_user.id, period, skip, limit)
+            payments = await service.get_user_payments_by_period(current_user.id, period, skip, limit, cursor, include_total)
             return payments
         else:
-            # Sin filtro de período, obtener todos los pagos del usuario
-            payments = await service.get_user_payments(current_user.id, skip, limit)
+            # Sin período exacto, todos los pagos del usuario (opcionalmente en un rango de períodos)
+            payments = await service.get_user_payments(current_user.id, skip, limit, cursor, include_total, from_period, to_period)
             return payments
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -2595,6 +3009,8 @@ async def get_payments_by_period(
     period: str,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Incluir total exacto (por defecto solo sin cursor)"),
     current_user: UserModel = Depends(get_current_user)
 ):
     """
@@ -2604,7 +3020,7 @@ async def get_payments_by_period(
     try:
         client, database = await get_mongodb_connection()
         service = await get_payment_service(database)
-        payments = await service.get_payments_by_period(period, skip, limit)
+        payments = await service.get_payments_by_period(period, skip, limit, cursor, include_total)
         return payments
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -2620,23 +3036,68 @@ async def get_all_payments(
     limit: int = Query(100, ge=1, le=1000),
     status: Optional[str] = Query(None),
     period: Optional[str] = Query(None),
+    from_period: Optional[str] = Query(None, description="Primer período del rango, inclusive (YYYYMM)"),
+    to_period: Optional[str] = Query(None, description="Último período del rango, inclusive (YYYYMM)"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Incluir total exacto (por defecto solo sin cursor)"),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma (ej: id,user_name,amount)"),
     current_user: UserModel = Depends(require_admin_role)
 ):
     """
     Obtener todos los pagos (solo administradores)
+    
+    Con **fields** se devuelven solo esos campos (respuesta liviana sin validar el modelo completo)
     """
     client = None
     try:
+        selected_fields = parse_fields(fields, PAYMENT_FIELDS)
         client, database = await get_mongodb_connection()
         service = await get_payment_service(database)
-        payments = await service.get_all_payments(skip, limit, status, period)
+        payments = await service.get_all_payments(skip, limit, status, period, cursor, include_total, selected_fields, from_period, to_period)
+        if selected_fields:
+            return JSONResponse(content=payments)
         return payments
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo todos los pagos: {str(e)}")
     finally:
         if client:
             client.close()
 
+@app.get("/admin/payments/export")
+async def export_payments(
+    format: str = Query("csv", description="Formato de exportación: csv o ndjson"),
+    status: Optional[str] = Query(None),
+    period: Optional[str] = Query(None),
+    from_period: Optional[str] = Query(None, description="Primer período del rango, inclusive (YYYYMM)"),
+    to_period: Optional[str] = Query(None, description="Último período del rango, inclusive (YYYYMM)"),
+    fields: Optional[str] = Query(None, description="Columnas a exportar separadas por coma (por defecto todas)"),
+    current_user: UserModel = Depends(require_admin_role)
+):
+    """
+    Exportar pagos en CSV o NDJSON (solo administradores)
+    
+    Mismos filtros que GET /admin/payments; las filas se envían en streaming desde un cursor,
+    sin cargar todos los pagos en memoria.
+    """
+    try:
+        export_format = validate_export_format(format)
+        selected_fields = parse_fields(fields, PAYMENT_FIELDS)
+        # Conexión compartida: un cliente por request se cerraría antes de terminar el stream
+        database = await mongodb_config.ensure_connected()
+        service = await get_payment_service(database)
+        cursor, columns = service.export_payments(status, period, from_period, to_period, selected_fields)
+        return StreamingResponse(
+            stream_rows(cursor, columns, export_format),
+            media_type=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{export_filename("pagos", export_format)}"'}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exportando pagos: {str(e)}")
+
 @app.put("/payments/{payment_id}", response_model=PaymentResponse)
 async def update_payment(
     payment_id: str,
@@ -2706,8 +3167,6 @@ async def bulk_verify_payments(
     """
     client = None
     try:
-        from bson import ObjectId
-        from datetime import datetime
         client, database = await get_mongodb_connection()
         service = await get_payment_service(database)
         
@@ -2715,42 +3174,16 @@ async def bulk_verify_payments(
         if request_data.status not in ["verified", "rejected"]:
             raise HTTPException(status_code=400, detail="Status inválido. Debe ser 'verified' o 'rejected'")
         
-        verified_count = 0
-        not_found_count = 0
-        errors = []
-        
-        for payment_id in request_data.payment_ids:
-            try:
-                # Obtener el pago
-                payment = await service.collection.find_one({"_id": ObjectId(payment_id)})
-                if not payment:
-                    not_found_count += 1
-                    continue
-                
-                # Preparar datos de actualización
-                update_data = {
-                    "status": request_data.status,
-                    "verified_by": ObjectId(current_user.id),
-                    "verified_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-                
-                if request_data.notes:
-                    update_data["notes"] = request_data.notes
-                
-                # Actualizar el pago
-                result = await service.collection.update_one(
-                    {"_id": ObjectId(payment_id)},
-                    {"$set": update_data}
-                )
-                
-                if result.modified_count > 0:
-                    verified_count += 1
-                else:
-                    not_found_count += 1
-            except Exception as e:
-                errors.append(f"Error verificando pago {payment_id}: {str(e)}")
-                not_found_count += 1
+        # Una consulta de proyección + un update_many para todos los pagos
+        result = await service.bulk_verify_payments(
+            request_data.payment_ids,
+            str(current_user.id),
+            request_data.status,
+            request_data.notes
+        )
+        verified_count = result["verified"]
+        not_found_count = result["not_found"]
+        errors = result["errors"]
         
         return {
             "message": "Verificación masiva completada",
@@ -2801,45 +3234,17 @@ async def bulk_delete_payments(
     """
     client = None
     try:
-        from bson import ObjectId
         client, database = await get_mongodb_connection()
         service = await get_payment_service(database)
         
-        deleted_count = 0
-        not_found_count = 0
-        errors = []
-        
-        for payment_id in request_data.payment_ids:
-            try:
-                # Obtener el pago
-                payment = await service.collection.find_one({"_id": ObjectId(payment_id)})
-                if not payment:
-                    not_found_count += 1
-                    continue
-                
-                # Eliminar archivo de S3 si existe
-                if payment.get("receipt_image_key"):
-                    try:
-                        s3_service.delete_file(payment["receipt_image_key"])
-                    except Exception as e:
-                        errors.append(f"Error eliminando archivo de S3 para pago {payment_id}: {str(e)}")
-                
-                # Eliminar el pago de la base de datos
-                result = await service.collection.delete_one({"_id": ObjectId(payment_id)})
-                if result.deleted_count > 0:
-                    deleted_count += 1
-                else:
-                    not_found_count += 1
-            except Exception as e:
-                errors.append(f"Error eliminando pago {payment_id}: {str(e)}")
-                not_found_count += 1
+        result = await service.bulk_delete_payments(request_data.payment_ids)
         
         return {
             "message": "Eliminación masiva completada",
             "total_requested": len(request_data.payment_ids),
-            "deleted": deleted_count,
-            "not_found": not_found_count,
-            "errors": errors if errors else None
+            "deleted": result["deleted"],
+            "not_found": result["not_found"],
+            "errors": result["errors"] if result["errors"] else None
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en eliminación masiva: {str(e)}")
@@ -2877,6 +3282,7 @@ async def delete_payment_admin(
         # Eliminar el pago de la base de datos (sin restricción de user_id)
         result = await service.collection.delete_one({"_id": ObjectId(payment_id)})
         if result.deleted_count > 0:
+            await service._track_payment_change(payment, None)
             return {"message": "Pago eliminado correctamente"}
         else:
             raise HTTPException(status_code=500, detail="Error eliminando pago")
@@ -3070,17 +3476,24 @@ async def get_download_url_admin(
 async def get_payment_statistics(
     user_id: Optional[str] = Query(None),
     period: Optional[str] = Query(None),
+    breakdown: bool = Query(False, description="Incluir sumas por usuario y por período"),
+    from_period: Optional[str] = Query(None, description="Primer período del rango, inclusive (YYYYMM)"),
+    to_period: Optional[str] = Query(None, description="Último período del rango, inclusive (YYYYMM)"),
     current_user: UserModel = Depends(require_admin_role)
 ):
     """
     Obtener estadísticas de pagos (solo administradores)
+    
+    Sin desglose ni rango de períodos se leen del rollup precalculado del usuario/período.
     """
     client = None
     try:
         client, database = await get_mongodb_connection()
         service = await get_payment_service(database)
-        stats = await service.get_payment_statistics(user_id, period)
+        stats = await service.get_payment_statistics(user_id, period, breakdown, from_period, to_period)
         return stats
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
     finally:
@@ -3115,23 +3528,55 @@ async def create_debt(
 async def get_all_debts(
     skip: int = Query(0, ge=0, description="Número de registros a saltar"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros a devolver"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    include_total: Optional[bool] = Query(None, description="Incluir total exacto (por defecto solo sin cursor)"),
+    from_period: Optional[str] = Query(None, description="Primer período del rango, inclusive (YYYYMM)"),
+    to_period: Optional[str] = Query(None, description="Último período del rango, inclusive (YYYYMM)"),
     current_user: UserModel = Depends(require_admin_role)
 ):
     """
-    Obtener todas las deudas (solo administradores)
+    Obtener todas las deudas (solo administradores), opcionalmente en un rango de períodos
     """
     client = None
     try:
         client, database = await get_mongodb_connection()
         service = await get_debt_service_new(database)
-        debts = await service.get_all_debts(skip, limit)
+        debts = await service.get_all_debts(skip, limit, cursor, include_total, from_period, to_period)
         return debts
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo deudas: {str(e)}")
     finally:
         if client:
             client.close()
 
+@app.get("/admin/debts/export")
+async def export_debts(
+    format: str = Query("csv", description="Formato de exportación: csv o ndjson"),
+    from_period: Optional[str] = Query(None, description="Primer período del rango, inclusive (YYYYMM)"),
+    to_period: Optional[str] = Query(None, description="Último período del rango, inclusive (YYYYMM)"),
+    current_user: UserModel = Depends(require_admin_role)
+):
+    """
+    Exportar deudas en CSV o NDJSON, una fila por deudor y período (solo administradores)
+    """
+    try:
+        export_format = validate_export_format(format)
+        # Conexión compartida: un cliente por request se cerraría antes de terminar el stream
+        database = await mongodb_config.ensure_connected()
+        service = await get_debt_service_new(database)
+        cursor = service.export_debts(from_period, to_period)
+        return StreamingResponse(
+            stream_rows(cursor, {field: field for field in DEBT_EXPORT_FIELDS}, export_format),
+            media_type=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{export_filename("deudas", export_format)}"'}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exportando deudas: {str(e)}")
+
 @app.get("/admin/debts/{period}", response_model=DebtResponse)
 async def get_debt_by_period(
     period: str,
@@ -3211,6 +3656,26 @@ async def delete_debt(
         if client:
             client.close()
 
+@app.get("/player/debts", response_model=PlayerDebtListResponse)
+async def get_player_debts(
+    limit: int = Query(120, ge=1, le=600, description="Número máximo de períodos"),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Obtener las deudas del jugador en todos los períodos
+    """
+    client = None
+    try:
+        client, database = await get_mongodb_connection()
+        service = await get_debt_service_new(database)
+        debts = await service.get_player_debts(str(current_user.id), limit)
+        return PlayerDebtListResponse(debts=debts, total_amount=sum(debt.amount for debt in debts))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo tus deudas: {str(e)}")
+    finally:
+        if client:
+            client.close()
+
 @app.get("/player/debt/{period}", response_model=PlayerDebtResponse)
 async def get_player_debt(
     period: str,
@@ -3237,6 +3702,55 @@ async def get_player_debt(
         if client:
             client.close()
 
+# ==================== ENDPOINTS DEL LEDGER ====================
+
+@app.get("/admin/ledger/{period}", response_model=LedgerPeriodResponse)
+async def get_period_ledger(
+    period: str,
+    refresh: bool = Query(False, description="Recalcular el período antes de responder"),
+    current_user: UserModel = Depends(require_admin_role)
+):
+    """
+    Obtener el ledger de un período: adeudado, pagado, pendiente y balance por jugador (solo administradores)
+    """
+    client = None
+    try:
+        client, database = await get_mongodb_connection()
+        service = await get_debt_service_new(database)
+        if not service._validate_period_format(period):
+            raise ValueError("Formato de período inválido. Debe ser YYYYMM (ej: 202510)")
+        if refresh:
+            await ledger_service.refresh(database, period)
+        return await ledger_service.get_period(database, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo ledger: {str(e)}")
+    finally:
+        if client:
+            client.close()
+
+@app.get("/player/ledger", response_model=PlayerLedgerResponse)
+async def get_player_ledger(
+    limit: int = Query(24, ge=1, le=120, description="Número máximo de períodos"),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Obtener el ledger del jugador: adeudado, pagado, pendiente y balance por período
+    """
+    client = None
+    try:
+        client, database = await get_mongodb_connection()
+        entries = await ledger_service.get_user_ledger(database, str(current_user.id), limit)
+        return {"entries": entries}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo tu ledger: {str(e)}")
+    finally:
+        if client:
+            client.close()
+
 # Función para ejecutar localmente
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -71,6 +71,8 @@ class CalendarEventModel(BaseModel):
     html_link: str
     is_all_day: bool = False
     calendar_id: str
+    tipo_evento: Optional[str] = None  # Tipo de evento normalizado (ver event_feed.py)
+    start_at: Optional[datetime] = None  # Inicio del evento en UTC
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -193,9 +195,10 @@ class UserUpdateRequest(BaseModel):
 
 class UserListResponse(BaseModel):
     users: List[UserModel]
-    total: int
+    total: Optional[int] = None  # Solo si se solicita (include_total) o en modo skip
     skip: int
     limit: int
+    next_cursor: Optional[str] = None  # Cursor para la siguiente página (None si no hay más)
 
 class UserRoleUpdateRequest(BaseModel):
     roles: List[str]
@@ -203,6 +206,24 @@ class UserRoleUpdateRequest(BaseModel):
 class UserNicknameUpdateRequest(BaseModel):
     nickname: str
 
+class UserBulkUpdateItem(UserUpdateRequest):
+    user_id: str
+
+class UserBulkUpdateRequest(BaseModel):
+    updates: List[UserBulkUpdateItem]
+    ordered: bool = True  # True: se detiene en el primer error; False: aplica todo lo posible
+
+class UserBulkUpdateResult(BaseModel):
+    user_id: str
+    status: str  # "updated", "not_found", "invalid", "error" o "skipped"
+    error: Optional[str] = None
+
+class UserBulkUpdateResponse(BaseModel):
+    total_requested: int
+    updated: int
+    failed: int
+    results: List[UserBulkUpdateResult]
+
 # Modelos para gestión de eventos
 class EventCreateRequest(BaseModel):
     summary: str
@@ -211,6 +232,7 @@ class EventCreateRequest(BaseModel):
     end_datetime: str    # ISO format datetime
     location: Optional[str] = None
     calendar_id: str = "primary"
+    tipo_evento: Optional[str] = None  # Si no se indica, se clasifica por descripción/título
 
 class EventUpdateRequest(BaseModel):
     summary: Optional[str] = None
@@ -218,6 +240,7 @@ class EventUpdateRequest(BaseModel):
     start_datetime: Optional[str] = None
     end_datetime: Optional[str] = None
     location: Optional[str] = None
+    tipo_evento: Optional[str] = None
 
 class EventDeleteResponse(BaseModel):
     message: str
@@ -232,6 +255,7 @@ class PaymentModel(BaseModel):
     user_nickname: Optional[str] = None  # Nickname del usuario
     amount: float  # Monto del pago
     period: str  # Período en formato YYYYMM (ej: 202510)
+    period_num: Optional[int] = None  # Período como entero (ej: 202510) para consultas por rango
     payment_date: datetime  # Fecha exacta del pago
     receipt_image_url: Optional[str] = None  # URL del comprobante en S3
     receipt_image_key: Optional[str] = None  # Clave del archivo en S3
@@ -279,9 +303,10 @@ class PaymentResponse(BaseModel):
 
 class PaymentListResponse(BaseModel):
     payments: List[PaymentResponse]
-    total: int
+    total: Optional[int] = None  # Solo si se solicita (include_total) o en modo skip
     skip: int
     limit: int
+    next_cursor: Optional[str] = None  # Cursor para la siguiente página (None si no hay más)
 
 class PaymentVerificationRequest(BaseModel):
     status: str  # verified, rejected
@@ -317,6 +342,7 @@ class DebtorInfo(BaseModel):
 class DebtModel(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     period: str  # Período en formato YYYYMM (ej: 202510)
+    period_num: Optional[int] = None  # Período como entero (ej: 202510) para consultas por rango
     debtors: List[DebtorInfo]  # Lista de deudores con sus deudas
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -343,12 +369,43 @@ class DebtResponse(BaseModel):
 
 class DebtListResponse(BaseModel):
     debts: List[DebtResponse]
-    total: int
+    total: Optional[int] = None  # Solo si se solicita (include_total) o en modo skip
     skip: int
     limit: int
+    next_cursor: Optional[str] = None  # Cursor para la siguiente página (None si no hay más)
 
 class PlayerDebtResponse(BaseModel):
     period: str
     amount: float
     user_name: str
     user_nickname: Optional[str] = None
+
+class PlayerDebtListResponse(BaseModel):
+    debts: List[PlayerDebtResponse]  # Del período más reciente al más antiguo
+    total_amount: float
+
+# Modelos del ledger (deudas cruzadas con pagos)
+class LedgerEntry(BaseModel):
+    period: str
+    user_id: str
+    user_name: Optional[str] = None
+    user_nickname: Optional[str] = None
+    owed: float  # Monto adeudado (debts.debtors)
+    paid: float  # Pagos verificados
+    pending: float  # Pagos pendientes de verificación
+    balance: float  # owed - paid (positivo: aún debe)
+    payments: int  # Número de pagos verificados o pendientes
+
+class LedgerTotals(BaseModel):
+    owed: float
+    paid: float
+    pending: float
+    balance: float
+
+class LedgerPeriodResponse(BaseModel):
+    period: str
+    entries: List[LedgerEntry]
+    totals: LedgerTotals
+
+class PlayerLedgerResponse(BaseModel):
+    entries: List[LedgerEntry]
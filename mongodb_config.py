@@ -57,6 +57,12 @@ class MongoDBConfig:
             self.client.close()
             logger.info("Desconectado de MongoDB")
     
+    async def ensure_connected(self):
+        """Conectar si aún no hay conexión activa y devolver la base de datos"""
+        if self.database is None:
+            await self.connect()
+        return self.database
+    
     def get_database(self):
         """Obtener la instancia de la base de datos"""
         if self.database is None:
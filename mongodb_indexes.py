@@ -0,0 +1,186 @@
+"""
+Definición y creación de índices de MongoDB para Synco API
+"""
+import logging
+from typing import List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from auth import AUTH_INACTIVE_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Código de MongoDB cuando un índice existe con otras opciones (ej: otro expireAfterSeconds)
+INDEX_OPTIONS_CONFLICT = 85
+
+# Índices únicos de usuarios; parciales sobre valores de texto para que los usuarios sin
+# google_id (creados por un admin o antiguos) no choquen entre sí como null
+USERS_UNIQUE_INDEXES = {
+    "users_google_id_unique": "google_id",
+    "users_email_unique": "email",
+}
+
+
+def users_unique_indexes() -> List[IndexModel]:
+    """Un usuario por cuenta de Google y por email (evita duplicados en logins concurrentes)"""
+    return [
+        IndexModel([(field, ASCENDING)], unique=True, partialFilterExpression={field: {"$type": "string"}}, name=name)
+        for name, field in USERS_UNIQUE_INDEXES.items()
+    ]
+
+
+def auth_collection_indexes(token_field: str, prefix: str) -> List[IndexModel]:
+    """
+    Índices para colecciones de sesiones y refresh tokens
+
+    - TTL sobre expires_at: MongoDB elimina los documentos al expirar
+    - TTL sobre revoked_at: los documentos revocados se conservan solo durante la ventana de retención
+    - Índices parciales sobre documentos activos: las búsquedas solo recorren lo vigente
+
+    Args:
+        token_field: Campo que contiene el token ("session_token" o "token")
+        prefix: Prefijo para los nombres de los índices
+    """
+    return [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name=f"{prefix}_expires_at_ttl"),
+        IndexModel(
+            [("revoked_at", ASCENDING)],
+            expireAfterSeconds=AUTH_INACTIVE_RETENTION_DAYS * 24 * 60 * 60,
+            name=f"{prefix}_revoked_at_ttl"
+        ),
+        IndexModel(
+            [(token_field, ASCENDING)],
+            partialFilterExpression={"is_active": True},
+            name=f"{prefix}_active_token"
+        ),
+        IndexModel(
+            [("user_id", ASCENDING)],
+            partialFilterExpression={"is_active": True},
+            name=f"{prefix}_active_user"
+        ),
+    ]
+
+
+async def create_indexes(database, collection_name: str, indexes: List[IndexModel]):
+    """
+    Crear índices de una colección, ajustando el TTL de índices existentes si cambió
+
+    Args:
+        database: Base de datos de MongoDB
+        collection_name: Nombre de la colección
+        indexes: Índices a crear
+    """
+    collection = database[collection_name]
+    for index in indexes:
+        document = index.document
+        try:
+            await collection.create_indexes([index])
+        except OperationFailure as e:
+            if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in document:
+                # El índice TTL ya existe con otra ventana: actualizarla sin recrearlo
+                await database.command(
+                    "collMod",
+                    collection_name,
+                    index={"name": document["name"], "expireAfterSeconds": document["expireAfterSeconds"]}
+                )
+                logger.info(f"TTL actualizado para índice {document['name']} en {collection_name}")
+            elif e.code == INDEX_OPTIONS_CONFLICT and "partialFilterExpression" in document:
+                # El índice existe sin el filtro parcial (ej: único sobre google_id): recrearlo
+                try:
+                    await collection.drop_index(document["name"])
+                    await collection.create_indexes([index])
+                    logger.info(f"Índice {document['name']} recreado como parcial en {collection_name}")
+                except OperationFailure as rebuild_error:
+                    logger.error(f"Error recreando índice {document['name']} en {collection_name}: {rebuild_error}")
+            else:
+                logger.error(f"Error creando índice {document['name']} en {collection_name}: {e}")
+
+
+async def verify_unique_indexes(database) -> bool:
+    """
+    Comprobar que existen los índices únicos de usuarios
+
+    create_indexes solo registra los errores; si el índice no se pudo crear (ej: documentos
+    duplicados) la API funciona sin garantía de unicidad y el reintento por DuplicateKeyError
+    de los logins concurrentes nunca se activa.
+
+    Returns:
+        True si ambos índices existen
+    """
+    existing = await database["users"].index_information()
+    missing = [name for name in USERS_UNIQUE_INDEXES if name not in existing]
+    if missing:
+        logger.error(f"Faltan índices únicos en users: {', '.join(missing)}; revisar usuarios duplicados")
+        return False
+    return True
+
+
+async def ensure_indexes(database):
+    """Crear todos los índices requeridos por la API (idempotente)"""
+    try:
+        await create_indexes(database, "sessions", auth_collection_indexes("session_token", "sessions"))
+        await create_indexes(database, "refresh_tokens", auth_collection_indexes("token", "refresh_tokens"))
+        # Actividad reciente de sesiones (GET /admin/sessions/activity)
+        await create_indexes(database, "sessions", [
+            IndexModel(
+                [("last_seen_at", DESCENDING)],
+                partialFilterExpression={"is_active": True},
+                name="sessions_active_last_seen"
+            )
+        ])
+        await create_indexes(database, "session_generations", [
+            IndexModel([("last_seen_at", DESCENDING)], sparse=True, name="session_generations_last_seen")
+        ])
+        # Paginación por cursor: cada listado ordena por (campo, _id) descendente
+        await create_indexes(database, "payments", [
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="payments_created_keyset"),
+            IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="payments_user_created_keyset"),
+            IndexModel([("user_id", ASCENDING), ("period", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="payments_user_period_created_keyset"),
+            IndexModel([("period", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="payments_period_created_keyset"),
+            IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="payments_status_created_keyset"),
+            # Rangos de períodos (from_period/to_period) sobre el período entero
+            IndexModel([("period_num", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="payments_period_num_created"),
+            IndexModel([("user_id", ASCENDING), ("period_num", ASCENDING), ("created_at", DESCENDING)], name="payments_user_period_num_created"),
+        ])
+        await create_indexes(database, "users", [
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="users_created_keyset"),
+            *users_unique_indexes(),
+            # Búsqueda por prefijo de nombre/nickname/email (GET /admin/users/search)
+            IndexModel([("search_tokens", ASCENDING)], name="users_search_tokens"),
+        ])
+        await verify_unique_indexes(database)
+        await create_indexes(database, "debts", [
+            IndexModel([("period", DESCENDING), ("_id", DESCENDING)], name="debts_period_keyset"),
+            IndexModel([("period_num", DESCENDING)], name="debts_period_num"),
+            # Deudas de un jugador (GET /player/debt/{period} y GET /player/debts)
+            IndexModel([("debtors.user_id", ASCENDING), ("period", DESCENDING)], name="debts_debtor_period"),
+        ])
+        # Feed de eventos por tipo (GET /me/eventos) y upsert del reflejo por ID de Google
+        await create_indexes(database, "calendar_events", [
+            IndexModel([("tipo_evento", ASCENDING), ("start_at", ASCENDING)], name="calendar_events_tipo_start"),
+            IndexModel([("google_event_id", ASCENDING)], name="calendar_events_google_event_id"),
+        ])
+        # Respuestas de asistencia por usuario (GET /me/asistencias) y por evento
+        await create_indexes(database, "attendance_records", [
+            IndexModel([("event_id", ASCENDING), ("user_name", ASCENDING)], unique=True, name="attendance_records_event_user_unique"),
+            IndexModel([("user_name", ASCENDING), ("event_start", ASCENDING)], name="attendance_records_user_event_start"),
+        ])
+        # Trabajos de propagación de nombres: búsqueda de pendientes/vencidos y limpieza de terminados
+        await create_indexes(database, "propagation_jobs", [
+            IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="propagation_jobs_status_updated"),
+            IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=7 * 24 * 60 * 60, name="propagation_jobs_finished_ttl"),
+        ])
+        # Ledger por período (GET /admin/ledger/{period}) y por jugador (GET /player/ledger)
+        await create_indexes(database, "ledger", [
+            IndexModel([("period", ASCENDING), ("user_id", ASCENDING)], name="ledger_period_user"),
+            IndexModel([("user_id", ASCENDING), ("period", DESCENDING)], name="ledger_user_period"),
+            # Filas eliminadas: se conservan un día como marca para que un recálculo más antiguo no las recree
+            IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=24 * 60 * 60, name="ledger_deleted_ttl"),
+        ])
+        # Contadores del limitador de tasa (RATE_LIMIT_STORE=mongo)
+        await create_indexes(database, "rate_limits", [
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="rate_limits_expires_at_ttl")
+        ])
+        logger.info("Índices de MongoDB verificados")
+    except Exception as e:
+        # Los índices no deben impedir que la API arranque
+        logger.error(f"Error verificando índices de MongoDB: {e}")
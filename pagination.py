@@ -0,0 +1,150 @@
+"""
+Paginación por cursor (keyset) para endpoints de listado
+
+Los cursores son opacos para el cliente: base64 de un JSON con el último valor de la clave
+de orden y su _id. La siguiente página se obtiene con un rango sobre (campo, _id) que usa
+el índice compuesto correspondiente, sin el costo lineal de skip.
+"""
+import base64
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DESCENDING
+
+from counters_service import counters_service
+
+# Segundos que se reutiliza un total calculado con count_documents (filtros sin contador)
+TOTAL_CACHE_SECONDS = int(os.getenv("PAGINATION_TOTAL_CACHE_SECONDS", "30"))
+
+
+def encode_cursor(document: Dict[str, Any], field: str) -> str:
+    """
+    Crear el cursor que apunta después de un documento
+
+    Args:
+        document: Último documento de la página
+        field: Campo de orden (ej: "created_at" o "period")
+    """
+    value = document.get(field)
+    payload = {"f": field, "id": str(document["_id"])}
+    if isinstance(value, datetime):
+        payload["dt"] = value.isoformat()
+    else:
+        payload["v"] = value
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, field: str) -> Tuple[Any, ObjectId]:
+    """
+    Obtener (valor, _id) desde un cursor
+
+    Raises:
+        ValueError: Si el cursor no es válido o pertenece a otro orden
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["f"] != field:
+            raise ValueError
+        value = datetime.fromisoformat(payload["dt"]) if "dt" in payload else payload["v"]
+        return value, ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+
+def keyset_query(query: Dict[str, Any], field: str, cursor: str) -> Dict[str, Any]:
+    """Agregar a la consulta la condición "después del cursor" para orden descendente"""
+    value, last_id = decode_cursor(cursor, field)
+    after = {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "_id": {"$lt": last_id}}
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+class TotalCountCache:
+    def __init__(self, ttl_seconds: int = TOTAL_CACHE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, int]] = {}
+
+    async def count(self, collection, query: Dict[str, Any]) -> int:
+        """Contar documentos con los contadores incrementales o, si el filtro no tiene contador,
+        reutilizando el resultado de count_documents durante ttl_seconds"""
+        tracked = await counters_service.count(collection, query)
+        if tracked is not None:
+            return tracked
+        
+        key = f"{collection.name}:{json.dumps(query, sort_keys=True, default=str)}"
+        now = time.monotonic()
+        cached = self._entries.get(key)
+        if cached and now - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        total = await collection.count_documents(query)
+
+        if len(self._entries) > 1000:
+            self._entries = {k: v for k, v in self._entries.items() if now - v[0] < self.ttl_seconds}
+        self._entries[key] = (now, total)
+        return total
+
+    def invalidate(self, collection_name: str):
+        """Descartar los totales cacheados de una colección"""
+        prefix = f"{collection_name}:"
+        self._entries = {k: v for k, v in self._entries.items() if not k.startswith(prefix)}
+
+# Instancia global del caché de totales
+total_count_cache = TotalCountCache()
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    field: str,
+    limit: int,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None,
+    projection: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
+    """
+    Obtener una página ordenada por (field, _id) descendente
+
+    Args:
+        collection: Colección de MongoDB
+        query: Filtro de la consulta
+        field: Campo de orden
+        limit: Número máximo de documentos
+        skip: Documentos a saltar (modo compatible, se ignora si hay cursor)
+        cursor: Cursor devuelto por la página anterior
+        include_total: Calcular el total exacto (por defecto solo en modo skip)
+        projection: Proyección opcional
+
+    Returns:
+        (documentos, total o None, cursor de la siguiente página o None)
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    if include_total is None:
+        include_total = cursor is None
+
+    total = await total_count_cache.count(collection, query) if include_total else None
+
+    page_query = keyset_query(query, field, cursor) if cursor else query
+    find = collection.find(page_query, projection).sort([(field, DESCENDING), ("_id", DESCENDING)])
+    if skip and not cursor:
+        find = find.skip(skip)
+    # Un documento extra indica si existe una página siguiente
+    documents = await find.limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1], field)
+
+    return documents, total, next_cursor
@@ -0,0 +1,214 @@
+"""
+Estadísticas de pagos precalculadas por período y usuario (colección payment_rollups)
+
+Cada documento guarda los totales de un alcance: todos los pagos, un usuario, un período o
+un usuario en un período. Los totales se ajustan con $inc en cada creación, verificación,
+actualización o eliminación de pagos (el mismo hook que los contadores), así que las
+estadísticas del dashboard son una lectura por _id.
+
+Como los contadores, solo se ajustan los rollups ya sembrados: un alcance sin rollup se
+calcula con la agregación $facet la primera vez que se consulta. Para no perder los $inc que
+llegan mientras tanto, el documento se crea antes de la agregación (marcado seeding) y cada
+ajuste sube su campo changes; el resultado solo se guarda si changes no se movió. Un job
+periódico los reconcilia con los pagos reales.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from mongodb_config import mongodb_config
+
+logger = logging.getLogger(__name__)
+
+# Intentos de sembrar un alcance mientras llegan cambios de pagos
+SEED_ATTEMPTS = 3
+
+ROLLUP_FIELDS = ("total_payments", "total_amount", "by_status")
+
+
+def rollup_key(user_id: Optional[Any] = None, period: Optional[str] = None) -> str:
+    """_id del rollup de un alcance (ej: user=...,period=202510; all sin filtros)"""
+    parts = []
+    if user_id:
+        parts.append(f"user={user_id}")
+    if period:
+        parts.append(f"period={period}")
+    return ",".join(parts) or "all"
+
+
+def _scopes(payment: Dict[str, Any]) -> List[Tuple[Optional[Any], Optional[str]]]:
+    """Alcances en los que cuenta un pago"""
+    user_id, period = payment.get("user_id"), payment.get("period")
+    scopes = [(None, None)]
+    if user_id:
+        scopes.append((user_id, None))
+    if period:
+        scopes.append((None, period))
+    if user_id and period:
+        scopes.append((user_id, period))
+    return scopes
+
+
+def _empty_rollup() -> Dict[str, Any]:
+    return {"total_payments": 0, "total_amount": 0.0, "by_status": {}}
+
+
+def _add(rollup: Dict[str, Any], status: str, count: int, amount: float):
+    rollup["total_payments"] += count
+    rollup["total_amount"] += amount
+    by_status = rollup["by_status"].setdefault(status, {"count": 0, "amount": 0.0})
+    by_status["count"] += count
+    by_status["amount"] += amount
+
+
+class PaymentRollupsService:
+    def __init__(self):
+        self.collection_name = "payment_rollups"
+        self.reconcile_interval_seconds = int(os.getenv("COUNTERS_RECONCILE_MINUTES", "60")) * 60
+        self._reconciler: Optional[asyncio.Task] = None
+
+    async def get(self, database, user_id: Optional[str] = None, period: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Estadísticas de un alcance desde su rollup (lectura por _id)
+
+        Returns:
+            {"total_payments", "total_amount", "by_status"} o None si el alcance no está sembrado
+        """
+        return await database[self.collection_name].find_one(
+            {"_id": rollup_key(user_id, period), "seeding": {"$ne": True}},
+            {"_id": 0, "total_payments": 1, "total_amount": 1, "by_status": 1}
+        )
+
+    async def seed(self, database, user_id: Optional[Any], period: Optional[str],
+                   compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Sembrar el rollup de un alcance y devolver sus estadísticas
+
+        Args:
+            compute: Calcula las estadísticas desde los pagos; se vuelve a llamar si un pago
+                cambió durante el cálculo (el ajuste de ese pago se habría perdido)
+
+        Returns:
+            {"total_payments", "total_amount", "by_status"}
+        """
+        collection = database[self.collection_name]
+        key = rollup_key(user_id, period)
+        stats: Dict[str, Any] = {}
+        for _ in range(SEED_ATTEMPTS):
+            # Crear el documento antes de calcular: desde aquí track_changes lo ajusta y sube changes
+            rollup = await collection.find_one_and_update(
+                {"_id": key},
+                {"$setOnInsert": {"user_id": user_id, "period": period, **_empty_rollup(), "changes": 0, "seeding": True}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            if not rollup.get("seeding"):
+                return {field: rollup[field] for field in ROLLUP_FIELDS}
+
+            stats = await compute()
+            result = await collection.update_one(
+                {"_id": key, "seeding": True, "changes": rollup.get("changes", 0)},
+                {"$set": {**{field: stats[field] for field in ROLLUP_FIELDS}, "updated_at": datetime.utcnow()},
+                 "$unset": {"seeding": ""}}
+            )
+            if result.matched_count:
+                return stats
+        # Demasiados cambios seguidos: el alcance queda sin sembrar hasta la próxima consulta o reconciliación
+        return stats
+
+    async def track_changes(self, database, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """
+        Ajustar los rollups tras crear (before=None), eliminar (after=None) o modificar pagos
+
+        Los deltas de todos los pagos se suman y se envían en un solo bulk_write.
+        """
+        deltas: Dict[str, Dict[str, float]] = {}
+        for before, after in changes:
+            for payment, sign in ((before, -1), (after, 1)):
+                if not payment:
+                    continue
+                amount = float(payment.get("amount") or 0) * sign
+                status = payment.get("status") or "pending"
+                for user_id, period in _scopes(payment):
+                    inc = deltas.setdefault(rollup_key(user_id, period), {})
+                    for field, value in (
+                        ("total_payments", sign), ("total_amount", amount),
+                        (f"by_status.{status}.count", sign), (f"by_status.{status}.amount", amount)
+                    ):
+                        inc[field] = inc.get(field, 0) + value
+
+        # changes avisa a una siembra en curso que su cálculo quedó desactualizado
+        operations = [
+            UpdateOne({"_id": key}, {"$inc": {**inc, "changes": 1}, "$set": {"updated_at": datetime.utcnow()}})
+            for key, inc in deltas.items() if any(inc.values())
+        ]
+        if not operations:
+            return
+        try:
+            await database[self.collection_name].bulk_write(operations, ordered=False)
+        except Exception as e:
+            # La reconciliación periódica corrige los rollups si falla el ajuste
+            logger.error(f"Error actualizando rollups de pagos: {e}")
+
+    async def reconcile(self, database) -> int:
+        """
+        Recalcular los rollups sembrados desde los pagos (una agregación por usuario, período y estado)
+
+        Returns:
+            Número de rollups escritos
+        """
+        rollups: Dict[str, Dict[str, Any]] = {}
+        pipeline = [{"$group": {
+            "_id": {"user_id": "$user_id", "period": "$period", "status": "$status"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"}
+        }}]
+        async for group in database["payments"].aggregate(pipeline):
+            for user_id, period in _scopes(group["_id"]):
+                rollup = rollups.setdefault(rollup_key(user_id, period), _empty_rollup())
+                _add(rollup, group["_id"].get("status") or "pending", group["count"], float(group["amount"] or 0))
+
+        collection = database[self.collection_name]
+        operations = [
+            UpdateOne({"_id": rollup["_id"]}, {
+                "$set": {**rollups.get(rollup["_id"], _empty_rollup()), "updated_at": datetime.utcnow()},
+                "$unset": {"seeding": ""}
+            })
+            async for rollup in collection.find({}, {"_id": 1})
+        ]
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    async def _run_reconciler(self):
+        """Reconciliar periódicamente los rollups"""
+        while True:
+            await asyncio.sleep(self.reconcile_interval_seconds)
+            try:
+                database = await mongodb_config.ensure_connected()
+                written = await self.reconcile(database)
+                logger.info(f"Rollups de pagos reconciliados: {written}")
+            except Exception as e:
+                logger.error(f"Error reconciliando rollups de pagos: {e}")
+
+    def start_reconciler(self):
+        """Iniciar la reconciliación periódica en segundo plano"""
+        if self._reconciler is None or self._reconciler.done():
+            self._reconciler = asyncio.ensure_future(self._run_reconciler())
+
+    async def stop_reconciler(self):
+        """Detener la reconciliación periódica"""
+        if self._reconciler is not None:
+            self._reconciler.cancel()
+            try:
+                await self._reconciler
+            except asyncio.CancelledError:
+                pass
+            self._reconciler = None
+
+# Instancia global del servicio
+payment_rollups_service = PaymentRollupsService()
@@ -2,13 +2,22 @@
 Servicio para gestión de pagos
 Maneja la lógica de negocio para pagos de usuarios
 """
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 from models import PaymentModel, PaymentCreateRequest, PaymentUpdateRequest, PaymentResponse, PaymentListResponse
 from s3_service import s3_service
-import re
+from pagination import fetch_page
+from counters_service import counters_service
+from payment_rollups import payment_rollups_service
+from ledger_service import ledger_service
+from sparse_fields import PAYMENT_FIELDS, build_projection, serialize_documents
+from period_utils import validate_period, period_to_int, period_range_query
+from exports import EXPORT_BATCH_SIZE
+from data_access import insert_and_return, set_and_return
 
 class PaymentService:
     def __init__(self, database: AsyncIOMotorDatabase):
@@ -47,16 +56,15 @@ class PaymentService:
             user_nickname=user.nickname,  # Nickname del usuario
             amount=payment_data.amount,
             period=payment_data.period,
+            period_num=period_to_int(payment_data.period),
             payment_date=payment_date,
             notes=payment_data.notes,
             status="pending"
         )
         
-        # Insertar en la base de datos
-        result = await self.collection.insert_one(payment.dict(by_alias=True, exclude={"id"}))
-        
-        # Obtener el pago creado
-        created_payment = await self.collection.find_one({"_id": result.inserted_id})
+        # Insertar en la base de datos (el documento insertado es la respuesta)
+        created_payment = await insert_and_return(self.collection, payment.dict(by_alias=True, exclude={"id"}))
+        await self._track_payment_change(None, created_payment)
         
         return self._payment_to_response(created_payment)
     
@@ -80,7 +88,7 @@ class PaymentService:
             return self._payment_to_response(payment)
         return None
     
-    async def get_user_payments(self, user_id: str, skip: int = 0, limit: int = 100) -> PaymentListResponse:
+    async def get_user_payments(self, user_id: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, include_total: Optional[bool] = None, from_period: Optional[str] = None, to_period: Optional[str] = None) -> PaymentListResponse:
         """
         Obtiene todos los pagos de un usuario específico
         
@@ -88,27 +96,18 @@ class PaymentService:
             user_id: ID del usuario
             skip: Número de registros a saltar
             limit: Número máximo de registros a devolver
+            cursor: Cursor de la página anterior (reemplaza a skip)
+            include_total: Calcular el total exacto (por defecto solo sin cursor)
+            from_period: Primer período del rango, inclusive (opcional)
+            to_period: Último período del rango, inclusive (opcional)
         
         Returns:
             PaymentListResponse con la lista de pagos
         """
-        # Contar total de pagos
-        total = await self.collection.count_documents({"user_id": ObjectId(user_id)})
-        
-        # Obtener pagos ordenados por fecha de creación (más recientes primero)
-        cursor = self.collection.find({"user_id": ObjectId(user_id)}).sort("created_at", -1).skip(skip).limit(limit)
-        payments = await cursor.to_list(length=limit)
-        
-        payment_responses = [self._payment_to_response(payment) for payment in payments]
-        
-        return PaymentListResponse(
-            payments=payment_responses,
-            total=total,
-            skip=skip,
-            limit=limit
-        )
+        query = {"user_id": ObjectId(user_id), **period_range_query(from_period, to_period)}
+        return await self._list_payments(query, skip, limit, cursor, include_total)
     
-    async def get_user_payments_by_period(self, user_id: str, period: str, skip: int = 0, limit: int = 100) -> PaymentListResponse:
+    async def get_user_payments_by_period(self, user_id: str, period: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, include_total: Optional[bool] = None) -> PaymentListResponse:
         """
         Obtiene los pagos de un usuario específico filtrados por período
         
@@ -117,6 +116,8 @@ class PaymentService:
             period: Período en formato YYYYMM
             skip: Número de registros a saltar
             limit: Número máximo de registros a devolver
+            cursor: Cursor de la página anterior (reemplaza a skip)
+            include_total: Calcular el total exacto (por defecto solo sin cursor)
         
         Returns:
             PaymentListResponse con la lista de pagos
@@ -129,24 +130,9 @@ class PaymentService:
             "user_id": ObjectId(user_id),
             "period": period
         }
-        
-        # Contar total de pagos
-        total = await self.collection.count_documents(query)
-        
-        # Obtener pagos ordenados por fecha de creación (más recientes primero)
-        cursor = self.collection.find(query).sort("created_at", -1).skip(skip).limit(limit)
-        payments = await cursor.to_list(length=limit)
-        
-        payment_responses = [self._payment_to_response(payment) for payment in payments]
-        
-        return PaymentListResponse(
-            payments=payment_responses,
-            total=total,
-            skip=skip,
-            limit=limit
-        )
+        return await self._list_payments(query, skip, limit, cursor, include_total)
     
-    async def get_payments_by_period(self, period: str, skip: int = 0, limit: int = 100) -> PaymentListResponse:
+    async def get_payments_by_period(self, period: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, include_total: Optional[bool] = None) -> PaymentListResponse:
         """
         Obtiene todos los pagos de un período específico
         
@@ -154,6 +140,8 @@ class PaymentService:
             period: Período en formato YYYYMM
             skip: Número de registros a saltar
             limit: Número máximo de registros a devolver
+            cursor: Cursor de la página anterior (reemplaza a skip)
+            include_total: Calcular el total exacto (por defecto solo sin cursor)
         
         Returns:
             PaymentListResponse con la lista de pagos
@@ -162,23 +150,9 @@ class PaymentService:
         if not self._validate_period_format(period):
             raise ValueError("Formato de período inválido. Debe ser YYYYMM (ej: 202510)")
         
-        # Contar total de pagos
-        total = await self.collection.count_documents({"period": period})
-        
-        # Obtener pagos ordenados por fecha de creación (más recientes primero)
-        cursor = self.collection.find({"period": period}).sort("created_at", -1).skip(skip).limit(limit)
-        payments = await cursor.to_list(length=limit)
-        
-        payment_responses = [self._payment_to_response(payment) for payment in payments]
-        
-        return PaymentListResponse(
-            payments=payment_responses,
-            total=total,
-            skip=skip,
-            limit=limit
-        )
+        return await self._list_payments({"period": period}, skip, limit, cursor, include_total)
     
-    async def get_all_payments(self, skip: int = 0, limit: int = 100, status: Optional[str] = None, period: Optional[str] = None) -> PaymentListResponse:
+    async def get_all_payments(self, skip: int = 0, limit: int = 100, status: Optional[str] = None, period: Optional[str] = None, cursor: Optional[str] = None, include_total: Optional[bool] = None, fields: Optional[List[str]] = None, from_period: Optional[str] = None, to_period: Optional[str] = None) -> Union[PaymentListResponse, Dict[str, Any]]:
         """
         Obtiene todos los pagos (solo para administradores)
         
@@ -187,30 +161,86 @@ class PaymentService:
             limit: Número máximo de registros a devolver
             status: Filtrar por estado (opcional)
             period: Filtrar por período (opcional)
+            cursor: Cursor de la página anterior (reemplaza a skip)
+            include_total: Calcular el total exacto (por defecto solo sin cursor)
+            fields: Campos a devolver (opcional, ver sparse_fields.PAYMENT_FIELDS)
+            from_period: Primer período del rango, inclusive (opcional)
+            to_period: Último período del rango, inclusive (opcional)
         
         Returns:
-            PaymentListResponse con la lista de pagos
+            PaymentListResponse con la lista de pagos, o dict serializable si se pidieron campos
+        """
+        query = self._admin_query(status, period, from_period, to_period)
+        return await self._list_payments(query, skip, limit, cursor, include_total, fields)
+    
+    def export_payments(self, status: Optional[str] = None, period: Optional[str] = None, from_period: Optional[str] = None, to_period: Optional[str] = None, fields: Optional[List[str]] = None) -> Tuple[Any, Dict[str, str]]:
+        """
+        Cursor para exportar pagos con los mismos filtros que get_all_payments
+        
+        Args:
+            status: Filtrar por estado (opcional)
+            period: Filtrar por período (opcional)
+            from_period: Primer período del rango, inclusive (opcional)
+            to_period: Último período del rango, inclusive (opcional)
+            fields: Columnas a exportar (por defecto todas, ver sparse_fields.PAYMENT_FIELDS)
+        
+        Returns:
+            (cursor con proyección y batch_size acotado, columna -> campo en MongoDB)
         """
-        query = {}
+        columns = {field: PAYMENT_FIELDS[field] for field in (fields or PAYMENT_FIELDS)}
+        cursor = self.collection.find(
+            self._admin_query(status, period, from_period, to_period),
+            build_projection(list(columns), PAYMENT_FIELDS)
+        ).sort([("created_at", -1), ("_id", -1)]).batch_size(EXPORT_BATCH_SIZE)
+        return cursor, columns
+    
+    def _admin_query(self, status: Optional[str], period: Optional[str], from_period: Optional[str], to_period: Optional[str]) -> Dict[str, Any]:
+        """Filtro del listado de pagos de administración (estado, período y rango de períodos)"""
+        query = period_range_query(from_period, to_period)
         if status:
             query["status"] = status
         if period:
             query["period"] = period
+        return query
+    
+    async def _list_payments(self, query: Dict[str, Any], skip: int, limit: int, cursor: Optional[str], include_total: Optional[bool], fields: Optional[List[str]] = None) -> Union[PaymentListResponse, Dict[str, Any]]:
+        """
+        Obtiene una página de pagos ordenados por fecha de creación (más recientes primero)
         
-        # Contar total de pagos
-        total = await self.collection.count_documents(query)
+        Args:
+            query: Filtro de la consulta
+            skip: Número de registros a saltar (se ignora si hay cursor)
+            limit: Número máximo de registros a devolver
+            cursor: Cursor de la página anterior
+            include_total: Calcular el total exacto
+            fields: Campos a devolver; con ellos se proyecta en MongoDB y no se construyen modelos
         
-        # Obtener pagos ordenados por fecha de creación (más recientes primero)
-        cursor = self.collection.find(query).sort("created_at", -1).skip(skip).limit(limit)
-        payments = await cursor.to_list(length=limit)
+        Returns:
+            PaymentListResponse con la lista de pagos y el cursor siguiente
+        """
+        projection = build_projection(fields, PAYMENT_FIELDS, extra=["created_at"]) if fields else None
+        payments, total, next_cursor = await fetch_page(
+            self.collection, query, "created_at", limit,
+            skip=skip, cursor=cursor, include_total=include_total, projection=projection
+        )
+        
+        if fields:
+            return {
+                "payments": serialize_documents(payments, fields, PAYMENT_FIELDS),
+                "total": total,
+                "skip": 0 if cursor else skip,
+                "limit": limit,
+                "next_cursor": next_cursor
+            }
         
         payment_responses = [self._payment_to_response(payment) for payment in payments]
         
         return PaymentListResponse(
             payments=payment_responses,
             total=total,
-            skip=skip,
-            limit=limit
+            skip=0 if cursor else skip,
+            limit=limit,
+            next_cursor=next_cursor
         )
     
     async def update_payment(self, payment_id: str, user_id: str, update_data: PaymentUpdateRequest) -> Optional[PaymentResponse]:
@@ -231,17 +261,20 @@ class PaymentService:
         
         # Preparar datos de actualización
         update_dict = {k: v for k, v in update_data.dict(exclude_unset=True).items() if v is not None}
+        if update_data.period:
+            update_dict["period_num"] = period_to_int(update_data.period)
         update_dict["updated_at"] = datetime.utcnow()
         
-        # Actualizar el pago
-        result = await self.collection.update_one(
+        # Actualizar el pago (el documento previo permite ajustar los contadores si cambia el período)
+        previous_payment = await self.collection.find_one_and_update(
             {"_id": ObjectId(payment_id), "user_id": ObjectId(user_id)},
-            {"$set": update_dict}
+            {"$set": update_dict},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count > 0:
-            # Obtener el pago actualizado
-            updated_payment = await self.collection.find_one({"_id": ObjectId(payment_id)})
+        if previous_payment:
+            updated_payment = {**previous_payment, **update_dict}
+            await self._track_payment_change(previous_payment, updated_payment)
             return self._payment_to_response(updated_payment)
         
         return None
@@ -272,19 +305,74 @@ class PaymentService:
         if notes:
             update_data["notes"] = notes
         
-        # Actualizar el pago
-        result = await self.collection.update_one(
+        # Actualizar el pago (el documento previo permite ajustar los contadores por estado)
+        previous_payment = await self.collection.find_one_and_update(
             {"_id": ObjectId(payment_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count > 0:
-            # Obtener el pago actualizado
-            updated_payment = await self.collection.find_one({"_id": ObjectId(payment_id)})
+        if previous_payment:
+            updated_payment = {**previous_payment, **update_data}
+            await self._track_payment_change(previous_payment, updated_payment)
             return self._payment_to_response(updated_payment)
         
         return None
     
+    async def bulk_verify_payments(self, payment_ids: List[str], verified_by: str, status: str, notes: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Verifica o rechaza muchos pagos con una consulta y un update_many
+        
+        Args:
+            payment_ids: IDs de los pagos
+            verified_by: ID del administrador que verifica
+            status: Estado de verificación (verified, rejected)
+            notes: Notas de verificación (opcional)
+        
+        Returns:
+            {"verified": n, "not_found": n, "errors": [...]}
+        """
+        errors = []
+        object_ids = []
+        for payment_id in dict.fromkeys(payment_ids):
+            try:
+                object_ids.append(ObjectId(payment_id))
+            except Exception as e:
+                errors.append(f"Error verificando pago {payment_id}: {str(e)}")
+        
+        # Una sola consulta con los campos que usan los contadores y rollups
+        payments = await self.collection.find(
+            {"_id": {"$in": object_ids}},
+            {"user_id": 1, "period": 1, "status": 1, "amount": 1}
+        ).to_list(length=None)
+        
+        verified = 0
+        if payments:
+            update_data = {
+                "status": status,
+                "verified_by": ObjectId(verified_by),
+                "verified_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }
+            if notes:
+                update_data["notes"] = notes
+            
+            result = await self.collection.update_many(
+                {"_id": {"$in": [payment["_id"] for payment in payments]}},
+                {"$set": update_data}
+            )
+            verified = result.modified_count
+            await self._track_payment_changes([
+                (payment, {**payment, "status": status}) for payment in payments
+            ])
+        
+        return {
+            "verified": verified,
+            # Sobre los IDs válidos sin repetir: los inválidos ya van en errors
+            "not_found": len(object_ids) - verified,
+            "errors": errors
+        }
+    
     async def delete_payment(self, payment_id: str, user_id: str) -> bool:
         """
         Elimina un pago
@@ -306,10 +394,63 @@ class PaymentService:
             
             # Eliminar el pago de la base de datos
             result = await self.collection.delete_one({"_id": ObjectId(payment_id), "user_id": ObjectId(user_id)})
+            if result.deleted_count > 0:
+                await self._track_payment_change(payment, None)
             return result.deleted_count > 0
         
         return False
     
+    async def bulk_delete_payments(self, payment_ids: List[str]) -> Dict[str, Any]:
+        """
+        Elimina muchos pagos (y sus comprobantes) con una consulta, un delete_many y
+        llamadas DeleteObjects a S3 por lotes
+        
+        Args:
+            payment_ids: IDs de los pagos
+        
+        Returns:
+            {"deleted": n, "not_found": n, "errors": [...]}
+        """
+        errors = []
+        object_ids = []
+        for payment_id in dict.fromkeys(payment_ids):
+            try:
+                object_ids.append(ObjectId(payment_id))
+            except Exception as e:
+                errors.append(f"Error eliminando pago {payment_id}: {str(e)}")
+        
+        # Una sola consulta con los campos de contadores y rollups y la clave del comprobante
+        payments = await self.collection.find(
+            {"_id": {"$in": object_ids}},
+            {"user_id": 1, "period": 1, "status": 1, "amount": 1, "receipt_image_key": 1}
+        ).to_list(length=None)
+        
+        deleted = 0
+        if payments:
+            result = await self.collection.delete_many({"_id": {"$in": [payment["_id"] for payment in payments]}})
+            deleted = result.deleted_count
+            await self._track_payment_changes([(payment, None) for payment in payments])
+            
+            # Comprobantes en S3 fuera del event loop (el cliente de boto3 es bloqueante)
+            payment_by_key = {
+                payment["receipt_image_key"]: payment["_id"]
+                for payment in payments if payment.get("receipt_image_key")
+            }
+            if payment_by_key:
+                try:
+                    failed = await asyncio.to_thread(s3_service.delete_files, list(payment_by_key))
+                except Exception as e:
+                    failed = {key: str(e) for key in payment_by_key}
+                for key, message in failed.items():
+                    errors.append(f"Error eliminando archivo de S3 para pago {payment_by_key[key]}: {message}")
+        
+        return {
+            "deleted": deleted,
+            # Sobre los IDs válidos sin repetir: los inválidos ya van en errors
+            "not_found": len(object_ids) - deleted,
+            "errors": errors
+        }
+    
     async def update_payment_receipt(self, payment_id: str, user_id: str, file_key: str) -> Optional[PaymentResponse]:
         """
         Actualiza la información del comprobante de un pago
@@ -336,18 +477,33 @@ class PaymentService:
             "updated_at": datetime.utcnow()
         }
         
-        result = await self.collection.update_one(
+        updated_payment = await set_and_return(
+            self.collection,
             {"_id": ObjectId(payment_id), "user_id": ObjectId(user_id)},
-            {"$set": update_data}
+            update_data
         )
         
-        if result.modified_count > 0:
-            # Obtener el pago actualizado
-            updated_payment = await self.collection.find_one({"_id": ObjectId(payment_id)})
+        if updated_payment:
             return self._payment_to_response(updated_payment)
         
         return None
     
+    async def _track_payment_change(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """
+        Ajustar los contadores (por usuario, período y estado), los rollups de estadísticas y el ledger tras un cambio
+        
+        Args:
+            before: Documento antes del cambio (None si se insertó)
+            after: Documento después del cambio (None si se eliminó)
+        """
+        await self._track_payment_changes([(before, after)])
+    
+    async def _track_payment_changes(self, changes: List[tuple]):
+        """Ajustar contadores, rollups y ledger tras una operación masiva (lista de (before, after))"""
+        await counters_service.track_changes(self.database, "payments", changes)
+        await payment_rollups_service.track_changes(self.database, changes)
+        await ledger_service.track_payment_changes(self.database, changes)
+    
     def _validate_period_format(self, period: str) -> bool:
         """
         Valida que el formato del período sea YYYYMM
@@ -358,21 +514,7 @@ class PaymentService:
         Returns:
             True si el formato es válido, False en caso contrario
         """
-        pattern = r'^\d{6}$'
-        if not re.match(pattern, period):
-            return False
-        
-        # Validar que sea un año y mes válidos
-        year = int(period[:4])
-        month = int(period[4:6])
-        
-        if year < 2000 or year > 2100:
-            return False
-        
-        if month < 1 or month > 12:
-            return False
-        
-        return True
+        return validate_period(period)
     
     def _payment_to_response(self, payment: Dict[str, Any]) -> PaymentResponse:
         """
@@ -401,41 +543,79 @@ class PaymentService:
             updated_at=payment["updated_at"]
         )
     
-    async def get_payment_statistics(self, user_id: Optional[str] = None, period: Optional[str] = None) -> Dict[str, Any]:
+    async def get_payment_statistics(self, user_id: Optional[str] = None, period: Optional[str] = None, breakdown: bool = False, from_period: Optional[str] = None, to_period: Optional[str] = None) -> Dict[str, Any]:
         """
         Obtiene estadísticas de pagos
         
+        Sin desglose las estadísticas salen del rollup del alcance (payment_rollups), que se
+        siembra la primera vez; si se pide el desglose por usuario y período o se consulta un
+        rango de períodos, se calculan con una sola agregación $facet.
+        
         Args:
             user_id: ID del usuario (opcional)
             period: Período específico (opcional)
+            breakdown: Incluir sumas por usuario (by_user) y por período (by_period)
+            from_period: Primer período del rango, inclusive (opcional)
+            to_period: Último período del rango, inclusive (opcional)
         
         Returns:
             Dict con estadísticas
         """
-        query = {}
+        period_range = period_range_query(from_period, to_period)
+        query = dict(period_range)
         if user_id:
             query["user_id"] = ObjectId(user_id)
         if period:
             query["period"] = period
         
-        # Contar por estado
-        pipeline = [
-            {"$match": query},
-            {"$group": {
-                "_id": "$status",
-                "count": {"$sum": 1},
-                "total_amount": {"$sum": "$amount"}
-            }}
-        ]
-        
-        stats = await self.collection.aggregate(pipeline).to_list(length=None)
-        
-        # Calcular totales
-        total_payments = await self.collection.count_documents(query)
-        total_amount = sum(stat["total_amount"] for stat in stats)
-        
-        return {
-            "total_payments": total_payments,
-            "total_amount": total_amount,
-            "by_status": {stat["_id"]: {"count": stat["count"], "amount": stat["total_amount"]} for stat in stats}
+        if not breakdown and not period_range:
+            rollup = await payment_rollups_service.get(self.database, user_id, period)
+            if rollup is not None:
+                return rollup
+            return await payment_rollups_service.seed(
+                self.database, query.get("user_id"), period, lambda: self._facet_statistics(query)
+            )
+        return await self._facet_statistics(query, breakdown)
+    
+    async def _facet_statistics(self, query: Dict[str, Any], breakdown: bool = False) -> Dict[str, Any]:
+        """Estadísticas de los pagos que cumplen query, calculadas con una sola agregación $facet"""
+        # Una sola pasada: desglose por estado (de ahí salen los totales) y sumas por usuario y período
+        facets = {
+            "by_status": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}, "total_amount": {"$sum": "$amount"}}}
+            ]
+        }
+        if breakdown:
+            facets["by_period"] = [
+                {"$group": {"_id": "$period", "count": {"$sum": 1}, "total_amount": {"$sum": "$amount"}}},
+                {"$sort": {"_id": 1}}
+            ]
+            facets["by_user"] = [
+                {"$group": {
+                    "_id": "$user_id",
+                    "user_name": {"$first": "$user_name"},
+                    "count": {"$sum": 1},
+                    "total_amount": {"$sum": "$amount"}
+                }},
+                {"$sort": {"total_amount": -1}}
+            ]
+        
+        result = await self.collection.aggregate([{"$match": query}, {"$facet": facets}]).to_list(length=None)
+        facet = result[0] if result else {}
+        by_status = facet.get("by_status", [])
+        
+        stats = {
+            "total_payments": sum(stat["count"] for stat in by_status),
+            "total_amount": sum(stat["total_amount"] for stat in by_status),
+            "by_status": {stat["_id"]: {"count": stat["count"], "amount": stat["total_amount"]} for stat in by_status}
         }
+        if breakdown:
+            stats["by_period"] = {
+                stat["_id"]: {"count": stat["count"], "amount": stat["total_amount"]}
+                for stat in facet.get("by_period", [])
+            }
+            stats["by_user"] = [
+                {"user_id": str(stat["_id"]), "user_name": stat.get("user_name"), "count": stat["count"], "amount": stat["total_amount"]}
+                for stat in facet.get("by_user", [])
+            ]
+        return stats
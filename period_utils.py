@@ -0,0 +1,62 @@
+"""
+Utilidades para períodos de pagos y deudas
+
+Un período se guarda como texto YYYYMM (period) y como entero (period_num, ej: 202510).
+El entero conserva el orden cronológico, así que un rango de períodos ("temporada a la
+fecha", "últimos 6 meses") es un rango de un índice sobre period_num.
+"""
+import re
+from typing import Any, Dict, Optional
+
+PERIOD_PATTERN = re.compile(r"^\d{6}$")
+INVALID_PERIOD_MESSAGE = "Formato de período inválido. Debe ser YYYYMM (ej: 202510)"
+
+
+def validate_period(period: Optional[str]) -> bool:
+    """
+    Valida que el formato del período sea YYYYMM con año y mes válidos
+
+    Args:
+        period: Período a validar
+
+    Returns:
+        True si el formato es válido, False en caso contrario
+    """
+    if not period or not PERIOD_PATTERN.match(period):
+        return False
+
+    year = int(period[:4])
+    month = int(period[4:6])
+    return 2000 <= year <= 2100 and 1 <= month <= 12
+
+
+def period_to_int(period: str) -> int:
+    """
+    Período YYYYMM como entero (period_num)
+
+    Raises:
+        ValueError: Si el período no es válido
+    """
+    if not validate_period(period):
+        raise ValueError(INVALID_PERIOD_MESSAGE)
+    return int(period)
+
+
+def period_range_query(from_period: Optional[str] = None, to_period: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Filtro sobre period_num para un rango de períodos (ambos extremos inclusive)
+
+    Returns:
+        {"period_num": {"$gte": ..., "$lte": ...}} o {} si no hay extremos
+
+    Raises:
+        ValueError: Si algún período no es válido o el rango está invertido
+    """
+    bounds: Dict[str, int] = {}
+    if from_period:
+        bounds["$gte"] = period_to_int(from_period)
+    if to_period:
+        bounds["$lte"] = period_to_int(to_period)
+    if "$gte" in bounds and "$lte" in bounds and bounds["$gte"] > bounds["$lte"]:
+        raise ValueError("Rango de períodos inválido: from_period es posterior a to_period")
+    return {"period_num": bounds} if bounds else {}
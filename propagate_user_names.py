@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Procesar los trabajos pendientes de propagación de nombres (colección propagation_jobs)
+
+La API los procesa en segundo plano; este script permite terminarlos bajo demanda, por ejemplo
+en despliegues serverless o tras una caída. Con --all encola antes a todos los usuarios para
+corregir copias de nombre/nickname desactualizadas en pagos y deudas existentes.
+"""
+import asyncio
+import sys
+from mongodb_config import mongodb_config
+from propagation_service import propagation_service
+
+async def propagate_user_names(enqueue_all: bool = False):
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+
+    try:
+        if enqueue_all:
+            users = await database["users"].find({}, {"name": 1, "nickname": 1}).to_list(length=None)
+            await propagation_service.enqueue_user_renames(users, database=database)
+            print(f"📥 Usuarios encolados: {len(users)}")
+
+        print("🔁 Procesando trabajos de propagación...")
+        completed = await propagation_service.run_pending(database)
+        print(f"✅ Trabajos completados: {completed}")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(propagate_user_names(enqueue_all="--all" in sys.argv))
@@ -0,0 +1,263 @@
+"""
+Propagación de nombres de usuario a pagos y deudas
+
+Los pagos guardan una copia de user_name/user_nickname y las deudas la guardan dentro de
+debtors[]. Cuando un usuario cambia de nombre o nickname se encola un trabajo en la colección
+propagation_jobs y un worker en segundo plano reescribe esas copias por lotes:
+- payments: update_many por _id sobre los pagos del usuario con datos desactualizados
+- debts: update_many con arrayFilters sobre debtors.user_id
+- ledger: un update_many sobre las filas del usuario (una por período)
+
+Los trabajos se toman con un lease (lease_until): si el proceso muere a mitad de camino, el
+lease vence y otro worker (o el mismo al reiniciar) lo retoma. Cada lote solo busca documentos
+que aún tienen el nombre viejo, así que repetir un lote no tiene efecto. Entre lotes se hace una
+pausa para no competir con las requests en curso.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from mongodb_config import mongodb_config
+
+logger = logging.getLogger(__name__)
+
+# Etapas de un trabajo, en orden
+STAGES = ("payments", "debts", "ledger", "done")
+
+
+class PropagationService:
+    def __init__(self):
+        self.collection_name = "propagation_jobs"
+        self.batch_size = int(os.getenv("PROPAGATION_BATCH_SIZE", "200"))
+        self.batch_pause_seconds = int(os.getenv("PROPAGATION_BATCH_PAUSE_MS", "200")) / 1000
+        self.lease_seconds = int(os.getenv("PROPAGATION_LEASE_SECONDS", "60"))
+        self.poll_seconds = int(os.getenv("PROPAGATION_POLL_SECONDS", "30"))
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def enqueue_user_renames(self, users: List[Dict[str, Any]], database=None):
+        """
+        Encolar la propagación del nombre/nickname actual de uno o más usuarios
+
+        Hay un solo trabajo por usuario: un cambio nuevo lo reinicia con los valores más recientes
+        (version cambia, y el worker que lo tenga tomado lo suelta en el siguiente lote).
+
+        Args:
+            users: Documentos de usuario (_id, name, nickname)
+            database: Base de datos (por defecto la conexión compartida)
+        """
+        if not users:
+            return
+        if database is None:
+            database = await mongodb_config.ensure_connected()
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": f"user-names:{user['_id']}"},
+                {
+                    "$set": {
+                        "user_id": str(user["_id"]),
+                        "user_name": user.get("name"),
+                        "user_nickname": user.get("nickname"),
+                        "status": "pending",
+                        "stage": STAGES[0],
+                        "lease_until": None,
+                        "updated_at": now
+                    },
+                    "$inc": {"version": 1},
+                    "$unset": {"finished_at": "", "error": ""},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+            for user in users
+        ]
+        await database[self.collection_name].bulk_write(operations, ordered=False)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim_job(self, database) -> Optional[Dict[str, Any]]:
+        """Tomar un trabajo pendiente o uno cuyo lease venció"""
+        now = datetime.utcnow()
+        return await database[self.collection_name].find_one_and_update(
+            {"$or": [
+                {"status": "pending"},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {"$set": {
+                "status": "running",
+                "worker_id": self.worker_id,
+                "lease_until": now + timedelta(seconds=self.lease_seconds)
+            }},
+            sort=[("updated_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _checkpoint(self, database, job: Dict[str, Any], **fields) -> bool:
+        """
+        Renovar el lease (y guardar el avance) si el trabajo sigue siendo nuestro
+
+        Returns:
+            False si el trabajo fue reencolado o tomado por otro worker
+        """
+        result = await database[self.collection_name].update_one(
+            {"_id": job["_id"], "version": job["version"], "worker_id": self.worker_id},
+            {"$set": {
+                **fields,
+                "lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        return result.matched_count > 0
+
+    def _stale_payments_filter(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "user_id": ObjectId(job["user_id"]),
+            "$or": [
+                {"user_name": {"$ne": job["user_name"]}},
+                {"user_nickname": {"$ne": job["user_nickname"]}}
+            ]
+        }
+
+    def _stale_debts_filter(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {"debtors": {"$elemMatch": {
+            "user_id": job["user_id"],
+            "$or": [
+                {"user_name": {"$ne": job["user_name"]}},
+                {"user_nickname": {"$ne": job["user_nickname"]}}
+            ]
+        }}}
+
+    async def _next_batch(self, collection, query: Dict[str, Any]) -> List[ObjectId]:
+        cursor = collection.find(query, {"_id": 1}).limit(self.batch_size)
+        return [document["_id"] async for document in cursor]
+
+    async def _propagate_payments(self, database, job: Dict[str, Any]) -> Optional[int]:
+        """Reescribir user_name/user_nickname de los pagos del usuario, por lotes"""
+        collection = database["payments"]
+        updated = 0
+        while True:
+            ids = await self._next_batch(collection, self._stale_payments_filter(job))
+            if not ids:
+                return updated
+            result = await collection.update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {"user_name": job["user_name"], "user_nickname": job["user_nickname"]}}
+            )
+            updated += result.modified_count
+            if not await self._checkpoint(database, job):
+                return None
+            await asyncio.sleep(self.batch_pause_seconds)
+
+    async def _propagate_debts(self, database, job: Dict[str, Any]) -> Optional[int]:
+        """Reescribir el nombre del usuario dentro de debtors[] de cada deuda, por lotes"""
+        collection = database["debts"]
+        updated = 0
+        while True:
+            ids = await self._next_batch(collection, self._stale_debts_filter(job))
+            if not ids:
+                return updated
+            result = await collection.update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {
+                    "debtors.$[debtor].user_name": job["user_name"],
+                    "debtors.$[debtor].user_nickname": job["user_nickname"]
+                }},
+                array_filters=[{"debtor.user_id": job["user_id"]}]
+            )
+            updated += result.modified_count
+            if not await self._checkpoint(database, job):
+                return None
+            await asyncio.sleep(self.batch_pause_seconds)
+
+    async def _propagate_ledger(self, database, job: Dict[str, Any]) -> Optional[int]:
+        """Reescribir el nombre del usuario en sus filas del ledger"""
+        result = await database["ledger"].update_many(
+            {"user_id": job["user_id"]},
+            {"$set": {"user_name": job["user_name"], "user_nickname": job["user_nickname"]}}
+        )
+        return result.modified_count
+
+    async def run_job(self, database, job: Dict[str, Any]) -> bool:
+        """
+        Ejecutar un trabajo desde la etapa en que quedó
+
+        Returns:
+            True si terminó; False si se soltó porque fue reencolado con otros valores
+        """
+        handlers = {"payments": self._propagate_payments, "debts": self._propagate_debts, "ledger": self._propagate_ledger}
+        stage = job.get("stage", STAGES[0])
+        while stage != "done":
+            updated = await handlers[stage](database, job)
+            if updated is None:
+                return False
+            stage = STAGES[STAGES.index(stage) + 1]
+            if not await self._checkpoint(database, job, stage=stage):
+                return False
+            logger.info(f"Propagación de nombre de {job['user_id']}: {updated} documentos en la etapa anterior a {stage}")
+
+        result = await database[self.collection_name].update_one(
+            {"_id": job["_id"], "version": job["version"], "worker_id": self.worker_id},
+            {"$set": {"status": "done", "lease_until": None, "finished_at": datetime.utcnow()}}
+        )
+        return result.matched_count > 0
+
+    async def run_pending(self, database) -> int:
+        """Procesar todos los trabajos disponibles; retorna cuántos se completaron"""
+        completed = 0
+        while True:
+            job = await self._claim_job(database)
+            if job is None:
+                return completed
+            try:
+                if await self.run_job(database, job):
+                    completed += 1
+            except Exception as e:
+                # Se deja el lease vencer para reintentar más tarde
+                logger.error(f"Error propagando nombre de {job.get('user_id')}: {e}")
+                await database[self.collection_name].update_one(
+                    {"_id": job["_id"], "version": job["version"]},
+                    {"$set": {"error": str(e)}, "$inc": {"attempts": 1}}
+                )
+                return completed
+
+    async def _run_worker(self):
+        """Procesar trabajos al ser despertado por un encolado o cada poll_seconds"""
+        while True:
+            try:
+                database = await mongodb_config.ensure_connected()
+                await self.run_pending(database)
+            except Exception as e:
+                logger.error(f"Error en el worker de propagación: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start_worker(self):
+        """Iniciar el worker de propagación en segundo plano"""
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.ensure_future(self._run_worker())
+
+    async def stop_worker(self):
+        """Detener el worker (el trabajo en curso se retoma al vencer su lease)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._wakeup = None
+
+# Instancia global del servicio
+propagation_service = PropagationService()
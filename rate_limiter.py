@@ -0,0 +1,239 @@
+"""
+Limitador de tasa para endpoints de autenticación y asistencia
+
+Contadores de ventana deslizante (ventana actual + anterior ponderada) por IP y por usuario,
+configurados por ruta. Por defecto los contadores viven en memoria de cada proceso;
+con RATE_LIMIT_STORE=mongo se comparten entre workers usando la colección rate_limits.
+
+La IP del cliente solo se toma de X-Forwarded-For si TRUSTED_PROXY_HOPS indica cuántos
+proxies propios agregan su salto al header (Vercel: 1); por defecto se usa la IP de la conexión.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from starlette.requests import Request
+
+from auth import verify_token_string
+from mongodb_config import mongodb_config
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitRule:
+    def __init__(self, limit: int, window_seconds: int, per: str = "ip"):
+        """
+        Args:
+            limit: Solicitudes permitidas por ventana
+            window_seconds: Duración de la ventana en segundos
+            per: "ip" o "user" (los usuarios se identifican por token Bearer o cookie de sesión)
+        """
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.per = per
+
+
+# Reglas por (método, ruta)
+DEFAULT_RULES: Dict[Tuple[str, str], List[RateLimitRule]] = {
+    ("POST", "/auth/google"): [RateLimitRule(10, 60, "ip")],
+    ("POST", "/auth/refresh"): [RateLimitRule(30, 60, "ip"), RateLimitRule(10, 60, "user")],
+    ("POST", "/auth/check-session"): [RateLimitRule(30, 60, "ip")],
+    ("GET", "/auth/google/silent"): [RateLimitRule(20, 60, "ip"), RateLimitRule(10, 60, "user")],
+    ("POST", "/asistir"): [RateLimitRule(30, 60, "ip"), RateLimitRule(15, 60, "user")],
+}
+
+
+def _sliding_count(previous: int, current: int, window_start: float, window_seconds: int, now: float) -> float:
+    """Estimar las solicitudes de la última ventana ponderando la ventana anterior"""
+    elapsed = (now - window_start) / window_seconds
+    return previous * (1 - elapsed) + current
+
+
+class MemoryRateLimitStore:
+    def __init__(self, eviction_interval_seconds: int = 60):
+        # clave -> [índice de ventana, contador anterior, contador actual]
+        self.counters: Dict[str, List[int]] = {}
+        self.eviction_interval_seconds = eviction_interval_seconds
+        self._last_eviction = time.monotonic()
+
+    def _evict(self, now: float):
+        """Eliminar contadores que ya no influyen en ninguna ventana"""
+        self._last_eviction = time.monotonic()
+        self.counters = {
+            key: counter for key, counter in self.counters.items()
+            if counter[0] >= int(now // int(key.split(":", 1)[0])) - 1
+        }
+
+    async def hit(self, key: str, rule: RateLimitRule, now: float) -> Tuple[bool, float]:
+        """
+        Registrar una solicitud si cabe en el límite
+
+        Returns:
+            (permitida, solicitudes estimadas en la ventana tras registrarla)
+        """
+        if time.monotonic() - self._last_eviction >= self.eviction_interval_seconds:
+            self._evict(now)
+
+        window = int(now // rule.window_seconds)
+        counter = self.counters.get(key)
+        if counter is None or counter[0] < window - 1:
+            counter = [window, 0, 0]
+        elif counter[0] == window - 1:
+            counter = [window, counter[2], 0]
+        self.counters[key] = counter
+
+        estimated = _sliding_count(counter[1], counter[2], window * rule.window_seconds, rule.window_seconds, now)
+        if estimated + 1 > rule.limit:
+            return False, estimated
+        counter[2] += 1
+        return True, estimated + 1
+
+
+class MongoRateLimitStore:
+    """Contadores compartidos entre workers; cada ventana es un documento con TTL"""
+
+    def __init__(self, collection_name: str = "rate_limits"):
+        self.collection_name = collection_name
+
+    async def hit(self, key: str, rule: RateLimitRule, now: float) -> Tuple[bool, float]:
+        database = await mongodb_config.ensure_connected()
+        collection = database[self.collection_name]
+        window = int(now // rule.window_seconds)
+        window_end = datetime.utcfromtimestamp((window + 1) * rule.window_seconds)
+
+        current = await collection.find_one_and_update(
+            {"_id": f"{key}:{window}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": window_end + timedelta(seconds=rule.window_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previous = await collection.find_one({"_id": f"{key}:{window - 1}"}, {"count": 1})
+
+        estimated = _sliding_count(
+            previous["count"] if previous else 0,
+            current["count"],
+            window * rule.window_seconds,
+            rule.window_seconds,
+            now
+        )
+        return estimated <= rule.limit, estimated
+
+
+def _client_ip(request: Request, trusted_proxy_hops: int = 0) -> str:
+    """
+    IP del cliente
+
+    Args:
+        trusted_proxy_hops: Proxies de confianza delante de la app. Los saltos de la izquierda de
+            X-Forwarded-For los escribe el cliente, así que se toma el salto agregado por el
+            proxy más externo (el N-ésimo desde la derecha); con 0 se ignora el header
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and trusted_proxy_hops > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(trusted_proxy_hops, len(hops))]
+    return request.client.host if request.client else "desconocida"
+
+
+def _user_identity(request: Request) -> Optional[str]:
+    """Identificar al usuario sin consultar la base de datos"""
+    auth_header = request.headers.get("authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        try:
+            return verify_token_string(auth_header.split(" ")[1]).user_id
+        except Exception:
+            pass
+    session_token = request.cookies.get("session_token")
+    if session_token:
+        return "session-" + hashlib.sha256(session_token.encode()).hexdigest()[:24]
+    return None
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI que aplica las reglas y agrega los headers RateLimit-*"""
+
+    def __init__(self, app, rules: Dict[Tuple[str, str], List[RateLimitRule]] = None, store=None,
+                 trusted_proxy_hops: Optional[int] = None):
+        self.app = app
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+        if trusted_proxy_hops is None:
+            trusted_proxy_hops = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+        self.trusted_proxy_hops = trusted_proxy_hops
+        if store is None:
+            store = MongoRateLimitStore() if os.getenv("RATE_LIMIT_STORE", "memory") == "mongo" else MemoryRateLimitStore()
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        rules = self.rules.get((scope["method"], scope["path"]))
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        now = time.time()
+        # Regla más restrictiva: (límite, restantes, segundos hasta el reinicio)
+        tightest = None
+        for rule in rules:
+            identity = _client_ip(request, self.trusted_proxy_hops) if rule.per == "ip" else _user_identity(request)
+            if identity is None:
+                continue
+            key = f"{rule.window_seconds}:{rule.per}:{scope['path']}:{identity}"
+            try:
+                allowed, estimated = await self.store.hit(key, rule, now)
+            except Exception as e:
+                # Si el almacén falla no se bloquean solicitudes
+                logger.error(f"Error en limitador de tasa: {e}")
+                continue
+
+            remaining = max(int(rule.limit - estimated), 0)
+            reset = rule.window_seconds - int(now % rule.window_seconds)
+            if not allowed:
+                await self._reject(send, rule.limit, reset)
+                return
+            if tightest is None or remaining < tightest[1]:
+                tightest = (rule.limit, remaining, reset)
+
+        if tightest is None:
+            await self.app(scope, receive, send)
+            return
+
+        rate_headers = [
+            (b"ratelimit-limit", str(tightest[0]).encode()),
+            (b"ratelimit-remaining", str(tightest[1]).encode()),
+            (b"ratelimit-reset", str(tightest[2]).encode()),
+        ]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + rate_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    async def _reject(self, send, limit: int, reset: int):
+        """Responder 429 con Retry-After"""
+        body = json.dumps({"detail": "Demasiadas solicitudes, intenta nuevamente más tarde"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(reset)).encode()),
+                (b"ratelimit-limit", str(limit).encode()),
+                (b"ratelimit-remaining", b"0"),
+                (b"ratelimit-reset", str(reset).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
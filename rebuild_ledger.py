@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Script para reconstruir la colección ledger desde deudas y pagos
+
+Los cambios de pagos y deudas ya recalculan sus períodos; este script calcula el ledger
+completo (por ejemplo, la primera vez o tras modificar datos a mano). Es idempotente.
+"""
+import asyncio
+from mongodb_config import mongodb_config
+from mongodb_indexes import ensure_indexes
+from ledger_service import ledger_service
+
+async def rebuild_ledger():
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+    
+    try:
+        print("🧱 Verificando índices...")
+        await ensure_indexes(database)
+        
+        removed = await ledger_service.refresh(database)
+        total = await database[ledger_service.collection_name].count_documents({"deleted": {"$ne": True}})
+        print(f"✅ Filas en ledger: {total} ({removed} obsoletas eliminadas)")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_ledger())
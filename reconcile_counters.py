@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Recalcular los contadores de totales (colección counters) desde los datos reales
+
+La API ya los reconcilia periódicamente (COUNTERS_RECONCILE_MINUTES); este script permite
+hacerlo bajo demanda, por ejemplo tras una importación masiva o en despliegues serverless.
+"""
+import asyncio
+from mongodb_config import mongodb_config
+from counters_service import counters_service
+
+async def reconcile_counters():
+    print("🔍 Conectando a MongoDB...")
+    database = await mongodb_config.ensure_connected()
+    
+    try:
+        print("🔢 Reconciliando contadores...")
+        written = await counters_service.reconcile(database)
+        print(f"✅ Contadores actualizados: {written}")
+    finally:
+        await mongodb_config.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_counters())
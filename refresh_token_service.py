@@ -3,9 +3,11 @@ Servicio para manejar refresh tokens en MongoDB
 """
 from typing import Optional
 from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import InsertOne, UpdateMany
 from models import RefreshTokenModel
 from mongodb_config import mongodb_config
-from auth import REFRESH_TOKEN_EXPIRE_DAYS
+from auth import REFRESH_TOKEN_EXPIRE_DAYS, AUTH_INACTIVE_RETENTION_DAYS
 
 class RefreshTokenService:
     def __init__(self):
@@ -19,26 +21,28 @@ class RefreshTokenService:
         """Crear un nuevo refresh token"""
         try:
             collection = await self.get_collection()
-            
-            # Desactivar tokens anteriores del usuario
-            await collection.update_many(
-                {"user_id": user_id, "is_active": True},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
-            )
+            now = datetime.utcnow()
             
             # Crear nuevo token
-            expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+            expires_at = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
             token_data = {
+                "_id": ObjectId(),
                 "user_id": user_id,
                 "token": token,
                 "is_active": True,
                 "expires_at": expires_at,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "created_at": now,
+                "updated_at": now
             }
             
-            result = await collection.insert_one(token_data)
-            token_data["_id"] = result.inserted_id
+            # Desactivar tokens anteriores e insertar el nuevo en un solo round trip (en orden)
+            await collection.bulk_write([
+                UpdateMany(
+                    {"user_id": user_id, "is_active": True},
+                    {"$set": {"is_active": False, "revoked_at": now, "updated_at": now}}
+                ),
+                InsertOne(token_data)
+            ], ordered=True)
             
             return RefreshTokenModel(**token_data)
             
@@ -70,7 +74,7 @@ class RefreshTokenService:
             collection = await self.get_collection()
             result = await collection.update_one(
                 {"token": token, "is_active": True},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+                {"$set": {"is_active": False, "revoked_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
             )
             
             return result.modified_count > 0
@@ -85,7 +89,7 @@ class RefreshTokenService:
             collection = await self.get_collection()
             result = await collection.update_many(
                 {"user_id": user_id, "is_active": True},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+                {"$set": {"is_active": False, "revoked_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
             )
             
             return result.modified_count > 0
@@ -95,13 +99,29 @@ class RefreshTokenService:
             return False
     
     async def cleanup_expired_tokens(self) -> int:
-        """Limpiar tokens expirados"""
+        """
+        Compactar tokens expirados y revocados
+        
+        Los índices TTL mantienen la colección acotada de forma continua; este método
+        limpia el historial acumulado antes de que existieran esos índices.
+        """
         try:
             collection = await self.get_collection()
+            now = datetime.utcnow()
+            retention_limit = now - timedelta(days=AUTH_INACTIVE_RETENTION_DAYS)
             result = await collection.delete_many({
-                "expires_at": {"$lt": datetime.utcnow()}
+                "$or": [
+                    {"expires_at": {"$lt": now}},
+                    {"is_active": False, "updated_at": {"$lt": retention_limit}}
+                ]
             })
             
+            # Tokens revocados antes de existir revoked_at: dejarlos en manos del TTL
+            await collection.update_many(
+                {"is_active": False, "revoked_at": {"$exists": False}},
+                [{"$set": {"revoked_at": "$updated_at"}}]
+            )
+            
             return result.deleted_count
             
         except Exception as e:
@@ -12,6 +12,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Máximo de claves por llamada a DeleteObjects (límite de S3)
+S3_DELETE_BATCH_SIZE = 1000
+
 class S3Service:
     def __init__(self):
         # Configuración de S3 desde variables de entorno
@@ -19,6 +22,8 @@ class S3Service:
         self.aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
         self.aws_region = os.getenv("AWS_REGION", "us-east-1")
         self.bucket_name = os.getenv("S3_BUCKET_NAME")
+        # Endpoint alternativo (opcional): S3 local compatible para desarrollo y pruebas
+        self.endpoint_url = os.getenv("AWS_S3_ENDPOINT_URL") or None
         
         if not all([self.aws_access_key_id, self.aws_secret_access_key, self.bucket_name]):
             raise ValueError("Faltan variables de entorno requeridas para S3: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_BUCKET_NAME")
@@ -28,7 +33,8 @@ class S3Service:
             's3',
             aws_access_key_id=self.aws_access_key_id,
             aws_secret_access_key=self.aws_secret_access_key,
-            region_name=self.aws_region
+            region_name=self.aws_region,
+            endpoint_url=self.endpoint_url
         )
         
         # Verificar que el bucket existe (solo si las credenciales están disponibles)
@@ -147,6 +153,34 @@ class S3Service:
             print(f"Error eliminando archivo {file_key}: {e}")
             return False
     
+    def delete_files(self, file_keys: List[str]) -> Dict[str, str]:
+        """
+        Elimina muchos archivos de S3 con DeleteObjects (lotes de hasta 1000 claves)
+        
+        Args:
+            file_keys: Claves de los archivos en S3
+        
+        Returns:
+            Dict clave -> mensaje de error con los archivos que no se pudieron eliminar
+        """
+        failed = {}
+        keys = list(dict.fromkeys(file_keys))
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            batch = keys[start:start + S3_DELETE_BATCH_SIZE]
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+                )
+            except ClientError as e:
+                print(f"Error eliminando lote de {len(batch)} archivos: {e}")
+                failed.update({key: str(e) for key in batch})
+                continue
+            # Con Quiet solo se informan las claves que fallaron
+            for error in response.get("Errors", []):
+                failed[error["Key"]] = f"{error.get('Code')}: {error.get('Message')}"
+        return failed
+    
     def file_exists(self, file_key: str) -> bool:
         """
         Verifica si un archivo existe en S3
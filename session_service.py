@@ -1,37 +1,145 @@
 """
 Servicio para manejar sesiones con cookies httpOnly
+
+Modos (variable SESSION_MODE):
+- "database" (por defecto): la cookie contiene un token opaco guardado en la colección sessions
+- "stateless": la cookie contiene los claims de la sesión cifrados y autenticados (AES-GCM);
+  MongoDB solo se consulta para verificar revocaciones, con un caché en memoria. El usuario
+  (roles, is_active) se obtiene del directorio de usuarios, con su propia invalidación
 """
+import asyncio
+import base64
+import hashlib
+import json
+import os
 import secrets
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from fastapi import Response
+from pymongo import DESCENDING, InsertOne, ReturnDocument, UpdateMany, UpdateOne
 from models import UserModel
 from mongodb_config import mongodb_config
+from user_directory import user_directory
+from auth import AUTH_INACTIVE_RETENTION_DAYS, SECRET_KEY
+
+# Prefijo de las cookies sin estado (los tokens opacos de token_urlsafe nunca contienen ".")
+STATELESS_TOKEN_PREFIX = "s1."
+
+def _session_cookie_key() -> bytes:
+    """Clave AES-256 para las cookies sin estado (SESSION_COOKIE_SECRET o derivada de JWT_SECRET_KEY)"""
+    secret = os.getenv("SESSION_COOKIE_SECRET") or f"session-cookie:{SECRET_KEY}"
+    return hashlib.sha256(secret.encode()).digest()
 
 class SessionService:
     def __init__(self):
         self.collection_name = "sessions"
+        self.generations_collection_name = "session_generations"
         self.session_cookie_name = "session_token"
         self.session_expire_days = 30
+        self.stateless = os.getenv("SESSION_MODE", "database") == "stateless"
+        # Segundos durante los cuales se confía en la generación cacheada de un usuario
+        self.revocation_cache_seconds = int(os.getenv("SESSION_REVOCATION_CACHE_SECONDS", "30"))
+        # user_id -> (momento de carga, generación vigente)
+        self._revocation_cache: Dict[str, Tuple[float, int]] = {}
+        self._revocation_pruned_at = time.monotonic()
+        self._aesgcm = AESGCM(_session_cookie_key())
+        # Expiración deslizante: como máximo una escritura por sesión cada intervalo
+        self.touch_interval_seconds = int(os.getenv("SESSION_TOUCH_INTERVAL_MINUTES", "5")) * 60
+        self.touch_flush_seconds = int(os.getenv("SESSION_TOUCH_FLUSH_SECONDS", "30"))
+        self._last_touch: Dict[str, float] = {}
+        # Actividad pendiente de escribir: session_token -> último acceso / user_id -> último acceso
+        self._pending_session_touches: Dict[str, datetime] = {}
+        self._pending_user_touches: Dict[str, datetime] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # Escritura inmediata en curso cuando no hay flusher (una sola a la vez)
+        self._inline_flush: Optional[asyncio.Task] = None
     
     async def get_collection(self):
         """Obtener colección de sesiones"""
         return mongodb_config.get_collection(self.collection_name)
     
+    async def get_generations_collection(self):
+        """Obtener colección con la generación de sesión vigente de cada usuario"""
+        database = await mongodb_config.ensure_connected()
+        return database[self.generations_collection_name]
+    
+    def encode_stateless_token(self, claims: dict) -> str:
+        """Cifrar y autenticar los claims de una sesión sin estado"""
+        nonce = os.urandom(12)
+        payload = json.dumps(claims, separators=(",", ":")).encode()
+        sealed = self._aesgcm.encrypt(nonce, payload, STATELESS_TOKEN_PREFIX.encode())
+        return STATELESS_TOKEN_PREFIX + base64.urlsafe_b64encode(nonce + sealed).decode().rstrip("=")
+    
+    def decode_stateless_token(self, session_token: str) -> Optional[dict]:
+        """
+        Descifrar una cookie sin estado
+        
+        Returns:
+            Claims (uid, email, exp, gen) o None si la cookie fue alterada o expiró
+        """
+        if not session_token.startswith(STATELESS_TOKEN_PREFIX):
+            return None
+        try:
+            data = session_token[len(STATELESS_TOKEN_PREFIX):]
+            raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+            payload = self._aesgcm.decrypt(raw[:12], raw[12:], STATELESS_TOKEN_PREFIX.encode())
+            claims = json.loads(payload)
+        except (InvalidTag, ValueError):
+            return None
+        if claims.get("exp", 0) <= time.time():
+            return None
+        return claims
+    
+    async def bump_generation(self, user_id: str) -> int:
+        """Incrementar la generación de sesión de un usuario, invalidando sus cookies anteriores"""
+        collection = await self.get_generations_collection()
+        doc = await collection.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"generation": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._revocation_cache.pop(user_id, None)
+        return doc["generation"]
+    
+    def _remember_generation(self, user_id: str, generation: int):
+        """Cachear la generación de un usuario, descartando antes las entradas vencidas"""
+        now = time.monotonic()
+        if now - self._revocation_pruned_at >= self.revocation_cache_seconds:
+            self._revocation_cache = {
+                cached_id: cached for cached_id, cached in self._revocation_cache.items()
+                if now - cached[0] < self.revocation_cache_seconds
+            }
+            self._revocation_pruned_at = now
+        self._revocation_cache[user_id] = (now, generation)
+    
+    async def _get_cached_generation(self, user_id: str) -> int:
+        """Obtener la generación vigente, consultando MongoDB solo si el caché venció"""
+        cached = self._revocation_cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < self.revocation_cache_seconds:
+            return cached[1]
+        
+        collection = await self.get_generations_collection()
+        doc = await collection.find_one({"_id": user_id}, {"generation": 1})
+        generation = doc["generation"] if doc else 0
+        self._remember_generation(user_id, generation)
+        return generation
+    
     async def create_session(self, user: UserModel) -> str:
         """Crear nueva sesión para un usuario"""
+        if self.stateless:
+            return await self._create_stateless_session(user)
+        
         try:
             collection = await self.get_collection()
-            
-            # Revocar sesiones existentes del usuario
-            await collection.update_many(
-                {"user_id": str(user.id), "is_active": True},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
-            )
+            now = datetime.utcnow()
             
             # Crear nueva sesión
             session_token = secrets.token_urlsafe(32)
-            expires_at = datetime.utcnow() + timedelta(days=self.session_expire_days)
+            expires_at = now + timedelta(days=self.session_expire_days)
             
             session_data = {
                 "session_token": session_token,
@@ -39,19 +147,46 @@ class SessionService:
                 "user_email": user.email,
                 "is_active": True,
                 "expires_at": expires_at,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "created_at": now,
+                "updated_at": now
             }
             
-            await collection.insert_one(session_data)
+            # Revocar sesiones existentes e insertar la nueva en un solo round trip (en orden)
+            await collection.bulk_write([
+                UpdateMany(
+                    {"user_id": str(user.id), "is_active": True},
+                    {"$set": {"is_active": False, "revoked_at": now, "updated_at": now}}
+                ),
+                InsertOne(session_data)
+            ], ordered=True)
             return session_token
             
         except Exception as e:
             print(f"Error al crear sesión: {e}")
             raise e
     
+    async def _create_stateless_session(self, user: UserModel) -> str:
+        """Emitir cookie sin estado; la nueva generación revoca las cookies anteriores del usuario"""
+        try:
+            user_id = str(user.id)
+            generation = await self.bump_generation(user_id)
+            self._remember_generation(user_id, generation)
+            expires_at = time.time() + self.session_expire_days * 24 * 60 * 60
+            return self.encode_stateless_token({
+                "uid": user_id,
+                "email": user.email,
+                "exp": int(expires_at),
+                "gen": generation
+            })
+        except Exception as e:
+            print(f"Error al crear sesión sin estado: {e}")
+            raise e
+    
     async def get_session(self, session_token: str) -> Optional[UserModel]:
         """Obtener usuario por session token"""
+        if session_token.startswith(STATELESS_TOKEN_PREFIX):
+            return await self._get_stateless_session(session_token)
+        
         try:
             collection = await self.get_collection()
             session_data = await collection.find_one({
@@ -63,6 +198,8 @@ class SessionService:
             if not session_data:
                 return None
             
+            self._touch(self._pending_session_touches, session_token)
+            
             # Obtener usuario
             from user_service import user_service
             user = await user_service.get_user_by_email(session_data["user_email"])
@@ -72,13 +209,175 @@ class SessionService:
             print(f"Error al obtener sesión: {e}")
             return None
     
+    async def _get_stateless_session(self, session_token: str) -> Optional[UserModel]:
+        """
+        Validar una cookie sin estado contra la generación vigente (cacheada) del usuario
+        
+        Una revocación tarda como máximo revocation_cache_seconds en verse en otros workers;
+        los roles e is_active vienen del directorio de usuarios, no de este caché.
+        """
+        claims = self.decode_stateless_token(session_token)
+        if not claims:
+            return None
+        try:
+            generation = await self._get_cached_generation(claims["uid"])
+            if claims.get("gen") != generation:
+                return None
+            user = user_directory.get_by_id(claims["uid"])
+            if user is None:
+                from user_service import user_service
+                database = await mongodb_config.ensure_connected()
+                user = await user_service.get_user_by_id(claims["uid"], database=database)
+            if user:
+                self._touch(self._pending_user_touches, claims["uid"])
+            return user
+        except Exception as e:
+            print(f"Error al obtener sesión sin estado: {e}")
+            return None
+    
+    def renew_session_token(self, session_token: str) -> str:
+        """
+        Obtener el valor de cookie con la expiración extendida
+        
+        Las cookies sin estado se vuelven a emitir con un nuevo exp (misma generación);
+        las opacas se mantienen y su expires_at se extiende al registrar la actividad.
+        """
+        claims = self.decode_stateless_token(session_token)
+        if not claims:
+            return session_token
+        claims["exp"] = int(time.time() + self.session_expire_days * 24 * 60 * 60)
+        return self.encode_stateless_token(claims)
+    
+    def _touch(self, pending: Dict[str, datetime], key: str):
+        """Registrar actividad en memoria, como máximo una vez por intervalo para cada sesión"""
+        now = time.monotonic()
+        if now - self._last_touch.get(key, float("-inf")) < self.touch_interval_seconds:
+            return
+        self._last_touch[key] = now
+        pending[key] = datetime.utcnow()
+        
+        # Sin flusher en segundo plano (ej: serverless) se escribe de inmediato, igualmente coalescido;
+        # lo registrado mientras hay una escritura en curso lo escribe la siguiente
+        if self._flusher is None or self._flusher.done():
+            if self._inline_flush is None or self._inline_flush.done():
+                self._inline_flush = asyncio.ensure_future(self.flush_touches())
+                self._inline_flush.add_done_callback(self._log_flush_error)
+    
+    @staticmethod
+    def _log_flush_error(task: asyncio.Task):
+        """Recuperar el error de una escritura inmediata para que no quede sin registrar"""
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error al registrar actividad de sesiones: {task.exception()}")
+    
+    async def flush_touches(self) -> int:
+        """
+        Escribir la actividad pendiente con bulk_write (last_seen_at y expires_at deslizante)
+        
+        Returns:
+            Número de documentos actualizados
+        """
+        sessions, users = self._pending_session_touches, self._pending_user_touches
+        if not sessions and not users:
+            return 0
+        self._pending_session_touches, self._pending_user_touches = {}, {}
+        
+        # Olvidar marcas de sesiones que ya pueden volver a escribirse para acotar la memoria
+        cutoff = time.monotonic() - self.touch_interval_seconds
+        self._last_touch = {key: touched for key, touched in self._last_touch.items() if touched > cutoff}
+        
+        modified = 0
+        try:
+            if sessions:
+                collection = await self.get_collection()
+                result = await collection.bulk_write([
+                    UpdateOne(
+                        {"session_token": session_token, "is_active": True},
+                        {"$set": {
+                            "last_seen_at": seen,
+                            "expires_at": seen + timedelta(days=self.session_expire_days)
+                        }}
+                    )
+                    for session_token, seen in sessions.items()
+                ], ordered=False)
+                modified += result.modified_count
+            if users:
+                collection = await self.get_generations_collection()
+                result = await collection.bulk_write([
+                    UpdateOne({"_id": user_id}, {"$set": {"last_seen_at": seen}})
+                    for user_id, seen in users.items()
+                ], ordered=False)
+                modified += result.modified_count
+        except Exception as e:
+            print(f"Error al registrar actividad de sesiones: {e}")
+            # Reencolar sin pisar actividad más reciente
+            for session_token, seen in sessions.items():
+                self._pending_session_touches.setdefault(session_token, seen)
+            for user_id, seen in users.items():
+                self._pending_user_touches.setdefault(user_id, seen)
+        return modified
+    
+    async def _run_touch_flusher(self):
+        """Vaciar periódicamente el buffer de actividad"""
+        while True:
+            await asyncio.sleep(self.touch_flush_seconds)
+            await self.flush_touches()
+    
+    def start_touch_flusher(self):
+        """Iniciar el flusher de actividad en segundo plano"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run_touch_flusher())
+    
+    async def stop_touch_flusher(self):
+        """Detener el flusher y escribir la actividad pendiente"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self._inline_flush is not None and not self._inline_flush.done():
+            await asyncio.wait([self._inline_flush])
+        await self.flush_touches()
+    
+    async def get_recent_activity(self, limit: int = 100) -> List[dict]:
+        """
+        Obtener las sesiones activas ordenadas por último acceso
+        
+        Args:
+            limit: Número máximo de sesiones a retornar
+        """
+        await self.flush_touches()
+        
+        if self.stateless:
+            collection = await self.get_generations_collection()
+            cursor = collection.find(
+                {"last_seen_at": {"$exists": True}},
+                {"last_seen_at": 1}
+            ).sort("last_seen_at", DESCENDING).limit(limit)
+            return [
+                {"user_id": doc["_id"], "last_seen_at": doc["last_seen_at"]}
+                async for doc in cursor
+            ]
+        
+        collection = await self.get_collection()
+        cursor = collection.find(
+            {"is_active": True, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "user_id": 1, "user_email": 1, "last_seen_at": 1, "created_at": 1, "expires_at": 1}
+        ).sort([("last_seen_at", DESCENDING), ("created_at", DESCENDING)]).limit(limit)
+        return [doc async for doc in cursor]
+    
     async def revoke_session(self, session_token: str) -> bool:
         """Revocar una sesión específica"""
+        if session_token.startswith(STATELESS_TOKEN_PREFIX):
+            claims = self.decode_stateless_token(session_token)
+            return bool(claims) and await self.revoke_user_sessions(claims["uid"])
+        
         try:
             collection = await self.get_collection()
             result = await collection.update_one(
                 {"session_token": session_token, "is_active": True},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+                {"$set": {"is_active": False, "revoked_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
             )
             
             return result.modified_count > 0
@@ -90,13 +389,16 @@ class SessionService:
     async def revoke_user_sessions(self, user_id: str) -> bool:
         """Revocar todas las sesiones de un usuario"""
         try:
+            # También invalida cookies sin estado emitidas antes de un cambio de SESSION_MODE
+            await self.bump_generation(user_id)
+            
             collection = await self.get_collection()
             result = await collection.update_many(
                 {"user_id": user_id, "is_active": True},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+                {"$set": {"is_active": False, "revoked_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
             )
             
-            return result.modified_count > 0
+            return self.stateless or result.modified_count > 0
             
         except Exception as e:
             print(f"Error al revocar sesiones del usuario: {e}")
@@ -177,13 +479,29 @@ class SessionService:
         print(f"=== DEBUG: Cookie eliminada exitosamente ===")
     
     async def cleanup_expired_sessions(self) -> int:
-        """Limpiar sesiones expiradas"""
+        """
+        Compactar sesiones expiradas y revocadas
+        
+        Los índices TTL mantienen la colección acotada de forma continua; este método
+        limpia el historial acumulado antes de que existieran esos índices.
+        """
         try:
             collection = await self.get_collection()
+            now = datetime.utcnow()
+            retention_limit = now - timedelta(days=AUTH_INACTIVE_RETENTION_DAYS)
             result = await collection.delete_many({
-                "expires_at": {"$lt": datetime.utcnow()}
+                "$or": [
+                    {"expires_at": {"$lt": now}},
+                    {"is_active": False, "updated_at": {"$lt": retention_limit}}
+                ]
             })
             
+            # Sesiones revocadas antes de existir revoked_at: dejarlas en manos del TTL
+            await collection.update_many(
+                {"is_active": False, "revoked_at": {"$exists": False}},
+                [{"$set": {"revoked_at": "$updated_at"}}]
+            )
+            
             return result.deleted_count
             
         except Exception as e:
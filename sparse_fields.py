@@ -0,0 +1,106 @@
+"""
+Selección de campos (fields=) para endpoints de listado
+
+Traduce la lista de campos pedida por el cliente a una proyección de MongoDB y serializa
+los documentos directamente a JSON, sin construir ni validar los modelos Pydantic completos.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+
+# Campo de la respuesta -> campo en MongoDB
+PAYMENT_FIELDS: Dict[str, str] = {
+    "id": "_id",
+    "user_id": "user_id",
+    "user_name": "user_name",
+    "user_nickname": "user_nickname",
+    "amount": "amount",
+    "period": "period",
+    "payment_date": "payment_date",
+    "receipt_image_url": "receipt_image_url",
+    "status": "status",
+    "notes": "notes",
+    "verified_by": "verified_by",
+    "verified_at": "verified_at",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+USER_FIELDS: Dict[str, str] = {
+    "_id": "_id",
+    "id": "_id",
+    "google_id": "google_id",
+    "email": "email",
+    "name": "name",
+    "picture": "picture",
+    "nickname": "nickname",
+    "roles": "roles",
+    "tipo_eventos": "tipo_eventos",
+    "is_active": "is_active",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+ATTENDANCE_FIELDS: Dict[str, str] = {
+    "_id": "_id",
+    "id": "_id",
+    "event_id": "event_id",
+    "attendees": "attendees",
+    "non_attendees": "non_attendees",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+
+def parse_fields(fields: Optional[str], allowed: Dict[str, str]) -> Optional[List[str]]:
+    """
+    Validar el parámetro fields (lista separada por comas)
+
+    Returns:
+        Lista de campos, o None si no se pidió selección
+
+    Raises:
+        ValueError: Si algún campo no existe
+    """
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in allowed]
+    if unknown:
+        raise ValueError(f"Campos no válidos: {', '.join(unknown)}. Disponibles: {', '.join(allowed)}")
+    return selected
+
+
+def build_projection(fields: List[str], allowed: Dict[str, str], extra: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Proyección de MongoDB para los campos pedidos
+
+    Args:
+        fields: Campos de la respuesta
+        allowed: Mapa campo de respuesta -> campo en MongoDB
+        extra: Campos adicionales necesarios internamente (ej: clave del cursor)
+    """
+    projection = {allowed[field]: 1 for field in fields}
+    for field in extra or []:
+        projection[field] = 1
+    return projection
+
+
+def _to_json_value(value: Any) -> Any:
+    """Convertir tipos BSON a valores serializables en JSON"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_to_json_value(item) for item in value]
+    return value
+
+
+def serialize_documents(documents: List[Dict[str, Any]], fields: List[str], allowed: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Construir la respuesta con solo los campos pedidos (los ausentes se devuelven como null)"""
+    return [
+        {field: _to_json_value(document.get(allowed[field])) for field in fields}
+        for document in documents
+    ]
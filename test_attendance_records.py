@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Pruebas del registro normalizado de asistencias (attendance_records)
+"""
+import asyncio
+import sys
+import os
+from datetime import datetime
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import attendance_records as attendance_records_module
+from attendance_records import AttendanceRecordsService
+
+EVENT_START = datetime(2025, 10, 20, 23, 0)
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        return self
+
+    def limit(self, count):
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Collection:
+    def __init__(self, documents=None):
+        self.documents = documents or []
+        self.calls = []
+
+    async def find_one(self, query, projection=None):
+        self.calls.append(("find_one", query))
+        return {"start_at": EVENT_START}
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query, update, upsert))
+
+    def find(self, query, projection=None):
+        self.calls.append(("find", query))
+        return _Cursor([dict(document) for document in self.documents])
+
+
+class _Database(dict):
+    def __missing__(self, name):
+        self[name] = _Collection()
+        return self[name]
+
+
+def _patch_connection(database):
+    class _Config:
+        async def ensure_connected(self):
+            return database
+    original = attendance_records_module.mongodb_config
+    attendance_records_module.mongodb_config = _Config()
+    return original
+
+
+def test_record_upserts_with_event_start():
+    """Cada respuesta es un upsert por (event_id, user_name) con la fecha del evento"""
+    database = _Database()
+    asyncio.run(AttendanceRecordsService().record(database, "evt1", "Pepe", will_attend=False))
+
+    _, query, update, upsert = database["attendance_records"].calls[0]
+    assert query == {"event_id": "evt1", "user_name": "Pepe"} and upsert
+    assert update["$set"]["status"] == "no_asiste"
+    assert update["$set"]["event_start"] == EVENT_START
+    assert database["calendar_events"].calls[0] == ("find_one", {"google_event_id": "evt1"})
+
+
+def test_statuses_prefer_attending():
+    """Si respondió con nombre y con nickname, prevalece "asiste"; una sola consulta"""
+    database = _Database()
+    database["attendance_records"] = _Collection([
+        {"event_id": "evt1", "status": "asiste"},
+        {"event_id": "evt1", "status": "no_asiste"},
+        {"event_id": "evt2", "status": "no_asiste"},
+    ])
+    original = _patch_connection(database)
+    try:
+        statuses = asyncio.run(AttendanceRecordsService().get_statuses(["evt1", "evt2"], ["Pepe", "José", ""]))
+    finally:
+        attendance_records_module.mongodb_config = original
+
+    assert statuses == {"evt1": "asiste", "evt2": "no_asiste"}
+    assert database["attendance_records"].calls == [
+        ("find", {"event_id": {"$in": ["evt1", "evt2"]}, "user_name": {"$in": ["Pepe", "José"]}})
+    ]
+
+
+def test_user_attendances_filter_by_event_date():
+    """El rango de fechas se aplica sobre event_start y se agrega el título del evento"""
+    database = _Database()
+    database["attendance_records"] = _Collection([{"event_id": "evt1", "user_name": "Pepe", "status": "asiste", "event_start": EVENT_START}])
+    database["calendar_events"] = _Collection([{"google_event_id": "evt1", "summary": "Partido"}])
+    original = _patch_connection(database)
+    try:
+        records = asyncio.run(AttendanceRecordsService().get_user_attendances(
+            ["Pepe"], date_from=datetime(2025, 10, 1), date_to=datetime(2025, 11, 1), status="asiste"
+        ))
+    finally:
+        attendance_records_module.mongodb_config = original
+
+    assert database["attendance_records"].calls[0] == ("find", {
+        "user_name": {"$in": ["Pepe"]},
+        "event_start": {"$gte": datetime(2025, 10, 1), "$lt": datetime(2025, 11, 1)},
+        "status": "asiste"
+    })
+    assert records[0]["summary"] == "Partido"
+
+
+if __name__ == "__main__":
+    print("🧪 Probando registro de asistencias...")
+    test_record_upserts_with_event_start()
+    test_statuses_prefer_attending()
+    test_user_attendances_filter_by_event_date()
+    print("✅ Pruebas completadas!")
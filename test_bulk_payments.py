@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las operaciones masivas sobre pagos (verificación y eliminación por lotes)
+"""
+import asyncio
+import sys
+import os
+
+import boto3
+from botocore.stub import Stubber
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from payment_service import PaymentService
+from s3_service import s3_service
+
+ADMIN_ID = str(ObjectId())
+USER_ID = ObjectId()
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class _Result:
+    def __init__(self, modified=0):
+        self.modified_count = modified
+
+
+class _DeleteResult:
+    def __init__(self, deleted=0):
+        self.deleted_count = deleted
+
+
+class _PaymentsCollection:
+    def __init__(self, payments):
+        self.payments = {payment["_id"]: payment for payment in payments}
+        self.calls = []
+
+    def find(self, query, projection=None):
+        self.calls.append("find")
+        return _Cursor([
+            {field: self.payments[_id][field] for field in ("_id", *projection) if field in self.payments[_id]}
+            for _id in query["_id"]["$in"] if _id in self.payments
+        ])
+
+    async def update_many(self, query, update):
+        self.calls.append("update_many")
+        modified = 0
+        for _id in query["_id"]["$in"]:
+            payment = self.payments[_id]
+            if any(payment.get(field) != value for field, value in update["$set"].items()):
+                payment.update(update["$set"])
+                modified += 1
+        return _Result(modified)
+
+    async def delete_many(self, query):
+        self.calls.append("delete_many")
+        deleted = [self.payments.pop(_id) for _id in query["_id"]["$in"] if _id in self.payments]
+        return _DeleteResult(len(deleted))
+
+
+class _CountersCollection:
+    def __init__(self):
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.append(operations)
+
+
+class _Database:
+    def __init__(self, payments):
+        self.payments = _PaymentsCollection(payments)
+        self.counters = _CountersCollection()
+        self.payment_rollups = _CountersCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def _payment(status="pending", period="202510", receipt_image_key=None):
+    payment = {"_id": ObjectId(), "user_id": USER_ID, "period": period, "status": status, "amount": 1000.0}
+    if receipt_image_key:
+        payment["receipt_image_key"] = receipt_image_key
+    return payment
+
+
+def _stubbed_s3():
+    """Cliente S3 local: botocore valida cada llamada contra el modelo de la API sin red"""
+    client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    return client, Stubber(client)
+
+
+def test_bulk_verify_uses_one_query_and_one_update():
+    """Una consulta y un update_many para todos los IDs; los contadores en un solo bulk_write"""
+    payments = [_payment() for _ in range(3)] + [_payment(status="verified")]
+    database = _Database(payments)
+    missing_id = str(ObjectId())
+    payment_ids = [str(payment["_id"]) for payment in payments] + [missing_id, "no-es-un-id"]
+
+    result = asyncio.run(PaymentService(database).bulk_verify_payments(payment_ids, ADMIN_ID, "verified", "ok"))
+
+    assert database.payments.calls == ["find", "update_many"]
+    assert result["verified"] == 4
+    # Solo el ID válido que no existe: el inválido se informa en errors
+    assert result["not_found"] == 1
+    assert len(result["errors"]) == 1 and "no-es-un-id" in result["errors"][0]
+    assert all(payment["status"] == "verified" for payment in database.payments.payments.values())
+
+    # Tres pagos pasan de pending a verified: un solo bulk_write con los deltas sumados
+    assert len(database.counters.operations) == 1
+    deltas = {op._filter["_id"]: op._doc["$inc"]["count"] for op in database.counters.operations[0]}
+    assert deltas == {
+        "payments:status=pending": -3,
+        "payments:status=verified": 3,
+        "payments:period=202510,status=pending": -3,
+        "payments:period=202510,status=verified": 3,
+    }
+
+
+def test_bulk_verify_without_matches_skips_update():
+    """Si ningún pago existe no se ejecuta el update_many"""
+    database = _Database([])
+
+    result = asyncio.run(PaymentService(database).bulk_verify_payments([str(ObjectId())], ADMIN_ID, "rejected"))
+
+    assert result == {"verified": 0, "not_found": 1, "errors": []}
+    assert database.payments.calls == ["find"]
+    assert database.counters.operations == []
+
+
+def test_bulk_verify_counts_duplicates_once():
+    """IDs repetidos e inválidos no inflan not_found"""
+    payment = _payment()
+    database = _Database([payment])
+    payment_ids = [str(payment["_id"]), str(payment["_id"]), "no-es-un-id"]
+
+    result = asyncio.run(PaymentService(database).bulk_verify_payments(payment_ids, ADMIN_ID, "verified"))
+
+    assert result["verified"] == 1
+    assert result["not_found"] == 0
+    assert len(result["errors"]) == 1
+
+
+def test_bulk_delete_batches_s3_and_reports_failures():
+    """Un delete_many, DeleteObjects en lotes de 1000 y los comprobantes que fallan como errores"""
+    payments = [_payment(receipt_image_key=f"payment-receipts/{USER_ID}/{i}.jpg") for i in range(1001)]
+    payments.append(_payment(status="verified"))
+    database = _Database(payments)
+    payment_ids = [str(payment["_id"]) for payment in payments] + [str(ObjectId())]
+    keys = [payment["receipt_image_key"] for payment in payments[:1001]]
+
+    client, stubber = _stubbed_s3()
+    stubber.add_response(
+        "delete_objects",
+        {"Errors": [{"Key": keys[5], "Code": "AccessDenied", "Message": "Access Denied"}]},
+        {"Bucket": s3_service.bucket_name, "Delete": {"Objects": [{"Key": key} for key in keys[:1000]], "Quiet": True}}
+    )
+    stubber.add_response(
+        "delete_objects",
+        {},
+        {"Bucket": s3_service.bucket_name, "Delete": {"Objects": [{"Key": keys[1000]}], "Quiet": True}}
+    )
+
+    original = s3_service.s3_client
+    s3_service.s3_client = client
+    try:
+        with stubber:
+            result = asyncio.run(PaymentService(database).bulk_delete_payments(payment_ids))
+        stubber.assert_no_pending_responses()
+    finally:
+        s3_service.s3_client = original
+
+    assert database.payments.calls == ["find", "delete_many"]
+    assert database.payments.payments == {}
+    assert result["deleted"] == 1002
+    assert result["not_found"] == 1
+    assert result["errors"] == [f"Error eliminando archivo de S3 para pago {payments[5]['_id']}: AccessDenied: Access Denied"]
+    deltas = {op._filter["_id"]: op._doc["$inc"]["count"] for op in database.counters.operations[0]}
+    assert deltas["payments:status=pending"] == -1001
+    assert deltas["payments:status=verified"] == -1
+
+
+def test_bulk_delete_counts_duplicates_once():
+    """IDs repetidos e inválidos no inflan not_found al eliminar"""
+    payment = _payment()
+    database = _Database([payment])
+    payment_ids = [str(payment["_id"]), str(payment["_id"]), "no-es-un-id", str(ObjectId())]
+
+    result = asyncio.run(PaymentService(database).bulk_delete_payments(payment_ids))
+
+    assert result["deleted"] == 1
+    assert result["not_found"] == 1
+    assert len(result["errors"]) == 1 and "no-es-un-id" in result["errors"][0]
+
+
+def test_bulk_delete_reports_failed_s3_batch():
+    """Si falla un lote completo de S3 los pagos se eliminan igual y se informa cada comprobante"""
+    payments = [_payment(receipt_image_key=f"payment-receipts/{USER_ID}/{i}.jpg") for i in range(2)]
+    database = _Database(payments)
+
+    client, stubber = _stubbed_s3()
+    stubber.add_client_error("delete_objects", service_error_code="InternalError", http_status_code=500)
+
+    original = s3_service.s3_client
+    s3_service.s3_client = client
+    try:
+        with stubber:
+            result = asyncio.run(PaymentService(database).bulk_delete_payments([str(p["_id"]) for p in payments]))
+    finally:
+        s3_service.s3_client = original
+
+    assert result["deleted"] == 2
+    assert len(result["errors"]) == 2
+
+
+if __name__ == "__main__":
+    print("🧪 Probando operaciones masivas sobre pagos...")
+    test_bulk_verify_uses_one_query_and_one_update()
+    test_bulk_verify_without_matches_skips_update()
+    test_bulk_verify_counts_duplicates_once()
+    test_bulk_delete_batches_s3_and_reports_failures()
+    test_bulk_delete_reports_failed_s3_batch()
+    test_bulk_delete_counts_duplicates_once()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los ajustes incrementales de los contadores de totales
+"""
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from counters_service import CountersService
+
+USER_ID = ObjectId()
+
+
+class _RecordingDatabase:
+    """Base de datos mínima que registra los bulk_write sobre counters"""
+    def __init__(self):
+        self.operations = []
+
+    def __getitem__(self, name):
+        database = self
+
+        class _Collection:
+            async def bulk_write(self, operations, ordered=True):
+                database.operations.extend(operations)
+
+        return _Collection()
+
+
+def _deltas(before, after) -> dict:
+    database = _RecordingDatabase()
+    asyncio.run(CountersService().track_change(database, "payments", before, after))
+    return {op._filter["_id"]: op._doc["$inc"]["count"] for op in database.operations}
+
+
+def _payment(**overrides) -> dict:
+    payment = {"_id": ObjectId(), "user_id": USER_ID, "period": "202510", "status": "pending"}
+    payment.update(overrides)
+    return payment
+
+
+def test_insert_and_delete_adjust_every_filter():
+    """Insertar suma 1 en cada filtro del documento y eliminar resta 1"""
+    inserted = _deltas(None, _payment())
+    assert inserted == {
+        f"payments:user_id={USER_ID}": 1,
+        f"payments:period=202510,user_id={USER_ID}": 1,
+        "payments:period=202510": 1,
+        "payments:status=pending": 1,
+        "payments:period=202510,status=pending": 1,
+    }
+    assert set(_deltas(_payment(), None).values()) == {-1}
+
+
+def test_status_change_only_touches_status_filters():
+    """Verificar un pago mueve solo los contadores por estado"""
+    payment = _payment()
+    deltas = _deltas(payment, {**payment, "status": "verified"})
+    assert deltas == {
+        "payments:status=pending": -1,
+        "payments:period=202510,status=pending": -1,
+        "payments:status=verified": 1,
+        "payments:period=202510,status=verified": 1,
+    }
+    assert _deltas(payment, {**payment, "notes": "ok"}) == {}
+
+
+class _CountersCollection:
+    """Colección counters en memoria: $setOnInsert, $inc sin upsert y el pipeline que completa la siembra"""
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one(self, query, projection=None):
+        return self.documents.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        document = self.documents.get(query["_id"])
+        if document is None:
+            self.documents[query["_id"]] = dict(update["$setOnInsert"])
+            return type("Result", (), {"upserted_id": query["_id"]})()
+        if isinstance(update, list) and document.get("seeding") == query.get("seeding"):
+            document["count"] = update[0]["$set"]["count"]["$add"][0] + document["changes"]
+            for field in update[1]["$unset"]:
+                document.pop(field, None)
+        return type("Result", (), {"upserted_id": None})()
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            document = self.documents.get(operation._filter["_id"])
+            if document is not None:
+                for field, delta in operation._doc["$inc"].items():
+                    document[field] = document.get(field, 0) + delta
+
+
+def test_seed_keeps_changes_made_while_counting():
+    """Un pago creado mientras se cuenta para sembrar el contador no se pierde"""
+    service = CountersService()
+    counters = _CountersCollection()
+
+    class _Database:
+        def __getitem__(self, name):
+            return counters
+
+    database = _Database()
+
+    class _Payments:
+        name = "payments"
+
+        def __init__(self):
+            self.database = database
+
+        async def count_documents(self, query):
+            # Otro request inserta un pago después de que el conteo ya leyó los 5 existentes
+            await service.track_change(database, "payments", None, _payment())
+            return 5
+
+    total = asyncio.run(service.count(_Payments(), {"status": "pending"}))
+
+    assert total == 5
+    assert counters.documents["payments:status=pending"] == {"count": 6}
+    # Ya sembrado: el total sale del contador sin volver a contar
+    assert asyncio.run(service.count(_Payments(), {"status": "pending"})) == 6
+
+
+def test_tracked_query_keys():
+    """Solo los filtros de igualdad conocidos usan contadores"""
+    service = CountersService()
+    assert service._tracked_query_key("payments", {"status": "pending", "period": "202510"}) == "payments:period=202510,status=pending"
+    assert service._tracked_query_key("payments", {"status": {"$in": ["pending"]}}) is None
+    assert service._tracked_query_key("payments", {"amount": 100}) is None
+    assert service._tracked_query_key("users", {"email": "a@b.cl"}) is None
+
+
+if __name__ == "__main__":
+    print("🧪 Probando contadores incrementales...")
+    test_insert_and_delete_adjust_every_filter()
+    test_status_change_only_touches_status_filters()
+    test_seed_keeps_changes_made_while_counting()
+    test_tracked_query_keys()
+    print("✅ Pruebas completadas!")
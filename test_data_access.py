@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las escrituras que devuelven el documento sin volver a leerlo
+"""
+import asyncio
+import sys
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from data_access import insert_and_return, set_and_return
+from debt_service import DebtService
+from models import DebtCreateRequest, DebtorInfo
+
+
+class _Collection:
+    """Colección que registra las operaciones; find_one no debe usarse tras escribir"""
+    def __init__(self, document=None):
+        self.document = document
+        self.calls = []
+
+    async def insert_one(self, document):
+        self.calls.append("insert_one")
+        return type("Result", (), {"inserted_id": ObjectId()})()
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.calls.append(("find_one_and_update", upsert, return_document))
+        if self.document is None and not upsert:
+            return None
+        document = dict(self.document or {"_id": ObjectId(), **update.get("$setOnInsert", {})})
+        document.update(update["$set"])
+        return document
+
+    async def find_one(self, query, projection=None):
+        raise AssertionError("No se debe volver a leer el documento escrito")
+
+
+def test_insert_returns_document_with_id():
+    """El documento insertado es el resultado, con su _id"""
+    collection = _Collection()
+    document = asyncio.run(insert_and_return(collection, {"name": "Pelota"}))
+
+    assert isinstance(document["_id"], ObjectId) and document["name"] == "Pelota"
+    assert collection.calls == ["insert_one"]
+
+
+def test_set_returns_updated_document_or_none():
+    """Una sola operación con ReturnDocument.AFTER; None si el documento no existe"""
+    collection = _Collection({"_id": ObjectId(), "name": "Pelota"})
+    document = asyncio.run(set_and_return(collection, {"_id": collection.document["_id"]}, {"name": "Red"}))
+
+    assert document["name"] == "Red"
+    assert collection.calls == [("find_one_and_update", False, ReturnDocument.AFTER)]
+    assert asyncio.run(set_and_return(_Collection(), {"_id": ObjectId()}, {"name": "Red"})) is None
+
+
+def test_create_debt_is_a_single_upsert():
+    """Crear o reemplazar la deuda de un período es un solo upsert que devuelve el resultado"""
+    collection = _Collection()
+    database = type("Database", (), {"debts": collection, "__getitem__": lambda self, name: _Collection()})()
+    debt_data = DebtCreateRequest(period="202510", debtors=[DebtorInfo(user_id="u1", user_name="Pepe", amount=15000.0)])
+
+    debt = asyncio.run(DebtService(database).create_debt(debt_data))
+
+    assert collection.calls == [("find_one_and_update", True, ReturnDocument.AFTER)]
+    assert debt.period == "202510" and debt.total_debt == 15000.0
+    assert isinstance(debt.created_at, datetime)
+
+
+if __name__ == "__main__":
+    print("🧪 Probando escrituras sin relectura...")
+    test_insert_returns_document_with_id()
+    test_set_returns_updated_document_or_none()
+    test_create_debt_is_a_single_upsert()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Pruebas del feed de eventos por tipo de evento (/me/eventos)
+"""
+import asyncio
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from event_feed import EventFeedService, classify_event_type, mirror_document, parse_event_start
+
+KEYWORDS = {"futbol": ["partido", "pichanga"], "voley": ["voley"]}
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        self.documents.sort(key=lambda document: document[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _EventsCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        types = query["tipo_evento"]["$in"]
+        start_at = query["start_at"]
+        return _Cursor([
+            dict(document) for document in self.documents
+            if document["tipo_evento"] in types and start_at["$gte"] <= document["start_at"] < start_at["$lt"]
+        ])
+
+
+def _service(collection) -> EventFeedService:
+    service = EventFeedService()
+
+    async def get_collection():
+        return collection
+
+    service._get_collection = get_collection
+    return service
+
+
+def _event(event_id, summary, days, description=""):
+    start = (datetime.utcnow() + timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {"id": event_id, "summary": summary, "description": description, "start": {"dateTime": start},
+            "end": {"dateTime": start}, "status": "confirmed", "htmlLink": "https://calendar"}
+
+
+def test_classify_event_type():
+    """Etiqueta en la descripción, luego palabras clave del título, luego general"""
+    assert classify_event_type("Partido vs Los Tigres", "#tipo: Vóley", KEYWORDS) == "voley"
+    assert classify_event_type("PICHANGA jueves", "", KEYWORDS) == "futbol"
+    assert classify_event_type("Asado fin de temporada", "", KEYWORDS) == "general"
+
+
+def test_parse_event_start_to_utc():
+    """Las fechas con zona horaria se guardan en UTC y los eventos de todo el día a medianoche"""
+    assert parse_event_start({"dateTime": "2025-10-20T20:00:00-03:00"}) == datetime(2025, 10, 20, 23, 0)
+    assert parse_event_start({"dateTime": "2025-01-15T20:00:00", "timeZone": "America/Santiago"}) == datetime(2025, 1, 15, 23, 0)
+    assert parse_event_start({"date": "2025-10-20"}) == datetime(2025, 10, 20)
+    assert parse_event_start({}) is None
+
+
+def test_feed_is_cached_per_type_set():
+    """Usuarios con los mismos tipos comparten la entrada de caché; se incluyen los generales"""
+    documents = [
+        mirror_document(_event("e1", "Partido", 1), "primary", "futbol"),
+        mirror_document(_event("e2", "Asado", 2), "primary"),
+        mirror_document(_event("e3", "Voley playa", 3), "primary", "voley"),
+        mirror_document(_event("e4", "Partido pasado", -3), "primary", "futbol"),
+    ]
+    collection = _EventsCollection(documents)
+    service = _service(collection)
+
+    async def run():
+        first = await service.get_events_for_types(["Fútbol"])
+        second = await service.get_events_for_types(["futbol", "futbol"])
+        other = await service.get_events_for_types(["voley"])
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert [event["id"] for event in first] == ["e1", "e2"]
+    assert second == first
+    assert [event["id"] for event in other] == ["e2", "e3"]
+    assert len(collection.queries) == 2
+    assert collection.queries[0]["tipo_evento"] == {"$in": ["futbol", "general"]}
+
+    service.invalidate()
+    asyncio.run(service.get_events_for_types(["futbol"]))
+    assert len(collection.queries) == 3
+
+    # days_ahead y limit se aplican sobre la misma entrada, sin nuevas consultas
+    async def sliced():
+        return (
+            await service.get_events_for_types(["futbol"], days_ahead=1, limit=100),
+            await service.get_events_for_types(["futbol"], days_ahead=90, limit=1),
+        )
+
+    near, limited = asyncio.run(sliced())
+    assert [event["id"] for event in near] == ["e1"]
+    assert [event["id"] for event in limited] == ["e1"] and len(first) == 2
+    assert len(collection.queries) == 3 and len(service._cache) == 1
+
+
+def test_feed_cache_is_bounded():
+    """La caché desaloja el conjunto de tipos usado hace más tiempo"""
+    collection = _EventsCollection([])
+    service = _service(collection)
+    service.cache_max_entries = 2
+
+    async def run():
+        for types in (["futbol"], ["voley"], ["basket"]):
+            await service.get_events_for_types(types)
+
+    asyncio.run(run())
+    assert list(service._cache) == [("general", "voley"), ("basket", "general")]
+
+
+if __name__ == "__main__":
+    print("🧪 Probando feed de eventos...")
+    test_classify_event_type()
+    test_parse_event_start_to_utc()
+    test_feed_is_cached_per_type_set()
+    test_feed_cache_is_bounded()
+    print("✅ Pruebas completadas!")
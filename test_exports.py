@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la exportación en streaming (CSV/NDJSON) de pagos y deudas
+"""
+import asyncio
+import csv
+import io
+import json
+import sys
+import os
+from datetime import datetime
+
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import exports
+from exports import stream_rows, validate_export_format
+
+COLUMNS = {"id": "_id", "user_name": "user_name", "amount": "amount", "created_at": "created_at", "notes": "notes"}
+
+
+class _Cursor:
+    """Cursor asíncrono que cuenta cuántos documentos se leyeron"""
+    def __init__(self, documents):
+        self.documents = documents
+        self.read = 0
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            document = next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+        self.read += 1
+        return document
+
+
+def _documents(count):
+    return [
+        {"_id": ObjectId(), "user_name": "José, \"Pepe\"", "amount": 15000.0, "created_at": datetime(2025, 10, 1), "notes": None}
+        for _ in range(count)
+    ]
+
+
+def _collect(cursor, export_format):
+    async def run():
+        chunks = []
+        async for chunk in stream_rows(cursor, COLUMNS, export_format):
+            # Cada bloque se produce sin haber leído todo el cursor
+            chunks.append((chunk, cursor.read))
+        return chunks
+    return asyncio.run(run())
+
+
+def test_csv_streams_in_batches():
+    """CSV con encabezado, valores escapados y un bloque por cada EXPORT_BATCH_SIZE filas"""
+    original = exports.EXPORT_BATCH_SIZE
+    exports.EXPORT_BATCH_SIZE = 2
+    try:
+        cursor = _Cursor(_documents(5))
+        chunks = _collect(cursor, "csv")
+    finally:
+        exports.EXPORT_BATCH_SIZE = original
+
+    assert [read for _, read in chunks] == [2, 4, 5]
+    rows = list(csv.reader(io.StringIO("".join(chunk for chunk, _ in chunks).lstrip("\ufeff"))))
+    assert rows[0] == list(COLUMNS)
+    assert len(rows) == 6
+    assert rows[1][1] == "José, \"Pepe\"" and rows[1][3] == "2025-10-01T00:00:00" and rows[1][4] == ""
+
+
+def test_ndjson_one_object_per_line():
+    """NDJSON: un objeto JSON por línea con ObjectId y fechas como texto"""
+    documents = _documents(3)
+    chunks = _collect(_Cursor(documents), "ndjson")
+
+    lines = "".join(chunk for chunk, _ in chunks).splitlines()
+    assert len(lines) == 3
+    row = json.loads(lines[0])
+    assert row["id"] == str(documents[0]["_id"]) and row["notes"] is None
+
+
+def test_csv_neutralizes_formulas():
+    """Los textos que Excel tomaría como fórmula se anteponen con ' solo en CSV"""
+    documents = [
+        {"_id": ObjectId(), "user_name": "=HYPERLINK(\"http://x\")", "amount": -500.0, "created_at": None, "notes": "@SUM(A1)"},
+        {"_id": ObjectId(), "user_name": "+56 9 1234", "amount": 0, "created_at": None, "notes": "-cmd"},
+    ]
+    chunks = _collect(_Cursor(documents), "csv")
+    rows = list(csv.reader(io.StringIO("".join(chunk for chunk, _ in chunks).lstrip("\ufeff"))))
+    assert rows[1][1] == "'=HYPERLINK(\"http://x\")" and rows[1][4] == "'@SUM(A1)"
+    assert rows[2][1] == "'+56 9 1234" and rows[2][4] == "'-cmd"
+    # Los montos no son texto y se exportan tal cual
+    assert rows[1][2] == "-500.0"
+
+    lines = "".join(chunk for chunk, _ in _collect(_Cursor(documents), "ndjson")).splitlines()
+    assert json.loads(lines[0])["user_name"] == "=HYPERLINK(\"http://x\")"
+
+
+def test_empty_export_only_header():
+    """Sin filas el CSV solo trae el encabezado y el NDJSON queda vacío"""
+    assert len(_collect(_Cursor([]), "csv")) == 1
+    assert _collect(_Cursor([]), "ndjson") == []
+
+
+def test_validate_export_format():
+    """Solo csv y ndjson"""
+    assert validate_export_format("ndjson") == "ndjson"
+    try:
+        validate_export_format("xlsx")
+        assert False, "Debió rechazar el formato"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    print("🧪 Probando exportaciones...")
+    test_csv_streams_in_batches()
+    test_ndjson_one_object_per_line()
+    test_csv_neutralizes_formulas()
+    test_empty_export_only_header()
+    test_validate_export_format()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Pruebas del cliente HTTP compartido de Google usando un transporte simulado
+"""
+import asyncio
+import sys
+import os
+
+import httpx
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from google_http_client import GoogleHTTPClient, google_http_client
+from auth import get_google_user_info
+
+
+def _client_with(handler) -> GoogleHTTPClient:
+    """Crear un cliente con transporte simulado y sin espera entre reintentos"""
+    client = GoogleHTTPClient()
+    client.backoff_seconds = 0
+    client.configure(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_retries_transient_errors_on_get():
+    """Un GET se reintenta ante 503 y errores de red"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("conexión rechazada", request=request)
+        if len(calls) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"ok": True})
+
+    async def run():
+        client = _client_with(handler)
+        response = await client.get("https://www.googleapis.com/oauth2/v2/userinfo")
+        await client.close()
+        return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_post_is_not_retried():
+    """El intercambio de código (POST) no se reintenta una vez enviado"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    async def run():
+        client = _client_with(handler)
+        response = await client.post("https://oauth2.googleapis.com/token", data={"code": "x"})
+        await client.close()
+        return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert len(calls) == 1
+
+
+def test_client_is_reused_between_calls():
+    """Todas las llamadas comparten la misma instancia de AsyncClient"""
+    def handler(request):
+        return httpx.Response(200, json={})
+
+    async def run():
+        client = _client_with(handler)
+        await client.start()
+        first = client.get_client()
+        await client.get("https://www.googleapis.com/a")
+        await client.get("https://www.googleapis.com/b")
+        second = client.get_client()
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+
+
+def test_get_google_user_info_uses_shared_client():
+    """get_google_user_info usa el cliente global inyectable"""
+    def handler(request):
+        assert request.url.params["access_token"] == "token-de-prueba"
+        return httpx.Response(200, json={"id": "123", "email": "a@b.cl", "name": "Ana"})
+
+    async def run():
+        google_http_client.configure(transport=httpx.MockTransport(handler))
+        try:
+            return await get_google_user_info("token-de-prueba")
+        finally:
+            await google_http_client.close()
+            google_http_client.configure(transport=None)
+
+    info = asyncio.run(run())
+    assert info["email"] == "a@b.cl"
+
+
+if __name__ == "__main__":
+    print("🧪 Probando cliente HTTP compartido de Google...")
+    test_retries_transient_errors_on_get()
+    test_post_is_not_retried()
+    test_client_is_reused_between_calls()
+    test_get_google_user_info_uses_shared_client()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la verificación local de ID tokens de Google con JWKS en caché
+"""
+import asyncio
+import base64
+import sys
+import os
+import time
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwt
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from google_http_client import google_http_client
+from google_id_token import google_jwks_cache, verify_google_id_token, google_user_info_from_claims, parse_max_age
+
+CLIENT_ID = "client-id-de-prueba.apps.googleusercontent.com"
+
+_private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PRIVATE_PEM = _private_key.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption()
+).decode()
+
+
+def _b64(number: int) -> str:
+    raw = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+_public_numbers = _private_key.public_key().public_numbers()
+JWKS = {"keys": [{
+    "kty": "RSA", "alg": "RS256", "use": "sig", "kid": "kid-1",
+    "n": _b64(_public_numbers.n), "e": _b64(_public_numbers.e)
+}]}
+
+
+def _make_token(**overrides) -> str:
+    claims = {
+        "iss": "https://accounts.google.com",
+        "aud": CLIENT_ID,
+        "sub": "google-123",
+        "email": "jugador@pasesfalsos.cl",
+        "email_verified": True,
+        "name": "Jugador",
+        "nonce": "nonce-1",
+        "iat": int(time.time()),
+        "exp": int(time.time()) + 600
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, PRIVATE_PEM, algorithm="RS256", headers={"kid": "kid-1"})
+
+
+def _verify(token: str, nonce: str = "nonce-1", fetches: list = None):
+    def handler(request):
+        if fetches is not None:
+            fetches.append(request)
+        return httpx.Response(200, json=JWKS, headers={"Cache-Control": "public, max-age=3600"})
+
+    async def run():
+        google_http_client.configure(transport=httpx.MockTransport(handler))
+        try:
+            return await verify_google_id_token(token, CLIENT_ID, nonce=nonce)
+        finally:
+            await google_http_client.close()
+            google_http_client.configure(transport=None)
+
+    return asyncio.run(run())
+
+
+def _reset_cache():
+    google_jwks_cache.keys = {}
+    google_jwks_cache.expires_at = 0.0
+    google_jwks_cache.fetched_at = float("-inf")
+
+
+def test_valid_token_and_cached_keys():
+    """Un token válido se verifica y las claves se descargan una sola vez"""
+    _reset_cache()
+    fetches = []
+    claims = _verify(_make_token(), fetches=fetches)
+    _verify(_make_token(), fetches=fetches)
+    assert claims["sub"] == "google-123"
+    assert len(fetches) == 1
+    info = google_user_info_from_claims(claims)
+    assert info["id"] == "google-123" and info["verified_email"] is True
+
+
+def test_rejects_wrong_audience_and_nonce():
+    """Se rechazan tokens con aud, iss o nonce incorrectos y tokens expirados"""
+    _reset_cache()
+    for token, nonce in [
+        (_make_token(aud="otro-cliente"), "nonce-1"),
+        (_make_token(iss="https://evil.example.com"), "nonce-1"),
+        (_make_token(exp=int(time.time()) - 10), "nonce-1"),
+        (_make_token(), "otro-nonce"),
+        # Un state sin nonce o un token sin nonce no desactivan la verificación
+        (_make_token(), None),
+        (_make_token(), ""),
+        (_make_token(nonce=None), "nonce-1"),
+    ]:
+        try:
+            _verify(token, nonce=nonce)
+        except HTTPException as e:
+            assert e.status_code == 401
+        else:
+            raise AssertionError("El token debió ser rechazado")
+
+
+def test_unknown_kid_refresh_is_rate_limited():
+    """Tokens con kid desconocido fuerzan como máximo una descarga por intervalo"""
+    _reset_cache()
+    fetches = []
+    _verify(_make_token(), fetches=fetches)
+    bogus = jwt.encode({"sub": "x"}, PRIVATE_PEM, algorithm="RS256", headers={"kid": "kid-inventado"})
+    for _ in range(3):
+        try:
+            _verify(bogus, fetches=fetches)
+        except HTTPException as e:
+            assert e.status_code == 401
+    assert len(fetches) == 1
+
+    # Pasado el intervalo un kid desconocido vuelve a consultar a Google (rotación de claves)
+    google_jwks_cache.fetched_at -= google_jwks_cache.min_forced_refresh_seconds
+    try:
+        _verify(bogus, fetches=fetches)
+    except HTTPException:
+        pass
+    assert len(fetches) == 2
+
+
+def test_parse_max_age():
+    """Cache-Control y Age determinan la vigencia del caché"""
+    assert parse_max_age("public, max-age=19845, must-revalidate", "45") == 19800
+    assert parse_max_age("no-store") == 0
+    assert parse_max_age(None) > 0
+
+
+if __name__ == "__main__":
+    print("🧪 Probando verificación local de ID tokens...")
+    test_valid_token_and_cached_keys()
+    test_rejects_wrong_audience_and_nonce()
+    test_unknown_kid_refresh_is_rate_limited()
+    test_parse_max_age()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Pruebas del ledger por período (deudas cruzadas con pagos verificados)
+"""
+import asyncio
+import sys
+import os
+from datetime import datetime
+
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ledger_service import LedgerService, ledger_pipeline
+
+USER_ID = ObjectId()
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        return self
+
+    def limit(self, count):
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class _Result:
+    def __init__(self, modified=0):
+        self.modified_count = modified
+
+
+class _Collection:
+    def __init__(self, documents=None):
+        self.documents = documents or []
+        self.calls = []
+
+    def aggregate(self, pipeline):
+        self.calls.append(("aggregate", pipeline))
+        return _Cursor([])
+
+    def find(self, query, projection=None):
+        self.calls.append(("find", query))
+        return _Cursor(list(self.documents))
+
+    async def update_many(self, query, update):
+        self.calls.append(("update_many", query, update))
+        return _Result()
+
+
+class _Database(dict):
+    def __missing__(self, name):
+        self[name] = _Collection()
+        return self[name]
+
+
+def test_pipeline_unions_payments_and_merges():
+    """Una agregación: deudores de debts + pagos ($unionWith), $group por período/usuario y $merge"""
+    pipeline = ledger_pipeline(["202510"], [str(USER_ID)], datetime(2025, 10, 1))
+    stages = [next(iter(stage)) for stage in pipeline]
+
+    assert stages == ["$match", "$unwind", "$match", "$project", "$unionWith", "$group", "$project", "$match", "$merge"]
+    assert pipeline[0] == {"$match": {"period": {"$in": ["202510"]}}}
+    assert pipeline[2] == {"$match": {"debtors.user_id": {"$in": [str(USER_ID)]}}}
+    payment_match = pipeline[4]["$unionWith"]["pipeline"][0]["$match"]
+    assert payment_match["user_id"] == {"$in": [USER_ID]}
+    assert payment_match["status"] == {"$in": ["verified", "pending"]}
+    assert pipeline[6]["$project"]["balance"] == {"$subtract": ["$owed", "$paid"]}
+    # Solo filas con deuda o pagos; una fila escrita por un recálculo posterior no se reemplaza
+    assert pipeline[7] == {"$match": {"$or": [{"owed": {"$gt": 0}}, {"payments": {"$gt": 0}}]}}
+    merge = pipeline[-1]["$merge"]
+    assert merge["into"] == "ledger"
+    assert merge["whenMatched"][0]["$replaceWith"]["$cond"][0] == {"$gte": ["$$new.refreshed_at", "$refreshed_at"]}
+
+
+def test_payment_changes_refresh_affected_rows_per_period():
+    """Los cambios de pagos recalculan solo los usuarios afectados, una agregación por período"""
+    database = _Database()
+    other_id = ObjectId()
+    before = {"user_id": USER_ID, "period": "202510", "status": "pending", "amount": 1000.0}
+    changes = [
+        (before, {**before, "period": "202511"}),
+        (None, {"user_id": other_id, "period": "202510", "status": "pending", "amount": 1000.0}),
+    ]
+
+    asyncio.run(LedgerService().track_payment_changes(database, changes))
+
+    aggregations = [call[1] for call in database["debts"].calls]
+    assert len(aggregations) == 2
+    assert aggregations[0][0]["$match"]["period"] == {"$in": ["202510"]}
+    assert aggregations[0][2]["$match"]["debtors.user_id"] == {"$in": sorted([str(USER_ID), str(other_id)])}
+    assert aggregations[1][2]["$match"]["debtors.user_id"] == {"$in": [str(USER_ID)]}
+    # Filas obsoletas (sin deuda ni pagos) se marcan eliminadas solo dentro del alcance recalculado,
+    # y solo si las escribió un recálculo anterior
+    stale = [call for call in database["ledger"].calls if call[0] == "update_many"]
+    query, update = stale[1][1], stale[1][2]
+    assert query["period"] == "202511" and query["user_id"] == {"$in": [str(USER_ID)]}
+    assert query["refreshed_at"] == {"$lt": update["$set"]["refreshed_at"]}
+    assert update["$set"]["deleted"] is True
+
+
+def test_period_totals():
+    """El ledger de un período suma adeudado, pagado, pendiente y balance"""
+    database = _Database()
+    database["ledger"] = _Collection([
+        {"period": "202510", "user_id": "a", "owed": 15000.0, "paid": 15000.0, "pending": 0, "balance": 0.0, "payments": 1},
+        {"period": "202510", "user_id": "b", "owed": 15000.0, "paid": 0, "pending": 15000.0, "balance": 15000.0, "payments": 1},
+    ])
+
+    ledger = asyncio.run(LedgerService().get_period(database, "202510"))
+
+    assert ledger["totals"] == {"owed": 30000.0, "paid": 15000.0, "pending": 15000.0, "balance": 15000.0}
+    assert database["debts"].calls == []
+
+
+if __name__ == "__main__":
+    print("🧪 Probando ledger...")
+    test_pipeline_unions_payments_and_merges()
+    test_payment_changes_refresh_affected_rows_per_period()
+    test_period_totals()
+    print("✅ Pruebas completadas!")
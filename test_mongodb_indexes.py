@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los índices únicos parciales de usuarios
+"""
+import asyncio
+import sys
+import os
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mongodb_indexes import INDEX_OPTIONS_CONFLICT, create_indexes, users_unique_indexes, verify_unique_indexes
+
+
+def _matches_type_filter(document: dict, partial_filter: dict) -> bool:
+    """Evaluar un partialFilterExpression de la forma {campo: {"$type": "string"}}"""
+    return all(isinstance(document.get(field), str) for field in partial_filter)
+
+
+class _UsersCollection:
+    """
+    Colección users en memoria que construye índices únicos como MongoDB
+
+    mongomock ignora partialFilterExpression, por eso la unicidad se evalúa aquí
+    solo sobre los documentos que cumplen el filtro parcial.
+    """
+    def __init__(self, documents, existing=None):
+        self.documents = documents
+        self.indexes = dict(existing or {})
+
+    async def create_indexes(self, indexes):
+        for index in indexes:
+            document = index.document
+            current = self.indexes.get(document["name"])
+            if current is not None and current != document:
+                raise OperationFailure("Index already exists with different options", code=INDEX_OPTIONS_CONFLICT)
+            field = next(iter(document["key"]))
+            partial_filter = document.get("partialFilterExpression")
+            values = [
+                user.get(field) for user in self.documents
+                if partial_filter is None or _matches_type_filter(user, partial_filter)
+            ]
+            if document.get("unique") and len(values) != len(set(values)):
+                raise DuplicateKeyError(f"E11000 duplicate key error index: {document['name']}")
+            self.indexes[document["name"]] = document
+
+    async def drop_index(self, name):
+        self.indexes.pop(name)
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+
+class _Database:
+    def __init__(self, users):
+        self.users = users
+
+    def __getitem__(self, name):
+        return self.users
+
+
+USERS = [
+    {"email": "ana@synco.cl", "google_id": "g-1"},
+    # Usuarios creados por un admin: todavía sin cuenta de Google vinculada
+    {"email": "beto@synco.cl"},
+    {"email": "carla@synco.cl", "google_id": None},
+    {"email": "dani@synco.cl", "google_id": ""},
+]
+
+
+def test_unique_indexes_build_with_users_without_google_id():
+    """Los usuarios sin google_id no chocan entre sí y el chequeo de arranque lo confirma"""
+    users = _UsersCollection(USERS)
+    database = _Database(users)
+
+    asyncio.run(create_indexes(database, "users", users_unique_indexes()))
+
+    assert asyncio.run(verify_unique_indexes(database)) is True
+    assert users.indexes["users_google_id_unique"]["partialFilterExpression"] == {"google_id": {"$type": "string"}}
+    assert users.indexes["users_email_unique"]["partialFilterExpression"] == {"email": {"$type": "string"}}
+
+
+def test_existing_full_unique_index_is_rebuilt_as_partial():
+    """Un índice único creado antes sin filtro parcial se reemplaza por la versión parcial"""
+    previous = {"name": "users_google_id_unique", "key": {"google_id": 1}, "unique": True}
+    users = _UsersCollection(USERS[:1], existing={"users_google_id_unique": previous})
+    database = _Database(users)
+
+    asyncio.run(create_indexes(database, "users", users_unique_indexes()))
+
+    assert "partialFilterExpression" in users.indexes["users_google_id_unique"]
+    assert asyncio.run(verify_unique_indexes(database)) is True
+
+
+def test_startup_check_reports_missing_unique_index():
+    """Si hay emails duplicados el índice no se crea y el chequeo de arranque lo informa"""
+    users = _UsersCollection(USERS + [{"email": "ana@synco.cl", "google_id": "g-2"}])
+    database = _Database(users)
+
+    asyncio.run(create_indexes(database, "users", users_unique_indexes()))
+
+    assert "users_google_id_unique" in users.indexes
+    assert asyncio.run(verify_unique_indexes(database)) is False
+
+
+if __name__ == "__main__":
+    print("🧪 Probando índices únicos de usuarios...")
+    test_unique_indexes_build_with_users_without_google_id()
+    test_existing_full_unique_index_is_rebuilt_as_partial()
+    test_startup_check_reports_missing_unique_index()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los cursores de paginación y del caché de totales
+"""
+import asyncio
+import sys
+import os
+from datetime import datetime
+
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pagination import TotalCountCache, decode_cursor, encode_cursor, keyset_query
+
+
+class _CountingCollection:
+    """Colección mínima (sin contadores incrementales) que cuenta las llamadas de conteo"""
+    name = "items"
+
+    def __init__(self):
+        self.calls = []
+
+    async def count_documents(self, query):
+        self.calls.append(("count_documents", query))
+        return 7
+
+    async def estimated_document_count(self):
+        self.calls.append(("estimated_document_count", None))
+        return 42
+
+
+def test_cursor_roundtrip():
+    """El cursor conserva el valor de orden (fecha o texto) y el _id"""
+    doc_id = ObjectId()
+    created_at = datetime(2025, 10, 3, 12, 30, 15, 123000)
+    value, last_id = decode_cursor(encode_cursor({"_id": doc_id, "created_at": created_at}, "created_at"), "created_at")
+    assert value == created_at and last_id == doc_id
+
+    value, _ = decode_cursor(encode_cursor({"_id": doc_id, "period": "202510"}, "period"), "period")
+    assert value == "202510"
+
+
+def test_invalid_cursor_is_rejected():
+    """Cursores alterados o de otro orden producen ValueError"""
+    cursor = encode_cursor({"_id": ObjectId(), "period": "202510"}, "period")
+    for bad, field in [("no-es-un-cursor", "period"), (cursor, "created_at")]:
+        try:
+            decode_cursor(bad, field)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("El cursor debió ser rechazado")
+
+
+def test_keyset_query_keeps_filter():
+    """La condición del cursor se combina con el filtro original"""
+    doc_id = ObjectId()
+    query = keyset_query({"status": "pending"}, "period", encode_cursor({"_id": doc_id, "period": "202510"}, "period"))
+    assert query["$and"][0] == {"status": "pending"}
+    assert query["$and"][1]["$or"][1] == {"period": "202510", "_id": {"$lt": doc_id}}
+
+
+def test_totals_are_cached():
+    """Los totales se reutilizan y sin filtro se usa estimated_document_count"""
+    collection = _CountingCollection()
+    cache = TotalCountCache(ttl_seconds=60)
+
+    async def run():
+        first = await cache.count(collection, {"status": "pending"})
+        second = await cache.count(collection, {"status": "pending"})
+        unfiltered = await cache.count(collection, {})
+        cache.invalidate("items")
+        await cache.count(collection, {"status": "pending"})
+        return first, second, unfiltered
+
+    first, second, unfiltered = asyncio.run(run())
+    assert first == second == 7 and unfiltered == 42
+    assert [name for name, _ in collection.calls] == ["count_documents", "estimated_document_count", "count_documents"]
+
+
+if __name__ == "__main__":
+    print("🧪 Probando paginación por cursor...")
+    test_cursor_roundtrip()
+    test_invalid_cursor_is_rejected()
+    test_keyset_query_keeps_filter()
+    test_totals_are_cached()
+    print("✅ Pruebas completadas!")
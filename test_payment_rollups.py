@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las estadísticas de pagos ($facet y rollups por período/usuario)
+"""
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from payment_rollups import PaymentRollupsService, rollup_key
+from payment_service import PaymentService
+
+USER_ID = ObjectId()
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class _RollupsCollection:
+    def __init__(self, rollups=None):
+        self.rollups = rollups or {}
+        self.operations = []
+        self.seeded = []
+
+    async def find_one(self, query, projection=None):
+        rollup = self.rollups.get(query["_id"])
+        return None if rollup is None or rollup.get("seeding") else rollup
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        return dict(self.rollups.setdefault(query["_id"], dict(update["$setOnInsert"])))
+
+    async def update_one(self, query, update):
+        rollup = self.rollups.get(query["_id"])
+        matched = rollup is not None and all(rollup.get(field) == value for field, value in query.items() if field != "_id")
+        if matched:
+            rollup.update(update["$set"])
+            rollup.pop("seeding", None)
+            self.seeded.append((query["_id"], update["$set"]))
+        return type("Result", (), {"matched_count": int(matched)})()
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+class _PaymentsCollection:
+    def __init__(self, facet):
+        self.facet = facet
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return _Cursor([self.facet])
+
+
+class _Database:
+    def __init__(self, rollups=None, facet=None):
+        self.payments = _PaymentsCollection(facet or {})
+        self.payment_rollups = _RollupsCollection(rollups)
+        self.counters = _RollupsCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def test_track_changes_aggregates_deltas_per_scope():
+    """Verificar un pago mueve su monto entre estados en los cuatro alcances, en un solo bulk_write"""
+    database = _Database()
+    before = {"user_id": USER_ID, "period": "202510", "status": "pending", "amount": 15000.0}
+    after = {**before, "status": "verified"}
+    created = {"user_id": USER_ID, "period": "202511", "status": "pending", "amount": 5000.0}
+
+    asyncio.run(PaymentRollupsService().track_changes(database, [(before, after), (None, created)]))
+
+    incs = {op._filter["_id"]: op._doc["$inc"] for op in database.payment_rollups.operations}
+    assert set(incs) == {
+        "all", f"user={USER_ID}", "period=202510", f"user={USER_ID},period=202510",
+        "period=202511", f"user={USER_ID},period=202511",
+    }
+    assert incs["period=202510"] == {
+        "total_payments": 0, "total_amount": 0.0,
+        "by_status.pending.count": -1, "by_status.pending.amount": -15000.0,
+        "by_status.verified.count": 1, "by_status.verified.amount": 15000.0,
+        "changes": 1,
+    }
+    assert incs["all"]["total_payments"] == 1 and incs["all"]["total_amount"] == 5000.0
+
+
+def test_statistics_read_from_rollup():
+    """Con el rollup sembrado las estadísticas son una lectura por _id, sin agregación"""
+    rollup = {"total_payments": 2, "total_amount": 30000.0, "by_status": {"verified": {"count": 2, "amount": 30000.0}}}
+    database = _Database(rollups={rollup_key(str(USER_ID), "202510"): rollup})
+
+    stats = asyncio.run(PaymentService(database).get_payment_statistics(str(USER_ID), "202510"))
+
+    assert stats == rollup
+    assert database.payments.pipelines == []
+
+
+def test_statistics_single_facet_with_breakdown():
+    """El desglose se calcula todo con un $facet"""
+    facet = {
+        "by_status": [{"_id": "pending", "count": 1, "total_amount": 5000.0}, {"_id": "verified", "count": 2, "total_amount": 30000.0}],
+        "by_period": [{"_id": "202510", "count": 3, "total_amount": 35000.0}],
+        "by_user": [{"_id": USER_ID, "user_name": "Pepe", "count": 3, "total_amount": 35000.0}],
+    }
+    database = _Database(facet=facet)
+
+    stats = asyncio.run(PaymentService(database).get_payment_statistics(period="202510", breakdown=True))
+
+    assert len(database.payments.pipelines) == 1
+    assert list(database.payments.pipelines[0][1]["$facet"]) == ["by_status", "by_period", "by_user"]
+    assert stats["total_payments"] == 3 and stats["total_amount"] == 35000.0
+    assert stats["by_period"] == {"202510": {"count": 3, "amount": 35000.0}}
+    assert stats["by_user"][0]["user_id"] == str(USER_ID)
+
+
+def test_seed_recomputes_when_payment_changes_meanwhile():
+    """Un pago que cambia durante el cálculo de la siembra no se pierde: se vuelve a calcular"""
+    facet = {"by_status": [{"_id": "verified", "count": 2, "total_amount": 30000.0}]}
+    database = _Database(facet=facet)
+    rollups = database.payment_rollups
+    payments = database.payments
+    original_aggregate = payments.aggregate
+
+    def aggregate(pipeline):
+        if len(payments.pipelines) == 0:
+            # Otro request registra un pago mientras corre la primera agregación
+            rollups.rollups["period=202510"]["changes"] += 1
+            payments.facet = {"by_status": [{"_id": "verified", "count": 3, "total_amount": 45000.0}]}
+        return original_aggregate(pipeline)
+
+    payments.aggregate = aggregate
+    stats = asyncio.run(PaymentService(database).get_payment_statistics(period="202510"))
+
+    assert len(payments.pipelines) == 2
+    assert stats["total_payments"] == 3
+    assert rollups.seeded == [("period=202510", rollups.seeded[0][1])]
+    assert rollups.rollups["period=202510"]["total_amount"] == 45000.0
+    assert "seeding" not in rollups.rollups["period=202510"]
+
+    # Ya sembrado: lectura por _id sin agregación
+    assert asyncio.run(PaymentService(database).get_payment_statistics(period="202510"))["total_payments"] == 3
+    assert len(payments.pipelines) == 2
+
+
+if __name__ == "__main__":
+    print("🧪 Probando estadísticas de pagos...")
+    test_track_changes_aggregates_deltas_per_scope()
+    test_statistics_read_from_rollup()
+    test_statistics_single_facet_with_breakdown()
+    test_seed_recomputes_when_payment_changes_meanwhile()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las utilidades de períodos (period_num y rangos from_period/to_period)
+"""
+import sys
+import os
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from period_utils import validate_period, period_to_int, period_range_query
+
+
+def test_validate_period():
+    """YYYYMM con año entre 2000 y 2100 y mes entre 01 y 12"""
+    assert validate_period("202510")
+    assert not validate_period("202513")
+    assert not validate_period("199912")
+    assert not validate_period("2025-10")
+    assert not validate_period(None)
+
+
+def test_period_to_int_keeps_chronological_order():
+    """El entero ordena igual que el calendario, también entre años"""
+    assert period_to_int("202412") < period_to_int("202501")
+    try:
+        period_to_int("202500")
+        assert False, "Debió rechazar el período"
+    except ValueError:
+        pass
+
+
+def test_period_range_query():
+    """Rangos inclusivos, abiertos en un extremo, vacíos o invertidos"""
+    assert period_range_query("202503", "202508") == {"period_num": {"$gte": 202503, "$lte": 202508}}
+    assert period_range_query(to_period="202508") == {"period_num": {"$lte": 202508}}
+    assert period_range_query() == {}
+    try:
+        period_range_query("202508", "202503")
+        assert False, "Debió rechazar el rango invertido"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    print("🧪 Probando utilidades de períodos...")
+    test_validate_period()
+    test_period_to_int_keeps_chronological_order()
+    test_period_range_query()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la consulta de deudas por jugador ($elemMatch sobre debtors.user_id)
+"""
+import asyncio
+import sys
+import os
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from debt_service import DebtService
+
+USER_ID = "652f1c2e9b1e8a0012345678"
+DEBTOR = {"user_id": USER_ID, "user_name": "José Pérez", "user_nickname": "Pepe", "amount": 15000.0}
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.sorted_by = None
+
+    def sort(self, field, direction):
+        self.sorted_by = (field, direction)
+        return self
+
+    def limit(self, count):
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class _DebtsCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.calls = []
+
+    async def find_one(self, query, projection=None):
+        self.calls.append(("find_one", query, projection))
+        return self.documents[0] if self.documents else None
+
+    def find(self, query, projection=None):
+        self.calls.append(("find", query, projection))
+        return _Cursor(self.documents)
+
+
+class _Database:
+    def __init__(self, documents):
+        self.debts = _DebtsCollection(documents)
+
+
+def test_player_debt_projects_only_the_debtor():
+    """La búsqueda del deudor se hace en el servidor con $elemMatch"""
+    database = _Database([{"period": "202510", "debtors": [DEBTOR]}])
+
+    debt = asyncio.run(DebtService(database).get_player_debt(USER_ID, "202510"))
+
+    _, query, projection = database.debts.calls[0]
+    assert query == {"period": "202510", "debtors.user_id": USER_ID}
+    assert projection["debtors"] == {"$elemMatch": {"user_id": USER_ID}}
+    assert debt.amount == 15000.0 and debt.user_nickname == "Pepe"
+
+
+def test_player_debt_not_found():
+    """Sin documento que contenga al jugador no hay deuda"""
+    database = _Database([])
+    assert asyncio.run(DebtService(database).get_player_debt(USER_ID, "202510")) is None
+
+
+def test_player_debts_across_periods_in_one_query():
+    """Todas las deudas del jugador con una sola consulta, de la más reciente a la más antigua"""
+    database = _Database([
+        {"period": "202511", "debtors": [{**DEBTOR, "amount": 20000.0}]},
+        {"period": "202510", "debtors": [DEBTOR]},
+    ])
+
+    debts = asyncio.run(DebtService(database).get_player_debts(USER_ID))
+
+    assert [(debt.period, debt.amount) for debt in debts] == [("202511", 20000.0), ("202510", 15000.0)]
+    assert len(database.debts.calls) == 1
+    _, query, projection = database.debts.calls[0]
+    assert query == {"debtors.user_id": USER_ID}
+    assert projection["debtors"] == {"$elemMatch": {"user_id": USER_ID}}
+
+
+if __name__ == "__main__":
+    print("🧪 Probando deudas por jugador...")
+    test_player_debt_projects_only_the_debtor()
+    test_player_debt_not_found()
+    test_player_debts_across_periods_in_one_query()
+    print("✅ Pruebas completadas!")
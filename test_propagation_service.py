@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la propagación por lotes de nombres de usuario a pagos y deudas
+"""
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from propagation_service import PropagationService
+
+USER_ID = ObjectId()
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Result:
+    def __init__(self, matched=0, modified=0):
+        self.matched_count = matched
+        self.modified_count = modified
+
+
+class _PaymentsCollection:
+    def __init__(self, payments):
+        self.payments = payments
+        self.batches = []
+
+    def find(self, query, projection=None):
+        stale = [
+            {"_id": p["_id"]} for p in self.payments
+            if p["user_id"] == query["user_id"]
+            and (p["user_name"] != query["$or"][0]["user_name"]["$ne"] or p["user_nickname"] != query["$or"][1]["user_nickname"]["$ne"])
+        ]
+        return _Cursor(stale)
+
+    async def update_many(self, query, update):
+        ids = set(query["_id"]["$in"])
+        self.batches.append(len(ids))
+        for payment in self.payments:
+            if payment["_id"] in ids:
+                payment.update(update["$set"])
+        return _Result(len(ids), len(ids))
+
+
+class _DebtsCollection:
+    def __init__(self, debts):
+        self.debts = debts
+        self.array_filters = []
+
+    def find(self, query, projection=None):
+        match = query["debtors"]["$elemMatch"]
+        name, nickname = match["$or"][0]["user_name"]["$ne"], match["$or"][1]["user_nickname"]["$ne"]
+        stale = [
+            {"_id": d["_id"]} for d in self.debts
+            if any(x["user_id"] == match["user_id"] and (x["user_name"] != name or x["user_nickname"] != nickname) for x in d["debtors"])
+        ]
+        return _Cursor(stale)
+
+    async def update_many(self, query, update, array_filters=None):
+        self.array_filters.append(array_filters)
+        user_id = array_filters[0]["debtor.user_id"]
+        ids = set(query["_id"]["$in"])
+        for debt in self.debts:
+            if debt["_id"] in ids:
+                for debtor in debt["debtors"]:
+                    if debtor["user_id"] == user_id:
+                        debtor["user_name"] = update["$set"]["debtors.$[debtor].user_name"]
+                        debtor["user_nickname"] = update["$set"]["debtors.$[debtor].user_nickname"]
+        return _Result(len(ids), len(ids))
+
+
+class _JobsCollection:
+    """Trabajos: las escrituras condicionadas fallan si la versión cambió (reencolado)"""
+    def __init__(self, version):
+        self.version = version
+        self.updates = []
+
+    async def update_one(self, query, update):
+        self.updates.append(update["$set"])
+        return _Result(matched=1 if query.get("version") == self.version else 0)
+
+
+def _job(version=1):
+    return {"_id": f"user-names:{USER_ID}", "user_id": str(USER_ID), "user_name": "José Pérez",
+            "user_nickname": "Pepe", "stage": "payments", "version": version}
+
+
+class _LedgerCollection:
+    def __init__(self):
+        self.updates = []
+
+    async def update_many(self, query, update):
+        self.updates.append((query, update["$set"]))
+        return _Result(1, 1)
+
+
+def _database(payments, debts, jobs, ledger=None):
+    return {"payments": payments, "debts": debts, "propagation_jobs": jobs, "ledger": ledger or _LedgerCollection()}
+
+
+def _service() -> PropagationService:
+    service = PropagationService()
+    service.batch_size = 2
+    service.batch_pause_seconds = 0
+    return service
+
+
+def test_job_rewrites_payments_in_batches_and_debts_with_array_filters():
+    """Los pagos se actualizan por lotes y las deudas solo en el deudor del usuario"""
+    other_id = str(ObjectId())
+    payments = _PaymentsCollection([
+        {"_id": ObjectId(), "user_id": USER_ID, "user_name": "Jose", "user_nickname": ""} for _ in range(5)
+    ])
+    debts = _DebtsCollection([{"_id": ObjectId(), "debtors": [
+        {"user_id": str(USER_ID), "user_name": "Jose", "user_nickname": "", "amount": 1000},
+        {"user_id": other_id, "user_name": "Otro", "user_nickname": "", "amount": 1000},
+    ]}])
+    jobs = _JobsCollection(version=1)
+    ledger = _LedgerCollection()
+
+    done = asyncio.run(_service().run_job(_database(payments, debts, jobs, ledger), _job()))
+
+    assert done
+    assert payments.batches == [2, 2, 1]
+    assert all(p["user_name"] == "José Pérez" and p["user_nickname"] == "Pepe" for p in payments.payments)
+    assert debts.array_filters == [[{"debtor.user_id": str(USER_ID)}]]
+    assert debts.debts[0]["debtors"][1]["user_name"] == "Otro"
+    # Avance guardado por etapa y trabajo marcado como terminado
+    assert ledger.updates == [({"user_id": str(USER_ID)}, {"user_name": "José Pérez", "user_nickname": "Pepe"})]
+    assert [u["stage"] for u in jobs.updates if "stage" in u] == ["debts", "ledger", "done"]
+    assert jobs.updates[-1]["status"] == "done"
+
+
+def test_requeued_job_is_released():
+    """Si el usuario cambia otra vez de nombre el worker suelta el trabajo viejo"""
+    payments = _PaymentsCollection([
+        {"_id": ObjectId(), "user_id": USER_ID, "user_name": "Jose", "user_nickname": ""} for _ in range(5)
+    ])
+    jobs = _JobsCollection(version=2)
+
+    done = asyncio.run(_service().run_job(_database(payments, _DebtsCollection([]), jobs), _job(version=1)))
+
+    assert not done
+    assert payments.batches == [2]
+
+
+if __name__ == "__main__":
+    print("🧪 Probando propagación de nombres...")
+    test_job_rewrites_payments_in_batches_and_debts_with_array_filters()
+    test_requeued_job_is_released()
+    print("✅ Pruebas completadas!")
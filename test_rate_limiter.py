@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Pruebas del middleware de limitación de tasa con un almacén en memoria
+"""
+import asyncio
+import sys
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rate_limiter import MemoryRateLimitStore, RateLimitMiddleware, RateLimitRule
+
+
+def _client(rules, trusted_proxy_hops: int = 1) -> TestClient:
+    app = FastAPI()
+
+    @app.post("/auth/google")
+    async def google_auth():
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, rules=rules, store=MemoryRateLimitStore(), trusted_proxy_hops=trusted_proxy_hops)
+    return TestClient(app)
+
+
+def test_limits_per_ip_with_headers():
+    """Se responde 429 con Retry-After al superar el límite de la ruta"""
+    client = _client({("POST", "/auth/google"): [RateLimitRule(3, 60, "ip")]})
+    responses = [client.post("/auth/google") for _ in range(4)]
+
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert responses[0].headers["ratelimit-limit"] == "3"
+    assert responses[0].headers["ratelimit-remaining"] == "2"
+    assert int(responses[3].headers["retry-after"]) > 0
+
+    # Otra IP tiene su propio contador
+    assert client.post("/auth/google", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
+    # Las rutas sin reglas no se limitan ni llevan headers
+    health = client.get("/health")
+    assert health.status_code == 200 and "ratelimit-limit" not in health.headers
+
+
+def test_limits_per_user_session():
+    """La regla por usuario cuenta por cookie de sesión, independiente de la IP"""
+    client = _client({("POST", "/auth/google"): [RateLimitRule(2, 60, "user")]})
+    client.cookies.set("session_token", "sesion-a")
+    assert client.post("/auth/google").status_code == 200
+    assert client.post("/auth/google", headers={"X-Forwarded-For": "10.0.0.3"}).status_code == 200
+    assert client.post("/auth/google").status_code == 429
+
+    client.cookies.set("session_token", "sesion-b")
+    assert client.post("/auth/google").status_code == 200
+
+
+def test_forwarded_for_requires_trusted_proxy():
+    """Sin proxies de confianza se ignora X-Forwarded-For; con ellos cuenta el salto más externo"""
+    client = _client({("POST", "/auth/google"): [RateLimitRule(2, 60, "ip")]}, trusted_proxy_hops=0)
+    statuses = [
+        client.post("/auth/google", headers={"X-Forwarded-For": f"10.0.1.{n}"}).status_code
+        for n in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+    client = _client({("POST", "/auth/google"): [RateLimitRule(2, 60, "ip")]}, trusted_proxy_hops=1)
+    # El cliente antepone saltos falsos; el proxy agrega la IP real a la derecha
+    statuses = [
+        client.post("/auth/google", headers={"X-Forwarded-For": f"1.1.1.{n}, 10.0.2.1"}).status_code
+        for n in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+
+def test_sliding_window_and_eviction():
+    """La ventana anterior pondera el conteo y los contadores viejos se eliminan"""
+    store = MemoryRateLimitStore(eviction_interval_seconds=0)
+    rule = RateLimitRule(10, 60, "ip")
+
+    async def run():
+        for _ in range(10):
+            await store.hit("60:ip:/x:a", rule, 600.0)
+        # A mitad de la siguiente ventana cuenta la mitad de la anterior
+        allowed, estimated = await store.hit("60:ip:/x:a", rule, 690.0)
+        assert allowed and estimated == 6
+        # Dos ventanas después el contador se descarta
+        await store.hit("60:ip:/x:b", rule, 900.0)
+        return store.counters
+
+    counters = asyncio.run(run())
+    assert set(counters) == {"60:ip:/x:b"}
+
+
+if __name__ == "__main__":
+    print("🧪 Probando limitador de tasa...")
+    test_limits_per_ip_with_headers()
+    test_limits_per_user_session()
+    test_forwarded_for_requires_trusted_proxy()
+    test_sliding_window_and_eviction()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las cookies de sesión sin estado (SESSION_MODE=stateless)
+"""
+import asyncio
+import sys
+import os
+import time
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import UserModel
+from session_service import SessionService, STATELESS_TOKEN_PREFIX
+from user_directory import user_directory
+
+USER = UserModel(google_id="google-123", email="jugador@pasesfalsos.cl", name="Jugador")
+
+
+class _RunningFlusher:
+    """Simula el flusher de la app en ejecución para que la actividad quede en el buffer"""
+    def done(self):
+        return False
+
+
+def _service() -> SessionService:
+    service = SessionService()
+    service.stateless = True
+    service._flusher = _RunningFlusher()
+    return service
+
+
+def _claims(**overrides) -> dict:
+    claims = {"uid": str(USER.id), "email": USER.email, "exp": int(time.time()) + 600, "gen": 3}
+    claims.update(overrides)
+    return claims
+
+
+def test_roundtrip_and_tampering():
+    """La cookie se descifra solo si no fue alterada y no expiró"""
+    service = _service()
+    token = service.encode_stateless_token(_claims())
+    assert token.startswith(STATELESS_TOKEN_PREFIX)
+    assert service.decode_stateless_token(token)["email"] == USER.email
+
+    tampered = token[:-2] + ("A" if token[-2] != "A" else "B") + token[-1]
+    assert service.decode_stateless_token(tampered) is None
+    assert service.decode_stateless_token(service.encode_stateless_token(_claims(exp=int(time.time()) - 1))) is None
+    assert _service().decode_stateless_token("token-opaco-de-base-de-datos") is None
+
+
+def test_generation_from_cache_without_database():
+    """Con la generación en caché la sesión se resuelve sin consultar MongoDB"""
+    service = _service()
+    service._revocation_cache[str(USER.id)] = (time.monotonic(), 3)
+    user_directory.put(USER, user_directory.snapshot())
+
+    async def run():
+        valid = await service.get_session(service.encode_stateless_token(_claims()))
+        revoked = await service.get_session(service.encode_stateless_token(_claims(gen=2)))
+        return valid, revoked
+
+    valid, revoked = asyncio.run(run())
+    assert valid is not None and valid.email == USER.email
+    assert revoked is None
+    assert list(service._pending_user_touches) == [str(USER.id)]
+    user_directory.invalidate(USER.id)
+
+
+def test_revocation_cache_is_pruned():
+    """Las generaciones vencidas se descartan al cachear otras"""
+    service = _service()
+    service.revocation_cache_seconds = 30
+    service._revocation_cache["viejo"] = (time.monotonic() - 60, 1)
+    service._revocation_pruned_at = time.monotonic() - 60
+    service._remember_generation("nuevo", 2)
+    assert set(service._revocation_cache) == {"nuevo"}
+
+
+def test_touches_are_coalesced():
+    """Varias validaciones de la misma sesión generan una sola escritura pendiente"""
+    service = _service()
+    for _ in range(5):
+        service._touch(service._pending_session_touches, "token-a")
+    service._touch(service._pending_session_touches, "token-b")
+    assert set(service._pending_session_touches) == {"token-a", "token-b"}
+
+    first_seen = service._pending_session_touches["token-a"]
+    service._pending_session_touches.clear()
+    service._touch(service._pending_session_touches, "token-a")
+    assert service._pending_session_touches == {}
+
+    service.touch_interval_seconds = 0
+    service._touch(service._pending_session_touches, "token-a")
+    assert service._pending_session_touches["token-a"] >= first_seen
+
+
+def test_inline_flush_keeps_single_task():
+    """Sin flusher en segundo plano se mantiene una sola escritura inmediata en curso"""
+    service = SessionService()
+    flushes = []
+
+    async def slow_flush():
+        flushes.append(dict(service._pending_session_touches))
+        service._pending_session_touches = {}
+        await asyncio.sleep(0.01)
+        return 0
+
+    service.flush_touches = slow_flush
+
+    async def run():
+        service._touch(service._pending_session_touches, "token-a")
+        first = service._inline_flush
+        await asyncio.sleep(0)  # la escritura ya tomó token-a
+        service._touch(service._pending_session_touches, "token-b")
+        assert service._inline_flush is first
+        await first
+        service._touch(service._pending_session_touches, "token-c")
+        await service._inline_flush
+
+    asyncio.run(run())
+    assert len(flushes) == 2
+    assert "token-b" in flushes[1] and "token-c" in flushes[1]
+
+
+def test_renew_keeps_generation():
+    """Renovar una cookie sin estado extiende exp y conserva la generación"""
+    service = _service()
+    token = service.encode_stateless_token(_claims(exp=int(time.time()) + 60))
+    claims = service.decode_stateless_token(service.renew_session_token(token))
+    assert claims["gen"] == 3
+    assert claims["exp"] > time.time() + 60
+    assert service.renew_session_token("token-opaco") == "token-opaco"
+
+
+if __name__ == "__main__":
+    print("🧪 Probando cookies de sesión sin estado...")
+    test_roundtrip_and_tampering()
+    test_generation_from_cache_without_database()
+    test_revocation_cache_is_pruned()
+    test_touches_are_coalesced()
+    test_inline_flush_keeps_single_task()
+    test_renew_keeps_generation()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la selección de campos (fields=) y comparación de tamaño/tiempo para páginas de 1000 filas
+"""
+import json
+import sys
+import os
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import PaymentListResponse, PaymentResponse
+from sparse_fields import PAYMENT_FIELDS, USER_FIELDS, build_projection, parse_fields, serialize_documents
+
+
+def _payment_documents(count: int) -> list:
+    now = datetime.utcnow()
+    return [{
+        "_id": ObjectId(),
+        "user_id": ObjectId(),
+        "user_name": f"Jugador {i}",
+        "user_nickname": f"jugador{i}",
+        "amount": 15000.0,
+        "period": "202510",
+        "payment_date": now,
+        "receipt_image_url": f"https://bucket.s3.amazonaws.com/payments/{i}.jpg?X-Amz-Signature=abcdef0123456789",
+        "receipt_image_key": f"payments/{i}.jpg",
+        "status": "pending",
+        "notes": "Pago mensual de cancha y arbitraje",
+        "verified_by": None,
+        "verified_at": None,
+        "created_at": now,
+        "updated_at": now
+    } for i in range(count)]
+
+
+def _full_page(documents: list) -> bytes:
+    """Camino actual: modelos Pydantic completos + jsonable_encoder"""
+    payments = [PaymentResponse(
+        id=str(doc["_id"]),
+        user_id=str(doc["user_id"]),
+        user_name=doc["user_name"],
+        user_nickname=doc.get("user_nickname"),
+        amount=doc["amount"],
+        period=doc["period"],
+        payment_date=doc["payment_date"],
+        receipt_image_url=doc.get("receipt_image_url"),
+        status=doc["status"],
+        notes=doc.get("notes"),
+        verified_by=None,
+        verified_at=doc.get("verified_at"),
+        created_at=doc["created_at"],
+        updated_at=doc["updated_at"]
+    ) for doc in documents]
+    page = PaymentListResponse(payments=payments, total=len(payments), skip=0, limit=len(payments))
+    return json.dumps(jsonable_encoder(page)).encode()
+
+
+def _sparse_page(documents: list, fields: list) -> bytes:
+    """Camino liviano: proyección + serialización directa"""
+    projection = build_projection(fields, PAYMENT_FIELDS)
+    projected = [{key: doc[key] for key in projection if key in doc} for doc in documents]
+    page = {"payments": serialize_documents(projected, fields, PAYMENT_FIELDS), "total": len(projected), "skip": 0, "limit": len(projected)}
+    return json.dumps(page).encode()
+
+
+def test_parse_fields_and_projection():
+    """fields se valida y se traduce a la proyección de MongoDB"""
+    fields = parse_fields("id, user_name,amount", PAYMENT_FIELDS)
+    assert fields == ["id", "user_name", "amount"]
+    assert build_projection(fields, PAYMENT_FIELDS, extra=["created_at"]) == {"_id": 1, "user_name": 1, "amount": 1, "created_at": 1}
+    assert parse_fields(None, PAYMENT_FIELDS) is None
+    try:
+        parse_fields("id,receipt_image_key", PAYMENT_FIELDS)
+    except ValueError as e:
+        assert "receipt_image_key" in str(e)
+    else:
+        raise AssertionError("Los campos internos no deben poder pedirse")
+
+
+def test_serialize_converts_bson_types():
+    """ObjectId y fechas se convierten; los campos ausentes quedan en null"""
+    user_id = ObjectId()
+    created_at = datetime(2025, 10, 1, 12, 0)
+    rows = serialize_documents([{"_id": user_id, "created_at": created_at}], ["_id", "created_at", "nickname"], USER_FIELDS)
+    assert rows == [{"_id": str(user_id), "created_at": "2025-10-01T12:00:00", "nickname": None}]
+
+
+def test_sparse_page_is_smaller_for_1000_rows():
+    """Una página de 1000 pagos con 3 campos pesa y tarda menos que la respuesta completa"""
+    documents = _payment_documents(1000)
+    fields = ["id", "user_name", "amount"]
+
+    start = time.perf_counter()
+    full = _full_page(documents)
+    full_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    sparse = _sparse_page(documents, fields)
+    sparse_ms = (time.perf_counter() - start) * 1000
+
+    print(f"\n📊 1000 filas: completa {len(full) / 1024:.1f} KB en {full_ms:.1f} ms | "
+          f"fields={','.join(fields)} {len(sparse) / 1024:.1f} KB en {sparse_ms:.1f} ms")
+    assert len(sparse) * 4 < len(full)
+    assert len(json.loads(sparse)["payments"]) == 1000
+
+
+if __name__ == "__main__":
+    print("🧪 Probando selección de campos...")
+    test_parse_fields_and_projection()
+    test_serialize_converts_bson_types()
+    test_sparse_page_is_smaller_for_1000_rows()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la actualización masiva de usuarios con bulk_write
+"""
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from user_service import UserService
+
+
+class _AsyncCursor:
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.documents:
+            raise StopAsyncIteration
+        return self.documents.pop(0)
+
+
+class _UsersCollection:
+    """Colección de usuarios que registra los bulk_write y puede fallar en una operación"""
+    def __init__(self, users, failing_index=None):
+        self.users = {user["_id"]: user for user in users}
+        self.failing_index = failing_index
+        self.bulk_writes = []
+
+    def find(self, query, projection=None):
+        ids = query["_id"]["$in"]
+        return _AsyncCursor(dict(self.users[_id]) for _id in ids if _id in self.users)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append((operations, ordered))
+        if self.failing_index is not None and len(self.bulk_writes) == 1:
+            raise BulkWriteError({"writeErrors": [{"index": self.failing_index, "errmsg": "E11000 duplicate key"}]})
+        for operation in operations:
+            self.users[operation._filter["_id"]].update(operation._doc["$set"])
+
+
+def _service(collection) -> UserService:
+    service = UserService()
+
+    async def shared_collection():
+        return collection
+
+    service._get_shared_collection = shared_collection
+    return service
+
+
+def _users(count):
+    return [{"_id": ObjectId(), "name": f"Jugador {i}", "email": f"jugador{i}@pasesfalsos.cl", "nickname": ""} for i in range(count)]
+
+
+def test_bulk_update_uses_one_bulk_write():
+    """Todos los cambios van en un bulk_write; inexistentes e inválidos se informan por elemento"""
+    users = _users(3)
+    collection = _UsersCollection(users)
+    updates = [
+        (str(users[0]["_id"]), {"roles": ["player"], "is_active": True}),
+        (str(ObjectId()), {"roles": ["player"]}),
+        ("no-es-un-id", {"is_active": False}),
+        (str(users[1]["_id"]), {"nickname": "El Mago"}),
+    ]
+
+    results = asyncio.run(_service(collection).bulk_update_users(updates, ordered=False))
+
+    assert [result["status"] for result in results] == ["updated", "not_found", "invalid", "updated"]
+    operations, ordered = collection.bulk_writes[0]
+    assert len(operations) == 2 and ordered is False
+    assert users[0]["roles"] == ["player"]
+    # El cambio de nickname recalcula search_tokens en un segundo bulk_write
+    token_operations, _ = collection.bulk_writes[1]
+    assert "mago" in token_operations[0]._doc["$set"]["search_tokens"]
+
+
+def test_ordered_bulk_update_skips_after_error():
+    """En modo ordenado los elementos posteriores al error quedan como skipped"""
+    users = _users(3)
+    collection = _UsersCollection(users, failing_index=1)
+    updates = [(str(user["_id"]), {"is_active": False}) for user in users]
+
+    results = asyncio.run(_service(collection).bulk_update_users(updates, ordered=True))
+
+    assert [result["status"] for result in results] == ["updated", "error", "skipped"]
+    assert "E11000" in results[1]["error"]
+
+
+if __name__ == "__main__":
+    print("🧪 Probando actualización masiva de usuarios...")
+    test_bulk_update_uses_one_bulk_write()
+    test_ordered_bulk_update_skips_after_error()
+    print("✅ Pruebas completadas!")
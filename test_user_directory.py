@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Pruebas del directorio de usuarios en memoria y su invalidación
+"""
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import user_directory as user_directory_module
+from models import UserModel
+from user_directory import UserDirectory
+from user_service import UserService
+
+
+def _user_data(**overrides) -> dict:
+    user_data = {"_id": ObjectId(), "google_id": "google-123", "email": "jugador@pasesfalsos.cl", "name": "Jugador", "roles": ["player"]}
+    user_data.update(overrides)
+    return user_data
+
+
+class _CountingCollection:
+    """Colección de usuarios que cuenta las lecturas"""
+    def __init__(self, user_data):
+        self.user_data = user_data
+        self.reads = 0
+
+    async def find_one(self, query):
+        self.reads += 1
+        key, value = next(iter(query.items()))
+        return self.user_data if self.user_data.get(key) == value else None
+
+    async def update_one(self, query, update):
+        self.user_data.update(update["$set"])
+        return type("Result", (), {"modified_count": 1})()
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.user_data.update(update["$set"])
+        return dict(self.user_data)
+
+
+def test_reads_are_served_from_memory():
+    """Tras la primera lectura, las búsquedas por _id, email y google_id no van a MongoDB"""
+    user_data = _user_data()
+    collection = _CountingCollection(user_data)
+    service = UserService()
+    directory = UserDirectory()
+    database = {"users": collection}
+
+    async def run():
+        original = user_directory_module.user_directory
+        import user_service as user_service_module
+        user_service_module.user_directory = directory
+        try:
+            first = await service.get_user_by_id(str(user_data["_id"]), database=database)
+            by_email = await service.get_user_by_email(user_data["email"], database=database)
+            by_google_id = await service.get_user_by_google_id(user_data["google_id"], database=database)
+            assert first is by_email is by_google_id
+            assert collection.reads == 1
+
+            # Una escritura local invalida la copia en memoria
+            await service.update_user(str(user_data["_id"]), {"roles": ["admin"]}, database=database)
+            updated = await service.get_user_by_email(user_data["email"], database=database)
+            assert updated.roles == ["admin"]
+        finally:
+            user_service_module.user_directory = original
+
+    asyncio.run(run())
+
+
+def test_ttl_and_invalidation():
+    """Las entradas expiran y la invalidación también limpia email y google_id"""
+    directory = UserDirectory()
+    user = UserModel(**_user_data())
+    directory.put(user, directory.snapshot())
+    assert directory.get_by_google_id("google-123") is user
+
+    directory.invalidate(user.id)
+    assert directory.get_by_email("jugador@pasesfalsos.cl") is None
+    assert directory._aliases == {}
+
+    directory.fallback_ttl_seconds = 0
+    directory.put(user, directory.snapshot())
+    assert directory.get_by_id(str(user.id)) is None
+
+
+def test_max_entries_evicts_oldest():
+    """Se desaloja el usuario usado hace más tiempo"""
+    directory = UserDirectory()
+    directory.max_entries = 2
+    users = [UserModel(**_user_data(google_id=f"g{i}", email=f"u{i}@pasesfalsos.cl")) for i in range(3)]
+    directory.put(users[0], directory.snapshot())
+    directory.put(users[1], directory.snapshot())
+    directory.get_by_id(str(users[0].id))
+    directory.put(users[2], directory.snapshot())
+    assert directory.get_by_id(str(users[1].id)) is None
+    assert directory.get_by_email("u1@pasesfalsos.cl") is None
+    assert directory.get_by_id(str(users[0].id)) is users[0]
+
+
+def test_invalidation_during_read_discards_put():
+    """Un documento leído antes de una invalidación no se guarda (lectura concurrente con un cambio de rol)"""
+    directory = UserDirectory()
+    user = UserModel(**_user_data())
+
+    since = directory.snapshot()
+    # El change stream avisa del cambio mientras la lectura sigue en curso (sin entrada en memoria)
+    directory.invalidate(user.id)
+    directory.put(user, since)
+    assert directory.get_by_id(str(user.id)) is None
+
+    # Lo mismo tras vaciar el directorio (reconexión del change stream)
+    since = directory.snapshot()
+    directory.clear()
+    directory.put(user, since)
+    assert directory.get_by_id(str(user.id)) is None
+
+    # Una invalidación de otro usuario no descarta la lectura
+    since = directory.snapshot()
+    directory.invalidate(ObjectId())
+    directory.put(user, since)
+    assert directory.get_by_id(str(user.id)) is user
+
+
+class _FakeStream:
+    """Change stream que entrega los eventos a medida que se agregan a la lista"""
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.changes:
+            await asyncio.sleep(0.001)
+        return self.changes.pop(0)
+
+
+def _patch_connection(collection):
+    class _Config:
+        async def ensure_connected(self):
+            return {"users": collection}
+    original = user_directory_module.mongodb_config
+    user_directory_module.mongodb_config = _Config()
+    return original
+
+
+def test_change_stream_invalidates_other_workers_writes():
+    """Un evento del change stream (escritura en otro worker) invalida el usuario"""
+    directory = UserDirectory()
+    user = UserModel(**_user_data())
+    events = []
+
+    class _Collection:
+        def watch(self):
+            return _FakeStream(events)
+
+    original = _patch_connection(_Collection())
+
+    async def run():
+        directory.start_watcher()
+        await asyncio.sleep(0.01)
+        assert directory.change_stream_active
+        directory.put(user, directory.snapshot())
+        events.append({"operationType": "update", "documentKey": {"_id": user.id}})
+        await asyncio.sleep(0.01)
+        assert directory.get_by_id(str(user.id)) is None
+        await directory.stop_watcher()
+
+    try:
+        asyncio.run(run())
+    finally:
+        user_directory_module.mongodb_config = original
+
+
+def test_standalone_falls_back_to_ttl():
+    """Sin replica set el watcher termina y queda el TTL corto"""
+    directory = UserDirectory()
+
+    class _Collection:
+        def watch(self):
+            raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    original = _patch_connection(_Collection())
+
+    async def run():
+        directory.start_watcher()
+        await asyncio.sleep(0.01)
+        assert directory._watcher.done()
+        assert not directory.change_stream_active
+        assert directory.ttl_seconds == directory.fallback_ttl_seconds
+        await directory.stop_watcher()
+
+    try:
+        asyncio.run(run())
+    finally:
+        user_directory_module.mongodb_config = original
+
+
+if __name__ == "__main__":
+    print("🧪 Probando directorio de usuarios...")
+    test_reads_are_served_from_memory()
+    test_ttl_and_invalidation()
+    test_max_entries_evicts_oldest()
+    test_invalidation_during_read_discards_put()
+    test_change_stream_invalidates_other_workers_writes()
+    test_standalone_falls_back_to_ttl()
+    print("✅ Pruebas completadas!")
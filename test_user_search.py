@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los tokens de búsqueda de usuarios y del orden de resultados
+"""
+import sys
+import os
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from user_search import build_search_query, build_search_tokens, normalize_search_text, rank_search_result
+
+
+def test_tokens_are_accent_folded():
+    """Los tokens ignoran tildes y mayúsculas e incluyen el email"""
+    tokens = build_search_tokens({"name": "José Ñúñez", "nickname": "Pepe", "email": "jose.nunez@pasesfalsos.cl"})
+    assert tokens == ["jose", "jose.nunez", "nunez", "pepe"]
+    assert normalize_search_text("ÁRBITRO") == "arbitro"
+
+
+def test_query_uses_anchored_prefixes():
+    """Cada palabra se busca como prefijo anclado (usa el índice multikey)"""
+    assert build_search_query("Jós") == {"search_tokens": {"$regex": "^jos"}}
+    assert build_search_query("pe nu") == {"$and": [
+        {"search_tokens": {"$regex": "^pe"}},
+        {"search_tokens": {"$regex": "^nu"}}
+    ]}
+    assert build_search_query("  .. ") is None
+
+
+def test_ranking_prefers_exact_name_matches():
+    """Coincidencia exacta de nombre antes que prefijo, y nombre antes que email"""
+    users = [
+        {"name": "Josefina Rojas", "email": "jrojas@x.cl"},
+        {"name": "Ana Pérez", "email": "jose.ana@x.cl"},
+        {"name": "José Soto", "email": "jsoto@x.cl"},
+    ]
+    ranked = sorted(users, key=lambda user: rank_search_result(user, "jose"))
+    assert [user["name"] for user in ranked] == ["José Soto", "Josefina Rojas", "Ana Pérez"]
+
+
+if __name__ == "__main__":
+    print("🧪 Probando búsqueda de usuarios...")
+    test_tokens_are_accent_folded()
+    test_query_uses_anchored_prefixes()
+    test_ranking_prefers_exact_name_matches()
+    print("✅ Pruebas completadas!")
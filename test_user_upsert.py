@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Pruebas del upsert atómico de usuarios de Google
+"""
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+# Agregar el directorio actual al path para importar módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import GoogleUserInfo
+from user_service import UserService
+
+GOOGLE_USER = GoogleUserInfo(id="google-123", email="jugador@pasesfalsos.cl", name="Jugador", picture="https://foto")
+
+
+class _RacingCollection:
+    """Simula perder la carrera del primer login: el primer upsert choca con el índice único"""
+    def __init__(self, stored_name="Jugador"):
+        self.calls = []
+        self.token_updates = []
+        self.stored_name = stored_name
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.calls.append((query, update, upsert))
+        if len(self.calls) == 1:
+            raise DuplicateKeyError("E11000 duplicate key error collection: users index: users_google_id_unique")
+        # ReturnDocument.BEFORE: el usuario tal como lo dejó el login que ganó la carrera
+        return {"_id": ObjectId(), "google_id": query["google_id"], "email": GOOGLE_USER.email,
+                "name": self.stored_name, "nickname": "Jugo"}
+
+    async def update_one(self, query, update):
+        self.token_updates.append(update["$set"]["search_tokens"])
+
+
+def test_upsert_retries_after_duplicate_key():
+    """El login que pierde la carrera obtiene el usuario creado por el otro"""
+    collection = _RacingCollection()
+    service = UserService()
+
+    async def run():
+        return await service.get_or_create_user(GOOGLE_USER, database={"users": collection})
+
+    user = asyncio.run(run())
+    assert user.google_id == "google-123" and user.name == "Jugador"
+    assert len(collection.calls) == 2
+
+    query, update, upsert = collection.calls[0]
+    assert query == {"google_id": "google-123"} and upsert is True
+    assert update["$set"]["name"] == "Jugador" and update["$set"]["picture"] == "https://foto"
+    # Cada login actualiza updated_at, no solo el primero
+    assert "updated_at" in update["$set"] and "updated_at" not in update["$setOnInsert"]
+    assert update["$setOnInsert"]["email"] == "jugador@pasesfalsos.cl"
+    assert update["$setOnInsert"]["roles"] == []
+    # Los tokens de búsqueda se calculan para el usuario nuevo
+    assert collection.token_updates == [["jugador", "jugo"]]
+
+
+def _recording_propagation(service):
+    """Reemplazar _propagate_names por uno que registra los usuarios encolados"""
+    propagated = []
+
+    async def _propagate_names(users):
+        propagated.extend(users)
+
+    service._propagate_names = _propagate_names
+    return propagated
+
+
+def test_google_name_change_is_propagated():
+    """Si Google trae otro nombre se encola la propagación; si es el mismo, no"""
+    service = UserService()
+    propagated = _recording_propagation(service)
+
+    asyncio.run(service.get_or_create_user(GOOGLE_USER, database={"users": _RacingCollection()}))
+    assert propagated == []
+
+    asyncio.run(service.get_or_create_user(GOOGLE_USER, database={"users": _RacingCollection(stored_name="Nombre anterior")}))
+    assert [(user["name"], user["nickname"]) for user in propagated] == [("Jugador", "Jugo")]
+
+
+def test_new_google_user_is_built_without_rereading():
+    """Con BEFORE el upsert que inserta devuelve None: el usuario se arma con el _id generado"""
+    service = UserService()
+    propagated = _recording_propagation(service)
+
+    class _EmptyCollection:
+        async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+            self.update = update
+            return None
+
+        async def update_one(self, query, update):
+            pass
+
+    collection = _EmptyCollection()
+    user = asyncio.run(service.get_or_create_user(GOOGLE_USER, database={"users": collection}))
+    assert user.id == collection.update["$setOnInsert"]["_id"]
+    assert user.google_id == "google-123" and user.email == GOOGLE_USER.email and user.name == "Jugador"
+    # Un usuario nuevo no tiene copias de su nombre que actualizar
+    assert propagated == []
+
+
+class _EmailTakenCollection:
+    """El email ya pertenece a un usuario existente: todo upsert por google_id choca con users_email_unique"""
+    def __init__(self, existing_google_id=None):
+        self.existing = {"_id": ObjectId(), "email": GOOGLE_USER.email, "name": "Creado por admin", "google_id": existing_google_id}
+        self.calls = []
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.calls.append((query, update, upsert))
+        if upsert:
+            raise DuplicateKeyError("E11000 duplicate key error collection: users index: users_email_unique")
+        if query["email"] == self.existing["email"] and self.existing["google_id"] in query["google_id"]["$in"]:
+            previous = dict(self.existing)
+            self.existing.update(update["$set"])
+            return previous
+        return None
+
+    async def update_one(self, query, update):
+        pass
+
+
+def test_email_conflict_links_or_rejects():
+    """Un email existente sin google_id se vincula; si tiene otra cuenta de Google se responde 409"""
+    service = UserService()
+    propagated = _recording_propagation(service)
+
+    collection = _EmailTakenCollection()
+    user = asyncio.run(service.get_or_create_user(GOOGLE_USER, database={"users": collection}))
+    assert user.google_id == "google-123" and user.id == collection.existing["_id"]
+    assert [upsert for _, _, upsert in collection.calls] == [True, True, False]
+    # El nombre puesto por el admin cambia al de Google: se propaga a pagos y deudas
+    assert [user["name"] for user in propagated] == ["Jugador"]
+
+    collection = _EmailTakenCollection(existing_google_id="google-otro")
+    try:
+        asyncio.run(service.get_or_create_user(GOOGLE_USER, database={"users": collection}))
+    except HTTPException as e:
+        assert e.status_code == 409
+    else:
+        raise AssertionError("El login debió ser rechazado con 409")
+
+    # Un email no verificado por Google nunca se vincula a una cuenta existente
+    unverified = GOOGLE_USER.model_copy(update={"verified_email": False})
+    try:
+        asyncio.run(service.get_or_create_user(unverified, database={"users": _EmailTakenCollection()}))
+    except HTTPException as e:
+        assert e.status_code == 409
+    else:
+        raise AssertionError("El login debió ser rechazado con 409")
+
+
+if __name__ == "__main__":
+    print("🧪 Probando upsert de usuarios...")
+    test_upsert_retries_after_duplicate_key()
+    test_google_name_change_is_propagated()
+    test_new_google_user_is_built_without_rereading()
+    test_email_conflict_links_or_rejects()
+    print("✅ Pruebas completadas!")
@@ -0,0 +1,200 @@
+"""
+Directorio de usuarios en memoria
+
+Los usuarios se leen en cada request (auth, permisos, creación de pagos) y casi nunca cambian.
+UserDirectory guarda los UserModel por _id, email y google_id para responder esas lecturas sin
+ir a MongoDB. Cada worker invalida su copia:
+- Con un change stream sobre users (replica set / Atlas): cualquier escritura, venga del worker
+  que venga, invalida el usuario en todos los procesos casi de inmediato.
+- Sin change streams (servidor standalone): las entradas expiran tras un TTL corto.
+Las escrituras hechas a través de UserService invalidan además la copia local en el acto.
+
+Una lectura de MongoDB solo se guarda si el usuario no se invalidó mientras tanto: quien lee
+toma snapshot() antes del find_one y lo pasa a put(), que descarta el documento si hubo una
+invalidación posterior (si no, una lectura lenta podría volver a cachear un usuario con un rol
+revocado durante todo el TTL).
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from pymongo.errors import OperationFailure
+
+from models import UserModel
+from mongodb_config import mongodb_config
+
+logger = logging.getLogger(__name__)
+
+# Claves alternativas por las que se puede buscar un usuario
+ALIAS_FIELDS = ("email", "google_id")
+
+
+class UserDirectory:
+    def __init__(self):
+        self.collection_name = "users"
+        # TTL sin change stream (consistencia entre workers) y con change stream (solo como red de seguridad)
+        self.fallback_ttl_seconds = float(os.getenv("USER_DIRECTORY_TTL_SECONDS", "30"))
+        self.stream_ttl_seconds = float(os.getenv("USER_DIRECTORY_STREAM_TTL_SECONDS", "600"))
+        self.max_entries = int(os.getenv("USER_DIRECTORY_MAX_ENTRIES", "5000"))
+        self.enabled = os.getenv("USER_DIRECTORY_ENABLED", "true").lower() != "false"
+        # _id -> (expira_en monotonic, UserModel), en orden de uso para desalojar el más antiguo
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # "email:..." / "google_id:..." -> _id
+        self._aliases: Dict[str, str] = {}
+        # Versión que avanza con cada invalidación; _id -> versión de su última invalidación
+        self._version = 0
+        self._invalidated: Dict[str, int] = {}
+        # Versión del último clear() (invalida todo lo leído antes)
+        self._cleared_version = 0
+        self._watcher: Optional[asyncio.Task] = None
+        self.change_stream_active = False
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self.stream_ttl_seconds if self.change_stream_active else self.fallback_ttl_seconds
+
+    def _lookup(self, user_id: Optional[str]) -> Optional[UserModel]:
+        if not self.enabled or user_id is None:
+            return None
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            self._remove(user_id)
+            return None
+        self._entries.move_to_end(user_id)
+        return user
+
+    def get_by_id(self, user_id: str) -> Optional[UserModel]:
+        """Usuario en memoria por _id (None si no está o expiró)"""
+        return self._lookup(str(user_id))
+
+    def get_by_email(self, email: str) -> Optional[UserModel]:
+        """Usuario en memoria por email"""
+        return self._lookup(self._aliases.get(f"email:{email}"))
+
+    def get_by_google_id(self, google_id: str) -> Optional[UserModel]:
+        """Usuario en memoria por Google ID"""
+        return self._lookup(self._aliases.get(f"google_id:{google_id}"))
+
+    def snapshot(self) -> int:
+        """Versión actual de invalidaciones; se toma antes de leer un usuario de MongoDB"""
+        return self._version
+
+    def put(self, user: Optional[UserModel], since: int):
+        """
+        Guardar un usuario leído de MongoDB (los usuarios no encontrados no se guardan)
+
+        Args:
+            user: Usuario leído
+            since: snapshot() tomado antes de la lectura; si el usuario se invalidó después,
+                el documento puede estar obsoleto y no se guarda
+        """
+        if not self.enabled or user is None or user.id is None:
+            return
+        user_id = str(user.id)
+        if since < self._cleared_version or self._invalidated.get(user_id, -1) > since:
+            return
+        self._remove(user_id)
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, user)
+        for field in ALIAS_FIELDS:
+            value = getattr(user, field, None)
+            if value:
+                self._aliases[f"{field}:{value}"] = user_id
+        while len(self._entries) > self.max_entries:
+            oldest_id, _ = next(iter(self._entries.items()))
+            self._remove(oldest_id)
+
+    def invalidate(self, user_id):
+        """Eliminar un usuario (y sus claves alternativas) de la memoria y descartar lecturas en curso"""
+        user_id = str(user_id)
+        self._version += 1
+        self._invalidated[user_id] = self._version
+        if len(self._invalidated) > self.max_entries:
+            # Acotar las marcas: olvidarlas equivale a invalidar todas las lecturas en curso
+            self._invalidated.clear()
+            self._cleared_version = self._version
+        self._remove(user_id)
+
+    def _remove(self, user_id: str):
+        """Quitar la entrada de un usuario y sus claves alternativas"""
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        _, user = entry
+        for field in ALIAS_FIELDS:
+            value = getattr(user, field, None)
+            if value and self._aliases.get(f"{field}:{value}") == str(user_id):
+                del self._aliases[f"{field}:{value}"]
+
+    def invalidate_many(self, user_ids):
+        """Invalidar varios usuarios en una pasada (ej: actualización masiva)"""
+        for user_id in user_ids:
+            self.invalidate(user_id)
+
+    def clear(self):
+        """Vaciar el directorio (ej: al reconectar el change stream, por eventos perdidos)"""
+        self._entries.clear()
+        self._aliases.clear()
+        self._invalidated.clear()
+        self._version += 1
+        self._cleared_version = self._version
+
+    async def _watch(self):
+        """Seguir el change stream de users e invalidar cada documento modificado"""
+        retry_seconds = 1
+        while True:
+            try:
+                database = await mongodb_config.ensure_connected()
+                async with database[self.collection_name].watch() as stream:
+                    # Lo leído antes de abrir el stream pudo cambiar sin que lo viéramos
+                    self.clear()
+                    self.change_stream_active = True
+                    retry_seconds = 1
+                    logger.info("Directorio de usuarios: invalidación por change stream activa")
+                    async for change in stream:
+                        document_key = change.get("documentKey") or {}
+                        if "_id" in document_key:
+                            self.invalidate(document_key["_id"])
+                        elif change.get("operationType") in ("drop", "rename", "dropDatabase", "invalidate"):
+                            self.clear()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # Standalone sin replica set: los change streams no existen, queda solo el TTL
+                self.change_stream_active = False
+                self.clear()
+                logger.warning(f"Directorio de usuarios sin change stream, se usa TTL de {self.fallback_ttl_seconds}s: {e}")
+                return
+            except Exception as e:
+                self.change_stream_active = False
+                self.clear()
+                logger.error(f"Error en el change stream de usuarios, reintentando en {retry_seconds}s: {e}")
+            self.change_stream_active = False
+            await asyncio.sleep(retry_seconds)
+            retry_seconds = min(retry_seconds * 2, 60)
+
+    def start_watcher(self):
+        """Iniciar la invalidación por change stream en segundo plano"""
+        if not self.enabled:
+            return
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.ensure_future(self._watch())
+
+    async def stop_watcher(self):
+        """Detener el change stream"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        self.change_stream_active = False
+
+# Instancia global del directorio
+user_directory = UserDirectory()
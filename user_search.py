@@ -0,0 +1,74 @@
+"""
+Búsqueda de usuarios por nombre, nickname y email
+
+Cada usuario guarda search_tokens: palabras normalizadas (sin tildes, en minúsculas) de su
+nombre, nickname y email. Con un índice multikey sobre ese arreglo, las búsquedas por prefijo
+con regex anclada (^texto) recorren solo un rango del índice en vez de toda la colección.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+_WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_search_text(text: Optional[str]) -> str:
+    """Quitar tildes y pasar a minúsculas (ej: "José Ñúñez" -> "jose nunez")"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return [word for word in _WORD_SPLIT.split(normalize_search_text(text)) if word]
+
+
+def build_search_tokens(user_data: Dict[str, Any]) -> List[str]:
+    """
+    Tokens de búsqueda de un usuario
+
+    Args:
+        user_data: Documento de usuario (name, nickname, email)
+
+    Returns:
+        Lista ordenada y sin duplicados de palabras normalizadas
+    """
+    tokens = set(_words(user_data.get("name")))
+    tokens.update(_words(user_data.get("nickname")))
+    email = normalize_search_text(user_data.get("email"))
+    if email:
+        local_part = email.split("@")[0]
+        tokens.add(local_part)
+        tokens.update(_words(local_part))
+    return sorted(tokens)
+
+
+def build_search_query(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Filtro de MongoDB para un texto de búsqueda: cada palabra debe ser prefijo de algún token
+
+    Returns:
+        Filtro, o None si el texto no tiene palabras buscables
+    """
+    words = _words(query)
+    if not words:
+        return None
+    prefixes = [{"$regex": f"^{re.escape(word)}"} for word in words]
+    if len(prefixes) == 1:
+        return {"search_tokens": prefixes[0]}
+    return {"$and": [{"search_tokens": prefix} for prefix in prefixes]}
+
+
+def rank_search_result(user_data: Dict[str, Any], query: str) -> tuple:
+    """
+    Clave de orden para un resultado (menor es mejor)
+
+    Prioriza coincidencia exacta de palabra sobre prefijo, y nombre/nickname sobre email.
+    """
+    words = _words(query)
+    name_words = _words(user_data.get("name")) + _words(user_data.get("nickname"))
+    exact = sum(1 for word in words if word in name_words)
+    prefix = sum(1 for word in words if any(token.startswith(word) for token in name_words))
+    full_name = normalize_search_text(user_data.get("nickname") or user_data.get("name"))
+    return (-exact, -prefix, not full_name.startswith(words[0]) if words else True, full_name)
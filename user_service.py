@@ -1,10 +1,26 @@
 """
 Servicio para manejar usuarios en MongoDB
 """
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Union
 from datetime import datetime
+from fastapi import HTTPException, status
 from models import UserModel, GoogleUserInfo
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from database_services import get_mongodb_connection
+from mongodb_config import mongodb_config
+from pagination import fetch_page
+from sparse_fields import USER_FIELDS, build_projection, serialize_documents
+from user_search import build_search_query, build_search_tokens, rank_search_result
+from user_directory import user_directory
+from propagation_service import propagation_service
+from data_access import set_and_return, update_and_return
+
+# Máximo de candidatos que se leen para ordenar los resultados de búsqueda
+SEARCH_CANDIDATES_LIMIT = 200
+
+# Máximo de usuarios por actualización masiva
+BULK_USER_UPDATE_MAX_ITEMS = 500
 
 class UserService:
     def __init__(self):
@@ -20,13 +36,19 @@ class UserService:
     
     async def get_user_by_google_id(self, google_id: str, database=None) -> Optional[UserModel]:
         """Obtener usuario por Google ID"""
+        cached = user_directory.get_by_google_id(google_id)
+        if cached:
+            return cached
         if database:
             # Usar conexión externa
             collection = self._get_collection(database)
             try:
+                since = user_directory.snapshot()
                 user_data = await collection.find_one({"google_id": google_id})
                 if user_data:
-                    return UserModel(**user_data)
+                    user = UserModel(**user_data)
+                    user_directory.put(user, since)
+                    return user
                 return None
             except Exception as e:
                 print(f"Error al obtener usuario por Google ID: {e}")
@@ -37,9 +59,12 @@ class UserService:
             collection = database[self.collection_name]
             
             try:
+                since = user_directory.snapshot()
                 user_data = await collection.find_one({"google_id": google_id})
                 if user_data:
-                    return UserModel(**user_data)
+                    user = UserModel(**user_data)
+                    user_directory.put(user, since)
+                    return user
                 return None
             except Exception as e:
                 print(f"Error al obtener usuario por Google ID: {e}")
@@ -49,13 +74,19 @@ class UserService:
     
     async def get_user_by_email(self, email: str, database=None) -> Optional[UserModel]:
         """Obtener usuario por email"""
+        cached = user_directory.get_by_email(email)
+        if cached:
+            return cached
         if database:
             # Usar conexión externa
             collection = self._get_collection(database)
             try:
+                since = user_directory.snapshot()
                 user_data = await collection.find_one({"email": email})
                 if user_data:
-                    return UserModel(**user_data)
+                    user = UserModel(**user_data)
+                    user_directory.put(user, since)
+                    return user
                 return None
             except Exception as e:
                 print(f"Error al obtener usuario por email: {e}")
@@ -66,9 +97,12 @@ class UserService:
             collection = database[self.collection_name]
             
             try:
+                since = user_directory.snapshot()
                 user_data = await collection.find_one({"email": email})
                 if user_data:
-                    return UserModel(**user_data)
+                    user = UserModel(**user_data)
+                    user_directory.put(user, since)
+                    return user
                 return None
             except Exception as e:
                 print(f"Error al obtener usuario por email: {e}")
@@ -77,40 +111,12 @@ class UserService:
                 client.close()
     
     async def create_user(self, google_user_info: GoogleUserInfo) -> UserModel:
-        """Crear nuevo usuario"""
-        client, database = await get_mongodb_connection()
-        collection = database[self.collection_name]
-        
+        """Crear nuevo usuario (o retornar el existente con el mismo google_id)"""
         try:
-            # Verificar si el usuario ya existe
-            existing_user = await self.get_user_by_google_id(google_user_info.id)
-            if existing_user:
-                return existing_user
-            
-            # Crear nuevo usuario
-            user_data = {
-                "google_id": google_user_info.id,
-                "email": google_user_info.email,
-                "name": google_user_info.name,
-                "picture": google_user_info.picture,
-                "nickname": "",  # Campo vacío por defecto
-                "roles": [],  # Arreglo vacío por defecto
-                "tipo_eventos": [],  # Arreglo vacío por defecto
-                "is_active": True,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            
-            result = await collection.insert_one(user_data)
-            user_data["_id"] = result.inserted_id
-            
-            return UserModel(**user_data)
-            
+            return await self.get_or_create_user(google_user_info)
         except Exception as e:
             print(f"Error al crear usuario: {e}")
             raise e
-        finally:
-            client.close()
     
     async def update_user(self, user_id: str, update_data: dict, database=None) -> Optional[UserModel]:
         """Actualizar usuario"""
@@ -122,13 +128,13 @@ class UserService:
                 
                 update_data["updated_at"] = datetime.utcnow()
                 
-                result = await collection.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {"$set": update_data}
-                )
+                user_data = await set_and_return(collection, {"_id": ObjectId(user_id)}, update_data)
                 
-                if result.modified_count > 0:
-                    user_data = await collection.find_one({"_id": ObjectId(user_id)})
+                user_directory.invalidate(user_id)
+                if user_data:
+                    await self._sync_search_tokens(collection, user_data)
+                    if "nickname" in update_data or "name" in update_data:
+                        await self._propagate_names([user_data])
                     return UserModel(**user_data)
                 return None
                 
@@ -145,13 +151,13 @@ class UserService:
                 
                 update_data["updated_at"] = datetime.utcnow()
                 
-                result = await collection.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {"$set": update_data}
-                )
+                user_data = await set_and_return(collection, {"_id": ObjectId(user_id)}, update_data)
                 
-                if result.modified_count > 0:
-                    user_data = await collection.find_one({"_id": ObjectId(user_id)})
+                user_directory.invalidate(user_id)
+                if user_data:
+                    await self._sync_search_tokens(collection, user_data)
+                    if "nickname" in update_data or "name" in update_data:
+                        await self._propagate_names([user_data])
                     return UserModel(**user_data)
                 return None
                 
@@ -161,26 +167,217 @@ class UserService:
             finally:
                 client.close()
     
-    async def get_or_create_user(self, google_user_info: GoogleUserInfo) -> UserModel:
-        """Obtener usuario existente o crear uno nuevo"""
-        # Intentar obtener usuario existente
-        user = await self.get_user_by_google_id(google_user_info.id)
+    async def _get_shared_collection(self):
+        """Obtener colección de usuarios desde la conexión compartida de la app"""
+        database = await mongodb_config.ensure_connected()
+        return database[self.collection_name]
+    
+    async def get_or_create_user(self, google_user_info: GoogleUserInfo, database=None) -> UserModel:
+        """
+        Obtener usuario existente o crear uno nuevo en una sola operación (upsert)
         
-        if user:
-            # Actualizar información si es necesario
-            update_data = {}
-            if user.name != google_user_info.name:
-                update_data["name"] = google_user_info.name
-            if user.picture != google_user_info.picture:
-                update_data["picture"] = google_user_info.picture
-            
-            if update_data:
-                user = await self.update_user(str(user.id), update_data)
-            
-            return user
+        Los índices únicos sobre google_id y email impiden duplicados si dos primeros logins
+        llegan a la vez: el upsert que pierde la carrera recibe DuplicateKeyError y se reintenta,
+        encontrando esta vez el documento creado por el otro. Si el reintento vuelve a fallar, el
+        email ya pertenece a otro usuario (creado por un admin o sin google_id) y se le vincula
+        la cuenta de Google.
+        
+        Raises:
+            HTTPException: 409 si el email pertenece a otra cuenta de Google o no está verificado
+        """
+        collection = self._get_collection(database) if database else await self._get_shared_collection()
+        try:
+            return await self._upsert_google_user(collection, google_user_info)
+        except DuplicateKeyError:
+            pass
+        try:
+            return await self._upsert_google_user(collection, google_user_info)
+        except DuplicateKeyError:
+            return await self._link_google_id_by_email(collection, google_user_info)
+    
+    async def _link_google_id_by_email(self, collection, google_user_info: GoogleUserInfo) -> UserModel:
+        """Vincular el google_id al usuario existente con el mismo email (si no tiene otro)"""
+        previous = None
+        profile = {
+            "google_id": google_user_info.id,
+            "name": google_user_info.name,
+            "picture": google_user_info.picture,
+            "updated_at": datetime.utcnow()
+        }
+        if google_user_info.verified_email:
+            previous = await update_and_return(
+                collection,
+                {"email": google_user_info.email, "google_id": {"$in": [None, ""]}},
+                {"$set": profile},
+                return_document=ReturnDocument.BEFORE
+            )
+        if previous is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"El email {google_user_info.email} ya está asociado a otra cuenta"
+            )
+        
+        return await self._finish_google_login(collection, previous, {**previous, **profile})
+    
+    async def _upsert_google_user(self, collection, google_user_info: GoogleUserInfo) -> UserModel:
+        """Upsert por google_id: $set de los datos de perfil y $setOnInsert de los valores por defecto"""
+        from bson import ObjectId
+        
+        now = datetime.utcnow()
+        # Datos de perfil que Google puede haber cambiado
+        profile = {
+            "name": google_user_info.name,
+            "picture": google_user_info.picture,
+            "updated_at": now
+        }
+        # Valores por defecto solo para usuarios nuevos (el _id se genera aquí para no releer el insertado)
+        defaults = {
+            "_id": ObjectId(),
+            "email": google_user_info.email,
+            "nickname": "",
+            "roles": [],
+            "tipo_eventos": [],
+            "is_active": True,
+            "created_at": now
+        }
+        
+        # BEFORE para saber si el nombre cambió respecto al guardado (None si se insertó)
+        previous = await update_and_return(
+            collection,
+            {"google_id": google_user_info.id},
+            {"$set": profile, "$setOnInsert": defaults},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if previous is None:
+            user_data = {"google_id": google_user_info.id, **defaults, **profile}
         else:
-            # Crear nuevo usuario
-            return await self.create_user(google_user_info)
+            user_data = {**previous, **profile}
+        return await self._finish_google_login(collection, previous, user_data)
+    
+    async def _finish_google_login(self, collection, previous: Optional[dict], user_data: dict) -> UserModel:
+        """Invalidar la caché, actualizar search_tokens y propagar el nombre si Google lo cambió"""
+        user_directory.invalidate(user_data["_id"])
+        await self._sync_search_tokens(collection, user_data)
+        if previous is not None and previous.get("name") != user_data["name"]:
+            await self._propagate_names([user_data])
+        return UserModel(**user_data)
+    
+    async def _sync_search_tokens(self, collection, user_data: dict):
+        """Actualizar search_tokens si cambió el nombre, nickname o email (sin escritura si no cambió)"""
+        tokens = build_search_tokens(user_data)
+        if user_data.get("search_tokens") != tokens:
+            await collection.update_one({"_id": user_data["_id"]}, {"$set": {"search_tokens": tokens}})
+            user_data["search_tokens"] = tokens
+    
+    async def bulk_update_users(self, updates: List[Tuple[str, dict]], ordered: bool = True) -> List[dict]:
+        """
+        Aplicar muchos cambios de usuario en un solo bulk_write
+        
+        Args:
+            updates: Lista de (user_id, campos a actualizar)
+            ordered: Si es True se detiene en el primer error y los siguientes quedan "skipped";
+                si es False MongoDB aplica todos los que pueda. Los IDs inválidos o inexistentes
+                se informan sin detener el lote
+            
+        Returns:
+            Un resultado por elemento, en el mismo orden: {"user_id", "status", "error"}
+        """
+        from bson import ObjectId
+        
+        collection = await self._get_shared_collection()
+        results = [{"user_id": user_id, "status": "updated", "error": None} for user_id, _ in updates]
+        
+        object_ids = {}
+        for result in results:
+            try:
+                object_ids[result["user_id"]] = ObjectId(result["user_id"])
+            except Exception:
+                result["status"] = "invalid"
+                result["error"] = "ID de usuario inválido"
+        
+        # Una sola consulta para distinguir usuarios inexistentes
+        existing = set()
+        if object_ids:
+            async for user_data in collection.find({"_id": {"$in": list(object_ids.values())}}, {"_id": 1}):
+                existing.add(user_data["_id"])
+        
+        now = datetime.utcnow()
+        operations = []
+        operation_items = []  # índice de la operación -> índice del elemento
+        for index, (user_id, update_data) in enumerate(updates):
+            if results[index]["status"] != "updated":
+                continue
+            if object_ids[user_id] not in existing:
+                results[index]["status"] = "not_found"
+                results[index]["error"] = "Usuario no encontrado"
+                continue
+            operations.append(UpdateOne({"_id": object_ids[user_id]}, {"$set": {**update_data, "updated_at": now}}))
+            operation_items.append(index)
+        
+        if operations:
+            try:
+                await collection.bulk_write(operations, ordered=ordered)
+            except BulkWriteError as e:
+                failed = {error["index"]: error.get("errmsg", "Error de escritura") for error in e.details.get("writeErrors", [])}
+                for op_index, item_index in enumerate(operation_items):
+                    if op_index in failed:
+                        results[item_index]["status"] = "error"
+                        results[item_index]["error"] = failed[op_index]
+                    elif ordered and failed and op_index > min(failed):
+                        results[item_index]["status"] = "skipped"
+        
+        # Invalidar la caché de usuarios (y con ella los permisos) de una sola pasada
+        user_directory.invalidate_many(user_id for user_id, _ in updates)
+        
+        # Recalcular search_tokens de quienes cambiaron de nickname, también en un solo bulk_write
+        renamed = [
+            object_ids[user_id] for (user_id, update_data), result in zip(updates, results)
+            if result["status"] == "updated" and "nickname" in update_data
+        ]
+        if renamed:
+            token_operations = []
+            renamed_users = []
+            async for user_data in collection.find({"_id": {"$in": renamed}}, {"name": 1, "nickname": 1, "email": 1, "search_tokens": 1}):
+                renamed_users.append(user_data)
+                tokens = build_search_tokens(user_data)
+                if user_data.get("search_tokens") != tokens:
+                    token_operations.append(UpdateOne({"_id": user_data["_id"]}, {"$set": {"search_tokens": tokens}}))
+            if token_operations:
+                await collection.bulk_write(token_operations, ordered=False)
+            await self._propagate_names(renamed_users)
+        
+        return results
+    
+    async def _propagate_names(self, users: List[dict]):
+        """Encolar la actualización de las copias de nombre/nickname en pagos y deudas"""
+        try:
+            await propagation_service.enqueue_user_renames(users)
+        except Exception as e:
+            # El cambio de usuario ya se guardó; el trabajo se puede reencolar más tarde
+            print(f"Error al encolar propagación de nombres: {e}")
+    
+    async def search_users(self, query: str, limit: int = 10) -> List[UserModel]:
+        """
+        Buscar usuarios por prefijo de nombre, nickname o email
+        
+        Args:
+            query: Texto de búsqueda (sin distinguir tildes ni mayúsculas)
+            limit: Número máximo de resultados
+        
+        Returns:
+            Usuarios ordenados por relevancia
+        """
+        search_filter = build_search_query(query)
+        if search_filter is None:
+            return []
+        
+        collection = await self._get_shared_collection()
+        # Candidatos acotados desde el índice de search_tokens; se ordenan en memoria
+        candidates = await collection.find(search_filter).limit(SEARCH_CANDIDATES_LIMIT).to_list(length=SEARCH_CANDIDATES_LIMIT)
+        candidates.sort(key=lambda user_data: rank_search_result(user_data, query))
+        return [UserModel(**user_data) for user_data in candidates[:limit]]
     
     async def get_all_users(self, skip: int = 0, limit: int = 100, database=None) -> Tuple[List[UserModel], int]:
         """Obtener todos los usuarios con paginación"""
@@ -223,16 +420,56 @@ class UserService:
             finally:
                 client.close()
     
+    async def get_users_page(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        include_total: Optional[bool] = None,
+        fields: Optional[List[str]] = None
+    ) -> Tuple[List[Union[UserModel, dict]], Optional[int], Optional[str]]:
+        """
+        Obtener usuarios ordenados por fecha de creación (más recientes primero)
+        
+        Args:
+            skip: Número de usuarios a saltar (se ignora si hay cursor)
+            limit: Número máximo de usuarios
+            cursor: Cursor de la página anterior
+            include_total: Calcular el total exacto (por defecto solo sin cursor)
+            fields: Campos a devolver; con ellos se retornan dicts serializables en vez de UserModel
+        
+        Returns:
+            (usuarios, total o None, cursor de la siguiente página o None)
+        
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        collection = await self._get_shared_collection()
+        projection = build_projection(fields, USER_FIELDS, extra=["created_at"]) if fields else None
+        users, total, next_cursor = await fetch_page(
+            collection, {}, "created_at", limit,
+            skip=skip, cursor=cursor, include_total=include_total, projection=projection
+        )
+        if fields:
+            return serialize_documents(users, fields, USER_FIELDS), total, next_cursor
+        return [UserModel(**user_data) for user_data in users], total, next_cursor
+    
     async def get_user_by_id(self, user_id: str, database=None) -> Optional[UserModel]:
         """Obtener usuario por ID"""
+        cached = user_directory.get_by_id(user_id)
+        if cached:
+            return cached
         if database:
             # Usar conexión externa
             collection = self._get_collection(database)
             try:
                 from bson import ObjectId
+                since = user_directory.snapshot()
                 user_data = await collection.find_one({"_id": ObjectId(user_id)})
                 if user_data:
-                    return UserModel(**user_data)
+                    user = UserModel(**user_data)
+                    user_directory.put(user, since)
+                    return user
                 return None
             except Exception as e:
                 print(f"Error al obtener usuario por ID: {e}")
@@ -244,9 +481,12 @@ class UserService:
             
             try:
                 from bson import ObjectId
+                since = user_directory.snapshot()
                 user_data = await collection.find_one({"_id": ObjectId(user_id)})
                 if user_data:
-                    return UserModel(**user_data)
+                    user = UserModel(**user_data)
+                    user_directory.put(user, since)
+                    return user
                 return None
             except Exception as e:
                 print(f"Error al obtener usuario por ID: {e}")
@@ -267,13 +507,10 @@ class UserService:
                 "updated_at": datetime.utcnow()
             }
             
-            result = await collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": update_data}
-            )
+            user_data = await set_and_return(collection, {"_id": ObjectId(user_id)}, update_data)
             
-            if result.modified_count > 0:
-                user_data = await collection.find_one({"_id": ObjectId(user_id)})
+            user_directory.invalidate(user_id)
+            if user_data:
                 return UserModel(**user_data)
             return None
             
@@ -296,13 +533,12 @@ class UserService:
                 "updated_at": datetime.utcnow()
             }
             
-            result = await collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": update_data}
-            )
+            user_data = await set_and_return(collection, {"_id": ObjectId(user_id)}, update_data)
             
-            if result.modified_count > 0:
-                user_data = await collection.find_one({"_id": ObjectId(user_id)})
+            user_directory.invalidate(user_id)
+            if user_data:
+                await self._sync_search_tokens(collection, user_data)
+                await self._propagate_names([user_data])
                 return UserModel(**user_data)
             return None
             